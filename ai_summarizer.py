@@ -1,3 +1,7 @@
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
 from google import genai
 from google.genai import types
 import config
@@ -9,13 +13,50 @@ from tenacity import (
     retry_if_exception_type,
 )
 from google.api_core import exceptions
+from google.genai import errors as genai_errors
+from llm_cache import LLMResponseCache, make_cache_key
+from metrics import (
+    GEMINI_LATENCY,
+    GEMINI_REQUESTS,
+    GEMINI_TOKENS,
+    LLM_CACHE_LOOKUPS,
+    record_retry,
+)
+from memo_text import chunk_entries, compact_memo, split_entries
+from summary_stream import (
+    EVENT_SUMMARY,
+    EVENT_TAGS,
+    SummaryStreamParser,
+)
+from model_router import (
+    TASK_DIGEST,
+    TASK_SUMMARY,
+    TASK_SUPPLEMENT,
+    TASK_TOPIC_SUMMARY,
+    TASK_TOPICS,
+    model_router,
+)
+from gemini_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_MESSAGE,
+    estimate_tokens,
+    scheduler,
+)
 
 # APIキーの設定
 if not config.GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in .env file")
 # The client uses the GEMINI_API_KEY environment variable automatically.
+# イベントループをブロックしないよう、呼び出しはすべて client.aio 経由の非同期APIで行う
 client = genai.Client()
 
+# tenacity の @retry はコルーチン関数を検出すると AsyncRetrying を使い、
+# バックオフ待機に asyncio.sleep を用いるため、リトライ中もイベントループは止まらない
+
+# 同一入力の再呼び出しでAPIを消費しないための応答キャッシュ
+response_cache = LLMResponseCache()
+
 # 検索ツールの設定 - google_search を使用
 grounding_tool = types.Tool(google_search=types.GoogleSearch())
 grounding_tool_retrieval = types.Tool(
@@ -23,25 +64,359 @@ grounding_tool_retrieval = types.Tool(
 )
 
 
-@retry(
-    wait=wait_exponential(multiplier=1, min=4, max=10),
-    stop=stop_after_attempt(3),
-    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+def _record_usage(model: str, name: str, usage) -> None:
+    """usage_metadata のトークン数をメトリクスに加算します。"""
+    if usage is None:
+        return
+    for token_type, count in (
+        ("prompt", usage.prompt_token_count),
+        ("output", usage.candidates_token_count),
+        ("thoughts", usage.thoughts_token_count),
+        ("cached", usage.cached_content_token_count),
+    ):
+        if count:
+            GEMINI_TOKENS.inc(count, model=model, function=name, type=token_type)
+
+
+async def _cached_response(key: str | None, name: str) -> str | None:
+    if not key:
+        return None
+    cached = await response_cache.get(key, name)
+    LLM_CACHE_LOOKUPS.inc(function=name, result="miss" if cached is None else "hit")
+    if cached is not None:
+        logger.debug(f"LLM cache hit for {name} ({key[:12]})")
+    return cached
+
+
+def _adapt_config(
+    model: str, generate_config: types.GenerateContentConfig
+) -> types.GenerateContentConfig:
+    """
+    検索ツールをモデルの世代に合わせて置き換えます。
+
+    gemini-1.5 系は google_search_retrieval、2.0 以降は google_search だけを受け付けるため、
+    フォールバック先のモデルに合わせて差し替えます。
+    """
+    if not generate_config.tools:
+        return generate_config
+    legacy = model.startswith("gemini-1.")
+    tools = []
+    for tool in generate_config.tools:
+        if legacy and tool.google_search is not None:
+            tools.append(grounding_tool_retrieval)
+        elif not legacy and tool.google_search_retrieval is not None:
+            tools.append(grounding_tool)
+        else:
+            tools.append(tool)
+    return generate_config.model_copy(update={"tools": tools})
+
+
+# 次のモデルにフォールバックするエラー (レート制限、タイムアウト、サーバー側のエラー)
+_FALLBACK_ERRORS = (
+    exceptions.ResourceExhausted,
+    TimeoutError,
+    genai_errors.ServerError,
 )
-def summarize_and_tag_and_explain(
-    text: str, date_str: str
-) -> tuple[str, str, dict[str, str]]:
+
+
+def _failure_outcome(e: BaseException) -> str:
+    if isinstance(e, exceptions.ResourceExhausted):
+        return "rate_limited"
+    if isinstance(e, TimeoutError):
+        return "timeout"
+    return "error"
+
+
+def _log_generation_error(action: str, e: Exception) -> None:
+    """生成の失敗をログに残します (例外は呼び出し側で送出し直す)。"""
+    logger.error(f"[Error] Failed to {action} with Gemini: {e}")
+    if isinstance(e, exceptions.ResourceExhausted) and "quota" in str(e).lower():
+        logger.warning(
+            "API usage quota exceeded. Consider upgrading your plan or waiting before retrying."
+        )
+
+
+@dataclass
+class _CallTiming:
+    """スケジューラの枠を確保してからの経過時間 (応答時間の記録に枠待ちを含めないため)"""
+
+    started: float | None = None
+
+    def elapsed(self) -> float:
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+
+async def _generate_once(
+    name: str,
+    model: str,
+    prompt: str,
+    generate_config: types.GenerateContentConfig,
+    priority: int,
+    estimated_tokens: int,
+    timeout: float | None = None,
+    timing: _CallTiming | None = None,
+) -> str:
     """
-    与えられたテキストを要約し、タグを生成し、各タグの解説を作成します。
+    指定したモデルで1回だけ生成します (スケジューラの枠の確保とメトリクスの記録を含む)。
+
+    timeout はAPIの呼び出しだけに適用し、スケジューラでの枠待ちは含めません
+    (枠待ちは model_router.plan が見込みとして考慮する)。
+    """
+    async with scheduler.slot(model, priority, estimated_tokens) as slot:
+        if timing is not None:
+            timing.started = time.monotonic()
+        outcome = "error"
+        try:
+            with GEMINI_LATENCY.timer(model=model, function=name):
+                async with asyncio.timeout(timeout):
+                    response = await client.aio.models.generate_content(
+                        model=model,
+                        contents=prompt,
+                        config=generate_config,
+                    )
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except genai_errors.APIError as e:
+            if e.code == 429:
+                outcome = "rate_limited"
+                scheduler.penalize(model)
+                raise exceptions.ResourceExhausted(str(e)) from e
+            raise
+        finally:
+            GEMINI_REQUESTS.inc(model=model, function=name, outcome=outcome)
+        usage = response.usage_metadata
+        _record_usage(model, name, usage)
+        if usage and usage.total_token_count:
+            slot.used_tokens = usage.total_token_count
+    return response.text.strip()
+
+
+async def _generate_text(
+    name: str,
+    task: str,
+    prompt: str,
+    generate_config: types.GenerateContentConfig,
+    cache_ttl: int = 0,
+    priority: int = PRIORITY_MESSAGE,
+) -> str:
+    """
+    Geminiでテキストを生成します。cache_ttl が正の場合は応答キャッシュを利用します。
+
+    モデルは model_router がタスクの経路から選び、レート制限・タイムアウト・サーバー側の
+    エラーの場合は経路の次のモデルで生成し直します。キャッシュキーは経路の先頭のモデル名、
+    プロンプト、生成設定のハッシュで、先頭のモデルの応答だけをキャッシュします。
+    キャッシュにない場合はスケジューラでモデルごとのレート枠を優先度順に確保してから呼び出します。
+    エラー時は例外をそのまま送出し、エラー応答はキャッシュしません。
+    すべてのモデルでレート制限 (HTTP 429) を受けた場合は exceptions.ResourceExhausted を送出します。
 
     Args:
-        text: 対象のテキスト。
-        date_str: yyyy-mm-dd形式の日付文字列。
+        name: キャッシュの集計に使う関数名。
+        task: model_router のタスク名 (TASK_*)。
+        prompt: プロンプト。
+        generate_config: 生成設定。
+        cache_ttl: キャッシュの有効期間(秒)。
+        priority: スケジューラでの優先度 (PRIORITY_*)。
 
     Returns:
-        (要約文, タグの文字列, {タグ名: 解説文, ...})
+        前後の空白を取り除いた応答テキスト。
     """
-    prompt = f"""
+    primary = model_router.primary(task)
+    key = make_cache_key(primary, prompt, generate_config) if cache_ttl > 0 else None
+    cached = await _cached_response(key, name)
+    if cached is not None:
+        return cached
+
+    estimated_tokens = estimate_tokens(prompt) + config.GEMINI_OUTPUT_TOKEN_ESTIMATE
+    plan = model_router.plan(task, estimated_tokens)
+    for attempt, choice in enumerate(plan):
+        timing = _CallTiming()
+        outcome = "error"
+        try:
+            text = await _generate_once(
+                name,
+                choice.model,
+                prompt,
+                _adapt_config(choice.model, generate_config),
+                priority,
+                estimated_tokens,
+                timeout=choice.timeout,
+                timing=timing,
+            )
+            outcome = "ok"
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except _FALLBACK_ERRORS as e:
+            outcome = _failure_outcome(e)
+            if attempt == len(plan) - 1:
+                raise
+            logger.warning(
+                f"{name}: {choice.model} failed ({outcome}), "
+                f"falling back to {plan[attempt + 1].model}"
+            )
+            continue
+        finally:
+            model_router.record(
+                task,
+                name,
+                choice,
+                attempt,
+                estimated_tokens,
+                timing.elapsed(),
+                outcome,
+            )
+        break
+
+    if key and choice.model == primary:
+        await response_cache.put(key, name, text, cache_ttl)
+    return text
+
+
+async def _stream_once(
+    name: str,
+    model: str,
+    prompt: str,
+    generate_config: types.GenerateContentConfig,
+    priority: int,
+    estimated_tokens: int,
+    timeout: float | None = None,
+    timing: _CallTiming | None = None,
+):
+    """
+    指定したモデルで1回だけストリーミング生成し、テキストを断片ごとに返します。
+
+    timeout は枠を確保してから最初の断片が届くまでに適用します。
+    """
+    async with scheduler.slot(model, priority, estimated_tokens) as slot:
+        if timing is not None:
+            timing.started = time.monotonic()
+        outcome = "error"
+        usage = None
+        try:
+            with GEMINI_LATENCY.timer(model=model, function=name):
+                async with asyncio.timeout(timeout):
+                    stream = await client.aio.models.generate_content_stream(
+                        model=model,
+                        contents=prompt,
+                        config=generate_config,
+                    )
+                    chunks = aiter(stream)
+                    chunk = await anext(chunks, None)
+                while chunk is not None:
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    if usage and usage.total_token_count:
+                        slot.used_tokens = usage.total_token_count
+                    if chunk.text:
+                        yield chunk.text
+                    chunk = await anext(chunks, None)
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            # 呼び出し側が途中で読むのをやめた
+            outcome = "cancelled"
+            raise
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except genai_errors.APIError as e:
+            if e.code == 429:
+                outcome = "rate_limited"
+                scheduler.penalize(model)
+                raise exceptions.ResourceExhausted(str(e)) from e
+            raise
+        finally:
+            GEMINI_REQUESTS.inc(model=model, function=name, outcome=outcome)
+            # 途中で打ち切られた場合も、それまでに報告された分を数える
+            _record_usage(model, name, usage)
+
+
+async def _stream_text(
+    name: str,
+    task: str,
+    prompt: str,
+    generate_config: types.GenerateContentConfig,
+    cache_ttl: int = 0,
+    priority: int = PRIORITY_MESSAGE,
+):
+    """
+    _generate_text のストリーミング版。生成されたテキストを断片ごとに返す非同期ジェネレータです。
+
+    キャッシュにある場合は全文を1回で返します。経路の先頭のモデルで最後まで受信できた応答だけを
+    キャッシュします。次のモデルへのフォールバックは最初の断片を受信する前に限り、
+    受信を始めた後のエラーはそのまま送出します。
+    すべてのモデルでレート制限 (HTTP 429) を受けた場合は exceptions.ResourceExhausted を送出します。
+    """
+    primary = model_router.primary(task)
+    key = make_cache_key(primary, prompt, generate_config) if cache_ttl > 0 else None
+    cached = await _cached_response(key, name)
+    if cached is not None:
+        yield cached
+        return
+
+    estimated_tokens = estimate_tokens(prompt) + config.GEMINI_OUTPUT_TOKEN_ESTIMATE
+    plan = model_router.plan(task, estimated_tokens)
+    parts = []
+    for attempt, choice in enumerate(plan):
+        timing = _CallTiming()
+        outcome = "error"
+        # 最初の断片が届くまでを目標時間で打ち切る (枠待ちの時間は含めない)
+        stream = _stream_once(
+            name,
+            choice.model,
+            prompt,
+            _adapt_config(choice.model, generate_config),
+            priority,
+            estimated_tokens,
+            timeout=choice.timeout,
+            timing=timing,
+        )
+        try:
+            try:
+                chunk = await anext(stream, None)
+            except _FALLBACK_ERRORS as e:
+                outcome = _failure_outcome(e)
+                if attempt == len(plan) - 1:
+                    raise
+                logger.warning(
+                    f"{name}: {choice.model} failed ({outcome}), "
+                    f"falling back to {plan[attempt + 1].model}"
+                )
+                continue
+            while chunk is not None:
+                parts.append(chunk)
+                yield chunk
+                chunk = await anext(stream, None)
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        except _FALLBACK_ERRORS as e:
+            outcome = _failure_outcome(e)
+            raise
+        finally:
+            await stream.aclose()
+            model_router.record(
+                task,
+                name,
+                choice,
+                attempt,
+                estimated_tokens,
+                timing.elapsed(),
+                outcome,
+            )
+        break
+
+    if key and choice.model == primary:
+        await response_cache.put(key, name, "".join(parts).strip(), cache_ttl)
+
+
+def _summary_prompt(text: str, date_str: str) -> str:
+    return f"""
     以下のテキストは、ある日のDiscordチャンネルで行われたメモの内容です。
     この内容について、以下の3つのタスクを実行してください。
 
@@ -75,31 +450,63 @@ def summarize_and_tag_and_explain(
     {text}
     """
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=1.0,
-                tools=[grounding_tool],
-            ),
-        )
 
-        # レスポンスをセクションに分割
-        sections = response.text.strip().split("---")
+def _summary_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=1.0,
+        tools=[grounding_tool],
+    )
+
+
+def _parse_summary(text: str) -> tuple[str, str, dict[str, str]]:
+    parser = SummaryStreamParser()
+    summary, tags_line, explanations = "", "", {}
+    for event in parser.feed(text) + parser.close():
+        if event.kind == EVENT_SUMMARY:
+            summary = event.text
+        elif event.kind == EVENT_TAGS:
+            tags_line = event.text
+        else:
+            explanations[event.tag] = event.text
+    return summary, tags_line, explanations
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
+)
+async def summarize_and_tag_and_explain(
+    text: str, date_str: str, priority: int = PRIORITY_BATCH
+) -> tuple[str, str, dict[str, str]]:
+    """
+    与えられたテキストを要約し、タグを生成し、各タグの解説を作成します。
+
+    Args:
+        text: 対象のテキスト。
+        date_str: yyyy-mm-dd形式の日付文字列。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        (要約文, タグの文字列, {タグ名: 解説文, ...})
+
+    Raises:
+        生成に失敗した場合は例外を送出します (エラーの文言をノートに書き込まないため)。
+    """
+    prompt = _summary_prompt(text, date_str)
 
-        summary = sections[0].strip()
-        tags_line = sections[1].strip()
+    try:
+        text = await _generate_text(
+            "summarize_and_tag_and_explain",
+            task=TASK_SUMMARY,
+            prompt=prompt,
+            generate_config=_summary_config(),
+            priority=priority,
+        )
 
-        explanations = {}
-        for i in range(2, len(sections)):
-            part = sections[i].strip()
-            if part.startswith("[TAG:"):
-                # タグ名と解説文を抽出
-                tag_name_end = part.find("]")
-                tag_name = part[5:tag_name_end]
-                explanation = part[tag_name_end + 1 :].strip()
-                explanations[tag_name] = explanation
+        # レスポンスをセクションに分割 (解説中の "---" では区切らない)
+        summary, tags_line, explanations = _parse_summary(text)
 
         logger.info("--- AI Summarizer (Gemini) ---")
         logger.info(f"Generated Summary: {summary}")
@@ -109,39 +516,281 @@ def summarize_and_tag_and_explain(
 
         return summary, tags_line, explanations
 
-    except exceptions.ResourceExhausted as e:
-        logger.error(f"[Error] Failed to generate content with Gemini: {e}")
-        # Add more detailed error message for quota exceeded
-        if "quota" in str(e).lower():
-            logger.warning(
-                "API usage quota exceeded. Consider upgrading your plan or waiting before retrying."
-            )
-            return (
-                "APIの使用制限に達しました。しばらく時間をおいてから再試行してください。",
-                "#api-limit-error",
-                {},
-            )
-        raise e  # Reraise other ResourceExhausted errors to be caught by tenacity
     except Exception as e:
-        logger.error(f"[Error] Failed to generate content with Gemini: {e}")
-        return "処理中にエラーが発生しました。", "#error", {}
+        _log_generation_error("generate content", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+
+async def stream_summary_sections(
+    text: str, date_str: str, priority: int = PRIORITY_BATCH
+):
+    """
+    summarize_and_tag_and_explain のストリーミング版。応答を受信しながらセクションごとに返します。
+
+    要約・タグの行・各タグの解説が完成するたびに SummaryEvent を返すため、
+    呼び出し側は応答全体を待たずにタグノートを書き込めます。
+    リトライは行わず、エラーはそのまま送出します (呼び出し側で途中経過から再開する)。
+
+    Args:
+        text: 対象のテキスト。
+        date_str: yyyy-mm-dd形式の日付文字列。
+        priority: スケジューラでの優先度。
+
+    Yields:
+        SummaryEvent。
+    """
+    parser = SummaryStreamParser()
+    async for chunk in _stream_text(
+        "summarize_and_tag_and_explain",
+        task=TASK_SUMMARY,
+        prompt=_summary_prompt(text, date_str),
+        generate_config=_summary_config(),
+        priority=priority,
+    ):
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+async def stream_tag_explanations(
+    text: str, date_str: str, tags: list[str], priority: int = PRIORITY_BATCH
+):
+    """
+    指定したタグの解説だけを生成し、完成したものから SummaryEvent として返します。
+
+    まとめ生成が途中で失敗した場合に、不足しているタグだけを再要求するために使います。
+
+    Args:
+        text: まとめ生成と同じ入力テキスト。
+        date_str: yyyy-mm-dd形式の日付文字列。
+        tags: 解説を生成するタグ名のリスト。
+        priority: スケジューラでの優先度。
+
+    Yields:
+        SummaryEvent (kind は EVENT_TAG)。
+    """
+    tag_lines = "\n".join(
+        f"[TAG:{tag}]\n[[{date_str}]]\nここに解説文を記述" for tag in tags
+    )
+    prompt = f"""
+    以下のテキストは、ある日のDiscordチャンネルで行われたメモの内容です。
+    次のキーワードそれぞれについて、元のメモの内容と私の知識をもとに、500字程度の詳細解説を記述してください。
+    解説の冒頭には、必ず `[[{date_str}]]` という形式で、今日の日付へのリンクを挿入してください。
+    必要に応じてインターネットによる調査も行い、内容の正確性と深みを高めます。詳細解説には、関連する外部リンクや参考文献も適宜含めます。
+    メモの中で重要と思われる単語や固有名詞は解説文の最後に`#単語`として記述してください。
+
+    [キーワード]
+    {" ".join(f"#{tag}" for tag in tags)}
+
+    [出力フォーマット]
+    {tag_lines}
+
+    [入力テキスト]
+    {text}
+    """
+    parser = SummaryStreamParser(expect_summary=False)
+    async for chunk in _stream_text(
+        "stream_tag_explanations",
+        task=TASK_SUMMARY,
+        prompt=prompt,
+        generate_config=_summary_config(),
+        priority=priority,
+    ):
+        for event in parser.feed(chunk):
+            yield event
+    for event in parser.close():
+        yield event
+
+
+async def count_tokens(text: str, model: str = "gemini-2.5-flash") -> int:
+    """
+    テキストのトークン数を数えます。APIで数えられない場合は文字数から概算します。
+
+    Args:
+        text: 対象のテキスト。
+        model: トークナイザーを使うモデル名。
+
+    Returns:
+        トークン数。
+    """
+    try:
+        response = await client.aio.models.count_tokens(model=model, contents=text)
+        if response.total_tokens is not None:
+            return response.total_tokens
+    except (genai_errors.APIError, TimeoutError) as e:
+        logger.warning(f"Failed to count tokens with Gemini, using estimate: {e}")
+    return estimate_tokens(text)
 
 
 @retry(
     wait=wait_exponential(multiplier=1, min=4, max=10),
     stop=stop_after_attempt(3),
     retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
 )
-def generate_flash_supplement(text: str, url_summary: str = None) -> str:
+async def summarize_memo_chunk(chunk: str, priority: int = PRIORITY_BATCH) -> str:
+    """
+    1日分のメモの一部 (チャンク) を、最終要約の材料となる要点に圧縮します。
+
+    Args:
+        chunk: メモのチャンク。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        要点の箇条書き。失敗した場合は元のチャンクをそのまま返します。
+    """
+    prompt = f"""
+    以下のテキストは、ある日のDiscordチャンネルで行われたメモの一部です。
+    後で1日全体の要約とキーワード抽出を行うための材料として、
+    話題・固有名詞・結論を落とさずに、日本語の箇条書きで簡潔にまとめてください。
+    冒頭の挨拶や確認の文言は不要です。
+
+    [入力テキスト]
+    {chunk}
+    """
+    try:
+        return await _generate_text(
+            "summarize_memo_chunk",
+            task=TASK_DIGEST,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(temperature=0.3),
+            cache_ttl=config.LLM_CACHE_TTL_MEMO_CHUNK,
+            priority=priority,
+        )
+    except exceptions.ResourceExhausted:
+        raise  # tenacity で再試行する
+    except (genai_errors.APIError, TimeoutError) as e:
+        logger.error(f"[Error] Failed to summarize memo chunk with Gemini: {e}")
+        return chunk
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
+)
+async def update_rolling_digest(
+    digest: str, new_entries: list[str], priority: int = PRIORITY_BATCH
+) -> str:
+    """
+    その日のこれまでのダイジェストに新しいメモを反映した、更新後のダイジェストを生成します。
+
+    ダイジェストは ROLLING_DIGEST_MAX_CHARS 程度に保たれるため、
+    1回の呼び出しのコストはその日のメモの総量によらずほぼ一定です。
+    失敗した場合は例外を送出します (呼び出し側で未反映のまま保持するため)。
+
+    Args:
+        digest: これまでのダイジェスト (初回は空文字列)。
+        new_entries: まだ反映していないメモのエントリ。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        更新後のダイジェスト。
+    """
+    entries_text = "\n\n".join(new_entries)
+    prompt = f"""
+    以下は、ある日のDiscordチャンネルのメモについて、これまでの内容をまとめたダイジェストと、
+    新たに追加されたメモです。新しいメモの内容を反映したダイジェストを作成してください。
+    後で1日全体の要約とキーワード抽出を行うための材料なので、話題・固有名詞・結論を落とさず、
+    日本語の箇条書きで{config.ROLLING_DIGEST_MAX_CHARS}字以内にまとめてください。
+    冒頭の挨拶や確認の文言は不要です。
+
+    [これまでのダイジェスト]
+    {digest or "(まだありません)"}
+
+    [新しいメモ]
+    {entries_text}
+    """
+    try:
+        return await _generate_text(
+            "update_rolling_digest",
+            task=TASK_DIGEST,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(temperature=0.3),
+            priority=priority,
+        )
+    except exceptions.ResourceExhausted as e:
+        logger.error(f"[Error] Failed to update rolling digest with Gemini: {e}")
+        raise  # tenacity で再試行する
+
+
+async def summarize_daily_memo(
+    text: str, date_str: str, priority: int = PRIORITY_BATCH
+) -> tuple[str, str, dict[str, str]]:
+    """
+    1日分のメモを、分量に応じて map-reduce で要約・タグ付け・解説します。
+
+    Botが追記したAIの補足やURLの概要を取り除いた上でトークン数を数え、
+    SUMMARY_MAP_REDUCE_THRESHOLD 以下ならそのまま summarize_and_tag_and_explain に渡します。
+    超える場合はエントリ単位で SUMMARY_CHUNK_TOKENS ごとのチャンクに分け、
+    各チャンクを並行して要点に圧縮 (map) してから、最終的な要約・タグ・解説を生成 (reduce) します。
+
+    Args:
+        text: "## メモ" 以降のテキスト。
+        date_str: yyyy-mm-dd形式の日付文字列。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        (要約文, タグの文字列, {タグ名: 解説文, ...})
+    """
+    summary_input = await prepare_summary_input(text, date_str, priority)
+    return await summarize_and_tag_and_explain(summary_input, date_str, priority)
+
+
+async def prepare_summary_input(
+    text: str, date_str: str, priority: int = PRIORITY_BATCH
+) -> str:
+    """
+    summarize_daily_memo の入力準備 (圧縮と map フェーズ) だけを行います。
+
+    Returns:
+        summarize_and_tag_and_explain (またはストリーミング版) に渡すテキスト。
+    """
+    compacted = compact_memo(text)
+    total_tokens = await count_tokens(compacted)
+    logger.info(
+        f"Daily memo for {date_str}: {len(text)} chars, "
+        f"{len(compacted)} chars after compaction, {total_tokens} tokens"
+    )
+    if total_tokens <= config.SUMMARY_MAP_REDUCE_THRESHOLD:
+        return compacted
+
+    chunks = chunk_entries(
+        split_entries(compacted), config.SUMMARY_CHUNK_TOKENS, estimate_tokens
+    )
+    logger.info(f"Summarizing {len(chunks)} chunk(s) for {date_str} (map phase)")
+    partials = await asyncio.gather(
+        *(summarize_memo_chunk(chunk, priority) for chunk in chunks)
+    )
+    return "\n\n".join(
+        f"[パート{i + 1}]\n{partial}" for i, partial in enumerate(partials)
+    )
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
+)
+async def generate_flash_supplement(
+    text: str, url_summary: str | None = None, priority: int = PRIORITY_MESSAGE
+) -> str:
     """
     与えられたテキストやURLの概要に対して、短い補足を生成します。
 
     Args:
         text: 対象のテキスト。
         url_summary: URLの概要（存在する場合）。
+        priority: スケジューラでの優先度。
 
     Returns:
         補足の文字列。
+
+    Raises:
+        生成に失敗した場合は例外を送出します (ジョブキューで再試行するため)。
     """
     prompt_parts = [
         "以下の情報について、簡潔な補足や関連情報を最大500文字程度の日本語で記述してください。",
@@ -163,48 +812,254 @@ def generate_flash_supplement(text: str, url_summary: str = None) -> str:
     prompt = "\n".join(prompt_parts)
 
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        supplement = await _generate_text(
+            "generate_flash_supplement",
+            task=TASK_SUPPLEMENT,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(
                 temperature=1.0,
                 tools=[grounding_tool],
             ),
+            cache_ttl=config.LLM_CACHE_TTL_SUPPLEMENT,
+            priority=priority,
         )
-        supplement = response.text.strip()
         logger.info("--- AI Flash Supplement (Gemini) ---")
         logger.info(f"Generated Supplement: {supplement}")
         logger.info("---------------------------------")
         return supplement
 
-    except exceptions.ResourceExhausted as e:
-        logger.error(f"[Error] Failed to generate flash supplement with Gemini: {e}")
-        # Add more detailed error message for quota exceeded
-        if "quota" in str(e).lower():
-            logger.warning(
-                "API usage quota exceeded. Consider upgrading your plan or waiting before retrying."
+    except Exception as e:
+        _log_generation_error("generate flash supplement", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+
+# まとめて補足を生成する際の応答スキーマ ([{"id": 0, "tip": "..."}, ...])
+_SUPPLEMENT_BATCH_SCHEMA = types.Schema(
+    type=types.Type.ARRAY,
+    items=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "id": types.Schema(type=types.Type.INTEGER),
+            "tip": types.Schema(type=types.Type.STRING),
+        },
+        required=["id", "tip"],
+    ),
+)
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
+)
+async def generate_flash_supplements(
+    items: list[tuple[str, str | None]], priority: int = PRIORITY_MESSAGE
+) -> list[str]:
+    """
+    複数のメッセージに対する短い補足を、1回のリクエストでまとめて生成します。
+
+    共通の指示は1度だけ送り、応答はJSONスキーマで入力ごとに分割します。
+    JSONモードは検索ツールと併用できないため、検索によるグラウンディングは行いません。
+    応答をJSONとして解釈できない場合や、応答に含まれなかった入力は
+    generate_flash_supplement で個別に生成します。APIの呼び出しに失敗した場合は例外を送出します。
+
+    Args:
+        items: (テキスト, URLの概要またはNone) のリスト。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        items と同じ順序の補足文字列のリスト。
+    """
+    prompt_parts = [
+        "以下の複数の入力それぞれについて、簡潔な補足や関連情報を最大500文字程度の日本語で記述してください。",
+        "重要なキーワードを抽出し、それについて簡潔に説明するような形式が望ましいです。",
+        "**補足情報と関連情報を直接記述してください。冒頭の挨拶や確認の文言は不要です。**",
+        "各入力の補足は、入力の番号を id として JSON 配列で出力してください。",
+    ]
+    for i, (text, url_summary) in enumerate(items):
+        prompt_parts.extend([f"\n[入力 {i}]", text])
+        if url_summary:
+            prompt_parts.extend([f"[入力 {i} のURLの概要]", url_summary])
+    prompt = "\n".join(prompt_parts)
+
+    try:
+        text = await _generate_text(
+            "generate_flash_supplements",
+            task=TASK_SUPPLEMENT,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(
+                temperature=1.0,
+                response_mime_type="application/json",
+                response_schema=_SUPPLEMENT_BATCH_SCHEMA,
+            ),
+            priority=priority,
+        )
+    except Exception as e:
+        _log_generation_error("generate flash supplements", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+    tips = {}
+    try:
+        entries = json.loads(text)
+        if not isinstance(entries, list):
+            raise TypeError("Supplement batch response is not a JSON array")
+    except (ValueError, TypeError) as e:
+        # 解釈できない応答は、すべての入力を個別生成にフォールバックする
+        logger.error(f"[Error] Invalid flash supplement batch from Gemini: {e}")
+        entries = []
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("id"), int):
+            tips[entry["id"]] = str(entry.get("tip", "")).strip()
+    logger.info("--- AI Flash Supplement Batch (Gemini) ---")
+    logger.info(f"Generated {len(tips)}/{len(items)} supplements in one request")
+    logger.info("---------------------------------")
+
+    missing = [i for i in range(len(items)) if not tips.get(i)]
+    if missing:
+        logger.warning(f"Falling back to single supplements for inputs {missing}")
+        results = await asyncio.gather(
+            *(
+                generate_flash_supplement(
+                    items[i][0], url_summary=items[i][1], priority=priority
+                )
+                for i in missing
             )
-            return "APIの使用制限に達しました。しばらく時間をおいてから再試行するか、APIプランのアップグレードをご検討ください。"
-        raise e  # Reraise other ResourceExhausted errors to be caught by tenacity
+        )
+        tips.update(zip(missing, results))
+    return [tips[i] for i in range(len(items))]
+
+
+@dataclass
+class MessageEnrichment:
+    """1件のメッセージに対する補足・話題・重要語の生成結果"""
+
+    tip: str
+    topics: list[str] = field(default_factory=list)
+    key_terms: list[str] = field(default_factory=list)
+
+
+# 補足と話題をまとめて生成する際の応答スキーマ
+_ENRICHMENT_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "tip": types.Schema(type=types.Type.STRING),
+        "topics": types.Schema(
+            type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)
+        ),
+        "key_terms": types.Schema(
+            type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)
+        ),
+    },
+    required=["tip", "topics", "key_terms"],
+)
+
+
+def _string_list(value) -> list[str]:
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+@retry(
+    wait=wait_exponential(multiplier=1, min=4, max=10),
+    stop=stop_after_attempt(3),
+    retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
+)
+async def enrich_message(
+    text: str, url_summary: str | None = None, priority: int = PRIORITY_MESSAGE
+) -> MessageEnrichment:
+    """
+    1回のリクエストで、メッセージの補足・話題・重要語をまとめて生成します。
+
+    generate_flash_supplement と extract_topics を個別に呼ぶ代わりに使い、
+    応答はJSONスキーマで受け取ります。JSONモードは検索ツールと併用できないため、
+    検索によるグラウンディングは行いません。JSONとして解釈できない場合は
+    generate_flash_supplement にフォールバックし、話題は空になります。
+    APIの呼び出しに失敗した場合は例外を送出します (ジョブキューで再試行するため)。
+
+    Args:
+        text: 対象のテキスト。
+        url_summary: URLの概要（存在する場合）。
+        priority: スケジューラでの優先度。
+
+    Returns:
+        MessageEnrichment。
+    """
+    prompt_parts = [
+        "以下の情報について、次の3つをJSONで出力してください。",
+        "- tip: 簡潔な補足や関連情報 (最大500文字程度の日本語)。重要なキーワードを抽出し、それについて簡潔に説明するような形式が望ましいです。冒頭の挨拶や確認の文言は不要です。",
+        "- topics: 重要なキーワードや話題 (5つ以内、単語や短いフレーズ)",
+        "- key_terms: 本文中に現れる重要な単語や固有名詞 (5つ以内)",
+        "\n[入力テキスト]",
+        text,
+    ]
+    if url_summary:
+        prompt_parts.extend(["\n[URLの概要]", url_summary])
+    prompt = "\n".join(prompt_parts)
+
+    try:
+        response = await _generate_text(
+            "enrich_message",
+            task=TASK_SUPPLEMENT,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(
+                temperature=1.0,
+                response_mime_type="application/json",
+                response_schema=_ENRICHMENT_SCHEMA,
+            ),
+            cache_ttl=config.LLM_CACHE_TTL_SUPPLEMENT,
+            priority=priority,
+        )
     except Exception as e:
-        logger.error(f"[Error] Failed to generate flash supplement with Gemini: {e}")
-        return "補足の生成中にエラーが発生しました。"
+        _log_generation_error("enrich message", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+    try:
+        data = json.loads(response)
+        if not isinstance(data, dict):
+            raise TypeError("Enrichment response is not a JSON object")
+        tip = str(data.get("tip", "")).strip()
+        if not tip:
+            raise ValueError("Empty tip in enrichment response")
+    except (ValueError, TypeError) as e:
+        # 解釈できない応答は、補足だけの個別生成にフォールバックする
+        logger.error(f"[Error] Invalid enrichment response from Gemini: {e}")
+        tip = await generate_flash_supplement(text, url_summary, priority)
+        return MessageEnrichment(tip=tip)
+
+    enrichment = MessageEnrichment(
+        tip=tip,
+        topics=_string_list(data.get("topics")),
+        key_terms=_string_list(data.get("key_terms")),
+    )
+    logger.info("--- AI Message Enrichment (Gemini) ---")
+    logger.info(f"Generated Supplement: {enrichment.tip}")
+    logger.info(f"Topics: {enrichment.topics}, Key terms: {enrichment.key_terms}")
+    logger.info("---------------------------------")
+    return enrichment
 
 
 @retry(
     wait=wait_exponential(multiplier=1, min=4, max=10),
     stop=stop_after_attempt(3),
     retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
 )
-def extract_topics(text: str) -> list[str]:
+async def extract_topics(text: str, priority: int = PRIORITY_INTERACTIVE) -> list[str]:
     """
     与えられたテキストから重要なキーワードや話題を抽出します。
 
     Args:
         text: 対象のテキスト。
+        priority: スケジューラでの優先度。
 
     Returns:
         キーワードや話題のリスト。
+
+    Raises:
+        抽出に失敗した場合は例外を送出します (エラーの文言を話題として扱わないため)。
     """
     prompt = f"""
     以下のテキストから、重要なキーワードや話題を5つ以内で抽出してください。
@@ -215,82 +1070,106 @@ def extract_topics(text: str) -> list[str]:
     """
 
     try:
-        response = client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
+        text = await _generate_text(
+            "extract_topics",
+            task=TASK_TOPICS,
+            prompt=prompt,
+            generate_config=types.GenerateContentConfig(
                 temperature=0.7,
             ),
+            cache_ttl=config.LLM_CACHE_TTL_TOPICS,
+            priority=priority,
         )
-        topics = response.text.strip().split("\n")
+        topics = [line.strip() for line in text.split("\n") if line.strip()]
         logger.info("--- AI Topic Extractor (Gemini) ---")
         logger.info(f"Extracted Topics: {topics}")
         logger.info("------------------------------------")
         return topics
 
-    except exceptions.ResourceExhausted as e:
-        logger.error(f"[Error] Failed to extract topics with Gemini: {e}")
-        # Add more detailed error message for quota exceeded
-        if "quota" in str(e).lower():
-            logger.warning(
-                "API usage quota exceeded. Consider upgrading your plan or waiting before retrying."
-            )
-            return [
-                "APIの使用制限に達しました。しばらく時間をおいてから再試行してください。"
-            ]
-        raise e  # Reraise other ResourceExhausted errors to be caught by tenacity
     except Exception as e:
-        logger.error(f"[Error] Failed to extract topics with Gemini: {e}")
-        return ["トピックの抽出中にエラーが発生しました。"]
+        _log_generation_error("extract topics", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+
+def _topic_summary_prompt(topic: str) -> str:
+    return f"""
+    以下のトピックについて、簡潔な概要または要約を最大500文字程度の日本語で記述してください。
+    必要に応じてインターネットによる調査も行い、内容の正確性と深みを高めてください。
+    改行を文末に毎度入れてください。
+
+    [トピック]
+    {topic}
+    """
+
+
+def _topic_summary_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=0.7,
+        tools=[grounding_tool_retrieval],
+    )
 
 
 @retry(
     wait=wait_exponential(multiplier=1, min=4, max=10),
     stop=stop_after_attempt(3),
     retry=retry_if_exception_type(exceptions.ResourceExhausted),
+    before_sleep=record_retry,
 )
-def generate_topic_summary(topic: str) -> str:
+async def generate_topic_summary(
+    topic: str, priority: int = PRIORITY_INTERACTIVE
+) -> str:
     """
     与えられたトピックの概要や要約を生成します。
 
     Args:
         topic: 概要を生成するトピック。
+        priority: スケジューラでの優先度。
 
     Returns:
         トピックの概要または要約。
-    """
-    prompt = f"""
-    以下のトピックについて、簡潔な概要または要約を最大500文字程度の日本語で記述してください。
-    必要に応じてインターネットによる調査も行い、内容の正確性と深みを高めてください。
-    改行を文末に毎度入れてください。
 
-    [トピック]
-    {topic}
+    Raises:
+        生成に失敗した場合は例外を送出します。
     """
     try:
-        response = client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                tools=[grounding_tool_retrieval],
-            ),
+        summary = await _generate_text(
+            "generate_topic_summary",
+            task=TASK_TOPIC_SUMMARY,
+            prompt=_topic_summary_prompt(topic),
+            generate_config=_topic_summary_config(),
+            cache_ttl=config.LLM_CACHE_TTL_TOPIC_SUMMARY,
+            priority=priority,
         )
-        summary = response.text.strip()
         logger.info("--- AI Topic Summary (Gemini) ---")
         logger.info(f"Generated Summary for '{topic}': {summary}")
         logger.info("---------------------------------")
         return summary
 
-    except exceptions.ResourceExhausted as e:
-        logger.error(f"[Error] Failed to generate topic summary with Gemini: {e}")
-        # Add more detailed error message for quota exceeded
-        if "quota" in str(e).lower():
-            logger.warning(
-                "API usage quota exceeded. Consider upgrading your plan or waiting before retrying."
-            )
-            return "APIの使用制限に達しました。しばらく時間をおいてから再試行するか、APIプランのアップグレードをご検討ください。"
-        raise e  # Reraise other ResourceExhausted errors to be caught by tenacity
     except Exception as e:
-        logger.error(f"[Error] Failed to generate topic summary with Gemini: {e}")
-        return "概要の生成中にエラーが発生しました。"
+        _log_generation_error("generate topic summary", e)
+        raise  # ResourceExhausted は tenacity で再試行する
+
+
+async def stream_topic_summary(topic: str, priority: int = PRIORITY_INTERACTIVE):
+    """
+    generate_topic_summary のストリーミング版。概要を生成されたそばから断片ごとに返します。
+
+    generate_topic_summary と同じプロンプトと応答キャッシュを使います。
+    リトライは行わず、エラーはそのまま送出します (呼び出し側で generate_topic_summary に切り替える)。
+
+    Args:
+        topic: 概要を生成するトピック。
+        priority: スケジューラでの優先度。
+
+    Yields:
+        概要の文字列の断片。
+    """
+    async for text in _stream_text(
+        "generate_topic_summary",
+        task=TASK_TOPIC_SUMMARY,
+        prompt=_topic_summary_prompt(topic),
+        generate_config=_topic_summary_config(),
+        cache_ttl=config.LLM_CACHE_TTL_TOPIC_SUMMARY,
+        priority=priority,
+    ):
+        yield text
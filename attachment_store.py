@@ -0,0 +1,241 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import aiohttp
+
+import config
+from logger_config import logger
+
+# 保存時の拡張子 (Content-Typeから決め、分からない場合は元のファイル名の拡張子を使う)
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+_CHUNK_SIZE = 64 * 1024
+
+
+class AttachmentRejected(Exception):
+    """サイズや種類の上限により保存しない添付ファイル"""
+
+
+@dataclass
+class StoredAttachment:
+    """保存した (または既に保存済みだった) 添付ファイル"""
+
+    filename: str
+    sha256: str
+    size: int
+    duplicate: bool
+
+
+def _extension(content_type: str, filename: str) -> str:
+    ext = _EXTENSIONS.get(content_type)
+    if ext:
+        return ext
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext.isascii() and ext[1:].isalnum() else ""
+
+
+class AttachmentStore:
+    """
+    添付画像を内容のハッシュ (SHA-256) をファイル名にして保存するクラス。
+
+    ダウンロードは共有HTTPセッションで並行して行い (同時数は ATTACHMENT_CONCURRENCY まで)、
+    チャンク単位でハッシュを計算しながら一時ファイルに書き込みます。保存済みのハッシュは
+    SQLiteのインデックスに記録し、同じ内容のファイルは保存し直さずに既存のファイル名を返します。
+    ファイル名が内容から決まるため、"image.png" のような同名の別ファイルが上書きされることもありません。
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        save_dir: str | None = None,
+        concurrency: int = config.ATTACHMENT_CONCURRENCY,
+        max_bytes: int = config.ATTACHMENT_MAX_BYTES,
+        allowed_types: frozenset[str] = config.ATTACHMENT_ALLOWED_TYPES,
+    ):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "attachments.sqlite3")
+        self.save_dir = save_dir or config.IMAGE_SAVE_DIR
+        self.max_bytes = max_bytes
+        self.allowed_types = allowed_types
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS attachments (
+                sha256 TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                content_type TEXT,
+                created_at REAL NOT NULL,
+                last_seen REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        logger.info(f"Opened attachment index: {path}")
+
+    def _is_allowed(self, content_type: str) -> bool:
+        # "image/*" のように種類だけを指定したものは、その種類のすべての形式を許可する
+        major = content_type.split("/", 1)[0]
+        return content_type in self.allowed_types or f"{major}/*" in self.allowed_types
+
+    def _check(self, content_type: str, size: int | None):
+        if not self._is_allowed(content_type):
+            raise AttachmentRejected(f"unsupported content type {content_type!r}")
+        if size is not None and size > self.max_bytes:
+            raise AttachmentRejected(f"{size} bytes exceeds {self.max_bytes}")
+
+    # --- 同期処理 (スレッド上で実行される) ---
+
+    def _commit_file(
+        self, tmp_path: str, digest: str, ext: str, size: int, content_type: str
+    ) -> StoredAttachment:
+        """一時ファイルをハッシュ名に置き換えるか、既存のファイルがあれば破棄します。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename FROM attachments WHERE sha256 = ?", (digest,)
+            ).fetchone()
+            # インデックスにあってもファイルが消されていれば保存し直す
+            if row and os.path.exists(os.path.join(self.save_dir, row[0])):
+                os.remove(tmp_path)
+                self._conn.execute(
+                    "UPDATE attachments SET last_seen = ? WHERE sha256 = ?",
+                    (now, digest),
+                )
+                self._conn.commit()
+                return StoredAttachment(row[0], digest, size, duplicate=True)
+
+            filename = f"{digest}{ext}"
+            os.replace(tmp_path, os.path.join(self.save_dir, filename))
+            self._conn.execute(
+                """
+                INSERT INTO attachments (
+                    sha256, filename, size, content_type, created_at, last_seen
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(sha256) DO UPDATE SET
+                    filename = excluded.filename,
+                    size = excluded.size,
+                    content_type = excluded.content_type,
+                    last_seen = excluded.last_seen
+                """,
+                (digest, filename, size, content_type, now, now),
+            )
+            self._conn.commit()
+            return StoredAttachment(filename, digest, size, duplicate=False)
+
+    # --- 非同期API ---
+
+    async def _download(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        filename: str,
+        content_type: str,
+    ) -> StoredAttachment:
+        tmp_path = os.path.join(self.save_dir, f".{uuid.uuid4().hex}.part")
+        hasher = hashlib.sha256()
+        size = 0
+        timeout = aiohttp.ClientTimeout(
+            total=config.ATTACHMENT_DOWNLOAD_TIMEOUT,
+            sock_connect=config.HTTP_CONNECT_TIMEOUT,
+            sock_read=config.HTTP_READ_TIMEOUT,
+        )
+        try:
+            async with session.get(url, timeout=timeout) as response:
+                response.raise_for_status()
+                self._check(content_type, response.content_length)
+                # ファイルの操作はイベントループを止めないようスレッド上で行う
+                f = await asyncio.to_thread(open, tmp_path, "wb")
+                try:
+                    async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                        size += len(chunk)
+                        # Content-Length が無い・偽っている場合も上限で打ち切る
+                        if size > self.max_bytes:
+                            raise AttachmentRejected(
+                                f"more than {self.max_bytes} bytes received"
+                            )
+                        hasher.update(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+            return await asyncio.to_thread(
+                self._commit_file,
+                tmp_path,
+                hasher.hexdigest(),
+                _extension(content_type, filename),
+                size,
+                content_type,
+            )
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    async def save(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        filename: str,
+        content_type: str | None,
+        size: int | None = None,
+    ) -> StoredAttachment | None:
+        """
+        添付ファイルを1つ保存します。上限により保存しない場合は None を返します。
+
+        ネットワークエラーはそのまま送出します (メモ処理のジョブごと再試行されます)。
+        """
+        content_type = (content_type or "").split(";")[0].strip().lower()
+        try:
+            # Discordが通知するサイズで、ダウンロード前に弾けるものは弾く
+            self._check(content_type, size)
+            async with self._semaphore:
+                stored = await self._download(session, url, filename, content_type)
+        except AttachmentRejected as e:
+            logger.info(f"Skipped attachment {filename}: {e}")
+            return None
+        if stored.duplicate:
+            logger.debug(f"Attachment {filename} already stored as {stored.filename}")
+        else:
+            logger.debug(f"Saved attachment {filename} as {stored.filename}")
+        return stored
+
+    async def save_all(
+        self, session: aiohttp.ClientSession, attachments
+    ) -> list[StoredAttachment]:
+        """
+        メッセージの添付ファイルを並行して保存し、保存できたものを元の順序で返します。
+
+        Args:
+            session: 共有HTTPセッション。
+            attachments: discord.Attachment のリスト。
+        """
+        results = await asyncio.gather(
+            *(
+                self.save(
+                    session,
+                    attachment.url,
+                    attachment.filename,
+                    attachment.content_type,
+                    attachment.size,
+                )
+                for attachment in attachments
+            )
+        )
+        return [stored for stored in results if stored is not None]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import math
+import random
+import re
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+from google.genai import errors as genai_errors
+from google.genai import types
+
+# 応答の本文に使う文 (日本語はおおむね1文字1トークンとして扱う)
+_FILLER = "ベンチマーク用の応答です。内容に意味はありませんが、長さと区切りは本物の応答に合わせています。"
+_DATE_LINK = re.compile(r"\[\[(\d{4}-\d{2}-\d{2})\]\]")
+_KEYWORDS = re.compile(r"\[キーワード\]\s*\n\s*(.+)")
+_BATCH_INPUT = re.compile(r"^\[入力 (\d+)\]$", re.MULTILINE)
+
+
+def _filler(chars: int) -> str:
+    repeated = _FILLER * (chars // len(_FILLER) + 1)
+    return repeated[:chars]
+
+
+@dataclass
+class LatencyProfile:
+    """1モデル分の応答時間の分布"""
+
+    # 最初の断片が届くまでの秒数の中央値と、対数正規分布のばらつき
+    first_token: float
+    sigma: float
+    # 出力の生成速度 (トークン/秒)
+    tokens_per_second: float
+
+    def sample_first_token(self, rng: random.Random) -> float:
+        return self.first_token * math.exp(rng.gauss(0.0, self.sigma))
+
+
+def parse_latency_profiles(spec: str) -> dict[str, LatencyProfile]:
+    """
+    "model=最初の断片までの秒数:ばらつき:トークン/秒,..." 形式の文字列をパースします。
+
+    Returns:
+        {モデル名: LatencyProfile}
+    """
+    profiles = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, values = item.split("=", 1)
+        first_token, sigma, tokens_per_second = (float(v) for v in values.split(":"))
+        profiles[model.strip()] = LatencyProfile(first_token, sigma, tokens_per_second)
+    return profiles
+
+
+@dataclass
+class _FakeResponse:
+    text: str
+    usage_metadata: types.GenerateContentResponseUsageMetadata | None
+
+
+@dataclass
+class _FakeTokenCount:
+    total_tokens: int
+
+
+class _FakeModels:
+    """client.aio.models の代わりに、設定した分布で待機してから合成した応答を返す"""
+
+    def __init__(self, client: "FakeGeminiClient"):
+        self._client = client
+
+    async def generate_content(self, model, contents, config=None):
+        client = self._client
+        profile = client.profile(model)
+        text = client.respond(contents, config)
+        client.calls[model] = client.calls.get(model, 0) + 1
+        await asyncio.sleep(profile.sample_first_token(client.rng))
+        client.maybe_fail(model)
+        await asyncio.sleep(len(text) / profile.tokens_per_second)
+        return _FakeResponse(text, client.usage(contents, text))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        client = self._client
+        profile = client.profile(model)
+        text = client.respond(contents, config)
+        client.calls[model] = client.calls.get(model, 0) + 1
+        first_token = profile.sample_first_token(client.rng)
+
+        async def stream():
+            await asyncio.sleep(first_token)
+            client.maybe_fail(model)
+            chunks = [
+                text[i : i + client.stream_chunk_chars]
+                for i in range(0, len(text), client.stream_chunk_chars)
+            ]
+            for i, chunk in enumerate(chunks):
+                if i > 0:
+                    await asyncio.sleep(len(chunk) / profile.tokens_per_second)
+                last = i == len(chunks) - 1
+                yield _FakeResponse(
+                    chunk, client.usage(contents, text) if last else None
+                )
+
+        return stream()
+
+    async def count_tokens(self, model, contents, config=None):
+        return _FakeTokenCount(total_tokens=len(contents))
+
+
+class FakeGeminiClient:
+    """
+    ai_summarizer.client の代わりに使う、APIを呼ばない Gemini クライアント。
+
+    モデルごとの応答時間の分布 (最初の断片までの時間と生成速度) で待機し、
+    指定した割合でレート制限 (HTTP 429) とサーバーエラー (HTTP 500) を発生させます。
+    応答はプロンプトと生成設定から呼び出し元を判別して、各関数が解釈できる形式で合成します
+    (まとめの形式、補足のJSONなど)。乱数はシードで固定できます。
+    """
+
+    def __init__(
+        self,
+        profiles: dict[str, LatencyProfile],
+        rate_limit_rate: float = 0.0,
+        server_error_rate: float = 0.0,
+        output_chars: int = 400,
+        summary_tags: int = 5,
+        tag_pool: int = 20,
+        stream_chunk_chars: int = 64,
+        seed: int = 0,
+    ):
+        self.profiles = profiles
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.output_chars = output_chars
+        self.summary_tags = summary_tags
+        self.tag_pool = tag_pool
+        self.stream_chunk_chars = stream_chunk_chars
+        self.rng = random.Random(seed)
+        self.calls: dict[str, int] = {}
+        self.aio = SimpleNamespace(models=_FakeModels(self))
+
+    def profile(self, model: str) -> LatencyProfile:
+        if model not in self.profiles:
+            raise ValueError(f"No latency profile for {model}")
+        return self.profiles[model]
+
+    def maybe_fail(self, model: str):
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            raise genai_errors.ClientError(
+                429,
+                {
+                    "error": {
+                        "code": 429,
+                        "message": f"Resource has been exhausted for {model}",
+                        "status": "RESOURCE_EXHAUSTED",
+                    }
+                },
+            )
+        if roll < self.rate_limit_rate + self.server_error_rate:
+            raise genai_errors.ServerError(
+                500,
+                {"error": {"code": 500, "message": "Internal", "status": "INTERNAL"}},
+            )
+
+    def usage(
+        self, prompt: str, text: str
+    ) -> types.GenerateContentResponseUsageMetadata:
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(prompt),
+            candidates_token_count=len(text),
+            total_token_count=len(prompt) + len(text),
+        )
+
+    # --- 応答の合成 ---
+
+    def respond(self, prompt: str, config: types.GenerateContentConfig | None) -> str:
+        schema = config.response_schema if config else None
+        if schema is not None and schema.type == types.Type.ARRAY:
+            return self._supplement_batch(prompt)
+        if schema is not None:
+            return self._enrichment()
+        if "[キーワード]" in prompt and "[TAG:" in prompt:
+            return self._tag_explanations(prompt)
+        if "[出力フォーマット]" in prompt and "[TAG:" in prompt:
+            return self._summary(prompt)
+        return _filler(self.output_chars)
+
+    def _date(self, prompt: str) -> str:
+        match = _DATE_LINK.search(prompt)
+        return match.group(1) if match else "2000-01-01"
+
+    def _explanation(self, tag: str, date_str: str) -> str:
+        return f"[TAG:{tag}]\n[[{date_str}]]\n{_filler(500)}\n#{tag}"
+
+    def _summary(self, prompt: str) -> str:
+        date_str = self._date(prompt)
+        tags = [
+            f"ベンチ話題{n}"
+            for n in self.rng.sample(
+                range(self.tag_pool), min(self.summary_tags, self.tag_pool)
+            )
+        ]
+        sections = [_filler(200), " ".join(f"#{tag}" for tag in tags)]
+        sections.extend(self._explanation(tag, date_str) for tag in tags)
+        return "\n---\n".join(sections) + "\n---\n"
+
+    def _tag_explanations(self, prompt: str) -> str:
+        date_str = self._date(prompt)
+        match = _KEYWORDS.search(prompt)
+        tags = [word.lstrip("#") for word in match.group(1).split()] if match else []
+        return "\n---\n".join(self._explanation(tag, date_str) for tag in tags)
+
+    def _enrichment(self) -> str:
+        return json.dumps(
+            {
+                "tip": _filler(self.output_chars),
+                "topics": [f"話題{n}" for n in self.rng.sample(range(50), 3)],
+                "key_terms": [f"用語{n}" for n in self.rng.sample(range(50), 3)],
+            },
+            ensure_ascii=False,
+        )
+
+    def _supplement_batch(self, prompt: str) -> str:
+        ids = sorted({int(i) for i in _BATCH_INPUT.findall(prompt)})
+        return json.dumps(
+            [{"id": i, "tip": _filler(self.output_chars)} for i in ids],
+            ensure_ascii=False,
+        )
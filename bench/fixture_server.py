@@ -0,0 +1,105 @@
+import asyncio
+import io
+import math
+import random
+
+from aiohttp import web
+from PIL import Image
+
+# ページの <head> の後ろに並べる本文 (ページの大きさを調整する)
+_PARAGRAPH = (
+    "<p>ベンチマーク用の合成ページです。本文は読み込まれずに打ち切られます。</p>\n"
+)
+
+
+def _noise_image(width: int, height: int, image_format: str) -> bytes:
+    """圧縮の効きにくいノイズ画像 (実際の写真に近い大きさになる) を作成します。"""
+    channels = [Image.effect_noise((width, height), sigma) for sigma in (40, 60, 80)]
+    image = Image.merge("RGB", channels)
+    output = io.BytesIO()
+    image.save(output, image_format, quality=90)
+    return output.getvalue()
+
+
+class FixtureServer:
+    """
+    URLの概要・サムネイル・添付画像の取得先になるローカルのHTTPサーバー。
+
+    /page/{key} は og:title・og:description・og:image を含むHTMLを、
+    /image/{key}.jpg はサムネイル用のJPEGを、/attachment/{key}.png は添付画像用のPNGを返します。
+    画像は起動時に1度だけ作成し、添付画像は末尾に key を付けて内容を変えます
+    (内容のハッシュによる重複排除を効かせないため)。各応答は設定した分布で遅延させます。
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        sigma: float = 0.5,
+        page_bytes: int = 64 * 1024,
+        image_size: tuple[int, int] = (1600, 1200),
+        attachment_size: tuple[int, int] = (800, 600),
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.sigma = sigma
+        self.page_bytes = page_bytes
+        self.rng = random.Random(seed)
+        self._thumbnail = _noise_image(*image_size, "JPEG")
+        self._attachment = _noise_image(*attachment_size, "PNG")
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+        self.requests = 0
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency > 0:
+            await asyncio.sleep(
+                self.latency * math.exp(self.rng.gauss(0.0, self.sigma))
+            )
+
+    async def _page(self, request: web.Request) -> web.Response:
+        await self._delay()
+        key = request.match_info["key"]
+        head = (
+            "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+            f"<title>合成ページ {key}</title>"
+            f"<meta property='og:title' content='合成ページ {key}'>"
+            "<meta property='og:description' content='ベンチマーク用に生成したページの説明です。'>"
+            f"<meta property='og:image' content='{self.base_url}/image/{key}.jpg'>"
+            "</head><body>\n"
+        )
+        body = _PARAGRAPH * max(1, (self.page_bytes - len(head)) // len(_PARAGRAPH))
+        return web.Response(
+            text=head + body + "</body></html>", content_type="text/html"
+        )
+
+    async def _image(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.Response(body=self._thumbnail, content_type="image/jpeg")
+
+    async def _attachment_file(self, request: web.Request) -> web.Response:
+        await self._delay()
+        key = request.match_info["key"].encode()
+        return web.Response(body=self._attachment + key, content_type="image/png")
+
+    def attachment_size(self, key: str) -> int:
+        return len(self._attachment) + len(key.encode())
+
+    async def start(self) -> str:
+        """127.0.0.1 の空いているポートで起動し、ベースURLを返します。"""
+        app = web.Application()
+        app.router.add_get("/page/{key}", self._page)
+        app.router.add_get("/image/{key}.jpg", self._image)
+        app.router.add_get("/attachment/{key}.png", self._attachment_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,504 @@
+"""
+メモ処理とまとめ生成のオフラインベンチマーク。
+
+Discord と Gemini API に接続せずに、実際の MemoHandler.process_message_for_memo
+(ジョブのワーカーと同じ _handle_job 経由) と SummaryCog._run_summary
+(/today_summary のコマンド経由を含む) を動かし、スループットと処理ごとの p50/p95/p99 を表示します。
+Gemini は応答時間の分布とエラー率を設定できる FakeGeminiClient に、URLの取得先と添付画像は
+ローカルの FixtureServer に置き換えます。ノートや状態は一時ディレクトリに書き込みます。
+
+    python -m bench.run --messages 200 --concurrency 4
+    python -m bench.run --json before.json
+    python -m bench.run --set ROLLING_DIGEST_ENABLED=true --json after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bench.fake_gemini import (
+    FakeGeminiClient,
+    parse_latency_profiles,
+)
+from bench.fixture_server import FixtureServer
+from bench.stubs import (
+    StubAttachment,
+    StubBot,
+    StubInteraction,
+    StubMessage,
+)
+
+DEFAULT_LATENCY = (
+    "gemini-2.5-flash=1.5:0.5:250,"
+    "gemini-2.0-flash=0.5:0.4:400,"
+    "gemini-1.5-flash=0.5:0.4:400"
+)
+BENCH_CHANNEL_ID = 1
+_TEXT = "ベンチマークのために合成したメモの本文です。"
+
+
+def _text(chars: int, prefix: str = "") -> str:
+    body = _TEXT * (chars // len(_TEXT) + 1)
+    return (prefix + body)[: max(chars, len(prefix))]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """ソート済みの値の分位点 (隣り合う値の線形補間)"""
+    position = (len(values) - 1) * q
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def _summarize_samples(values: list[float]) -> dict:
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": _percentile(values, 0.5),
+        "p95": _percentile(values, 0.95),
+        "p99": _percentile(values, 0.99),
+        "max": values[-1],
+    }
+
+
+class SampleRecorder:
+    """
+    メトリクスのヒストグラムに記録される観測値を、区間に丸めずにそのまま保持する。
+
+    各処理はすでにヒストグラムで計測されているため、observe を包んで値を横取りするだけで
+    処理ごと (ラベルの組ごと) の正確な分位点が求められます。
+    """
+
+    def __init__(self, histograms):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+        for histogram in histograms:
+            self._install(histogram)
+
+    def _install(self, histogram):
+        observe = histogram.observe
+
+        def recording_observe(value: float, **labels):
+            observe(value, **labels)
+            label_text = ",".join(f"{k}={v}" for k, v in labels.items())
+            name = f"{histogram.name}{{{label_text}}}" if label_text else histogram.name
+            self.samples[name].append(value)
+
+        histogram.observe = recording_observe
+
+    def report(self) -> dict[str, dict]:
+        return {
+            name: _summarize_samples(values)
+            for name, values in sorted(self.samples.items())
+        }
+
+
+def _prepare_environment(args) -> Path:
+    """一時ディレクトリを作り、Botのモジュールを読み込む前に設定を環境変数で差し替える"""
+    workdir = Path(tempfile.mkdtemp(prefix="obsidian-discord-bench-"))
+    dirs = {
+        "SAVE_DIR": workdir / "memos",
+        "IMAGE_SAVE_DIR": workdir / "images",
+        "NOTES_DIR": workdir / "notes",
+        "STATE_DIR": workdir / "state",
+    }
+    for path in dirs.values():
+        path.mkdir()
+    os.environ.update({name: str(path) for name, path in dirs.items()})
+    os.environ["CHANNEL_ID"] = str(BENCH_CHANNEL_ID)
+    os.environ["GEMINI_API_KEY"] = "bench"
+    os.environ["LOG_LEVEL"] = args.log_level
+    if args.rate_limits != "config":
+        # 既定ではスケジューラで待たせず、Gemini側の処理時間だけを測る
+        os.environ["GEMINI_RATE_LIMITS"] = args.rate_limits
+    for item in args.set:
+        name, value = item.split("=", 1)
+        os.environ[name] = value
+    # bot.log も一時ディレクトリに書き込む
+    os.chdir(workdir)
+    return workdir
+
+
+def _make_messages(args, server: FixtureServer) -> list[StubMessage]:
+    rng = random.Random(args.seed)
+    messages = []
+    page_keys: list[str] = []
+    for i in range(args.messages):
+        urls = []
+        for j in range(args.urls):
+            # 一部のURLは以前のメッセージと同じにして、URLキャッシュに当たるようにする
+            if page_keys and rng.random() < args.url_reuse:
+                key = rng.choice(page_keys)
+            else:
+                key = f"{i}-{j}"
+                page_keys.append(key)
+            urls.append(f"{server.base_url}/page/{key}")
+        attachments = [
+            StubAttachment(
+                url=f"{server.base_url}/attachment/{i}-{j}.png",
+                filename="image.png",
+                content_type="image/png",
+                size=server.attachment_size(f"{i}-{j}"),
+            )
+            for j in range(args.attachments)
+        ]
+        content = _text(args.message_chars, f"メッセージ{i}: ")
+        if urls:
+            content += "\n" + "\n".join(urls)
+        messages.append(StubMessage(content, BENCH_CHANNEL_ID, attachments))
+    return messages
+
+
+async def _run_memo_phase(cog, messages: list[StubMessage], concurrency: int) -> dict:
+    from note_writer import note_writer
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def run_one(message: StubMessage):
+        # 受信時刻はワーカーの空き待ちより前にして、MEMO_LATENCY にキューでの待ちを含める
+        # (on_message と同じく、受信時にノート上の位置を確保する)
+        received_at = datetime.now()
+        await cog._reserve_entry(message, received_at)
+        payload = {
+            "channel_id": message.channel.id,
+            "message_id": message.id,
+            "received_at": received_at.isoformat(),
+            "reserved": True,
+        }
+        async with semaphore:
+            cog._pending_messages[message.id] = message
+            started = time.perf_counter()
+            try:
+                await cog._handle_job("memo", payload)
+            except Exception as e:  # noqa: BLE001 - 失敗した件数を集計し、計測は続ける
+                failures.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_one(message) for message in messages))
+    await note_writer.flush()
+    wall = time.perf_counter() - started
+    return {
+        "messages": len(messages),
+        "concurrency": concurrency,
+        "failures": len(failures),
+        "failure_examples": failures[:5],
+        "wall_seconds": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "latency": _summarize_samples(latencies),
+    }
+
+
+def _write_daily_note(day: date, entries: int, entry_chars: int):
+    """要約の対象にする、過去の日付のデイリーノートを作成する"""
+    import config
+    from cogs.memo_handler import get_template
+
+    parts = [get_template(day)]
+    for k in range(entries):
+        minutes = k * 5 % (24 * 60)
+        parts.append(
+            f"\n{minutes // 60:02d}:{minutes % 60:02d}\n"
+            f"{_text(entry_chars, f'エントリ{k}: ')}\n"
+            f"\n> [!info] AI's Small Tip\n> {_text(200)}\n"
+        )
+    path = Path(config.SAVE_DIR) / f"{day.strftime('%Y-%m-%d')}.md"
+    path.write_text("".join(parts), encoding="utf-8")
+
+
+async def _run_summary_phase(summary_cog, args, include_today: bool) -> dict:
+    today = date.today()
+    days = [today - timedelta(days=k) for k in range(1, args.summary_days + 1)]
+    for day in days:
+        _write_daily_note(day, args.summary_entries, args.entry_chars)
+
+    latencies = []
+    failures = []
+    started = time.perf_counter()
+    if include_today:
+        # メモ処理で書き込んだ本日のノートは /today_summary と同じ経路で要約する
+        interaction = StubInteraction()
+        run_started = time.perf_counter()
+        await summary_cog.today_summary.callback(summary_cog, interaction)
+        latencies.append(time.perf_counter() - run_started)
+        result = interaction.sent[-1]
+        if not str(result).endswith("完了しました。"):
+            failures.append(f"{today}: {result}")
+    for day in days:
+        # 夜間のまとめと同じく1日ずつ順に実行する
+        run_started = time.perf_counter()
+        result = await summary_cog._run_summary(day)
+        latencies.append(time.perf_counter() - run_started)
+        if not result.endswith("完了しました。"):
+            failures.append(f"{day}: {result}")
+    wall = time.perf_counter() - started
+    return {
+        "runs": len(latencies),
+        "failures": len(failures),
+        "failure_examples": failures[:5],
+        "wall_seconds": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "latency": _summarize_samples(latencies),
+    }
+
+
+def _format_latency(stats: dict) -> str:
+    if not stats.get("count"):
+        return "記録なし"
+    return (
+        f"p50 {stats['p50']:.3f}s / p95 {stats['p95']:.3f}s / "
+        f"p99 {stats['p99']:.3f}s / max {stats['max']:.3f}s (n={stats['count']})"
+    )
+
+
+def _print_report(result: dict):
+    memo = result.get("memo")
+    if memo:
+        print(
+            f"\n== メモ処理: {memo['messages']} 件 (並行 {memo['concurrency']}) ==\n"
+            f"{memo['wall_seconds']:.2f}s, {memo['throughput']:.2f} 件/s, "
+            f"失敗 {memo['failures']} 件\n"
+            f"1件あたり {_format_latency(memo['latency'])}"
+        )
+    summary = result.get("summary")
+    if summary:
+        print(
+            f"\n== まとめ生成: {summary['runs']} 日分 ==\n"
+            f"{summary['wall_seconds']:.2f}s, 失敗 {summary['failures']} 件\n"
+            f"1日あたり {_format_latency(summary['latency'])}"
+        )
+    for phase in (memo, summary):
+        for example in (phase or {}).get("failure_examples", []):
+            print(f"  失敗の例: {example}")
+
+    print("\n== 処理ごとの内訳 ==")
+    width = max((len(name) for name in result["stages"]), default=0)
+    for name, stats in result["stages"].items():
+        print(f"{name:<{width}}  {_format_latency(stats)}")
+
+    calls = ", ".join(f"{m} {n}" for m, n in sorted(result["gemini_calls"].items()))
+    print(f"\nGemini呼び出し: {calls or 'なし'}")
+
+
+def _print_comparison(result: dict, baseline: dict):
+    """基準の結果 (--json で保存したもの) との差を表示する"""
+
+    def change(before, after) -> str:
+        if not before:
+            return f"{after:.3f}"
+        return f"{before:.3f} -> {after:.3f} ({(after - before) / before:+.1%})"
+
+    print("\n== 基準との比較 ==")
+    for phase in ("memo", "summary"):
+        if result.get(phase) and baseline.get(phase):
+            print(
+                f"{phase} スループット "
+                f"{change(baseline[phase]['throughput'], result[phase]['throughput'])}"
+            )
+            for q in ("p50", "p95", "p99"):
+                before = baseline[phase]["latency"].get(q)
+                after = result[phase]["latency"].get(q)
+                if after is not None:
+                    print(f"{phase} {q} {change(before, after)}")
+    for name, stats in result["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if before and before.get("count") and stats.get("count"):
+            print(
+                f"{name} p50 {change(before['p50'], stats['p50'])}, "
+                f"p95 {change(before['p95'], stats['p95'])}"
+            )
+
+
+async def _run(args) -> dict:
+    # 設定を差し替えた後に読み込む
+    import ai_summarizer
+    import config
+    import metrics
+    from cogs.memo_handler import MemoHandler
+    from cogs.summary_cog import SummaryCog
+
+    recorder = SampleRecorder(
+        value
+        for value in vars(metrics).values()
+        if isinstance(value, metrics.Histogram)
+    )
+    fake_client = FakeGeminiClient(
+        parse_latency_profiles(args.latency),
+        rate_limit_rate=args.rate_limit_rate,
+        server_error_rate=args.server_error_rate,
+        output_chars=args.output_chars,
+        seed=args.seed,
+    )
+    ai_summarizer.client = fake_client
+
+    server = FixtureServer(
+        latency=args.http_latency,
+        page_bytes=args.page_bytes,
+        image_size=(args.image_width, args.image_height),
+        seed=args.seed,
+    )
+    await server.start()
+    bot = StubBot()
+    memo_cog = MemoHandler(bot)
+    await memo_cog.cog_load()
+    summary_cog = SummaryCog(bot)
+    # 夜間のまとめと定期スキャンのループは使わない
+    summary_cog.cog_unload()
+    result = {"config": vars(args)}
+    try:
+        if args.messages:
+            messages = _make_messages(args, server)
+            result["memo"] = await _run_memo_phase(
+                memo_cog, messages, args.concurrency or config.JOB_WORKERS
+            )
+        if args.summary_days or args.messages:
+            result["summary"] = await _run_summary_phase(
+                summary_cog, args, include_today=bool(args.messages)
+            )
+    finally:
+        await memo_cog.cog_unload()
+        await server.close()
+    result["stages"] = recorder.report()
+    result["gemini_calls"] = dict(fake_client.calls)
+    return result
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Discord・Gemini APIを使わずに、メモ処理とまとめ生成の性能を測ります。"
+    )
+    group = parser.add_argument_group("メモ処理")
+    group.add_argument("--messages", type=int, default=100, help="処理するメッセージ数")
+    group.add_argument(
+        "--concurrency",
+        type=int,
+        default=0,
+        help="同時に処理するメッセージ数 (0 で JOB_WORKERS と同じ)",
+    )
+    group.add_argument("--urls", type=int, default=1, help="1件あたりのURLの数")
+    group.add_argument(
+        "--url-reuse",
+        type=float,
+        default=0.0,
+        help="以前のメッセージと同じURLにする割合 (URLキャッシュのヒット)",
+    )
+    group.add_argument(
+        "--attachments", type=int, default=1, help="1件あたりの添付画像の数"
+    )
+    group.add_argument(
+        "--message-chars", type=int, default=200, help="メッセージ本文の文字数"
+    )
+
+    group = parser.add_argument_group("まとめ生成")
+    group.add_argument(
+        "--summary-days",
+        type=int,
+        default=3,
+        help="要約する過去の日数 (メモ処理を行った場合は本日分も要約する)",
+    )
+    group.add_argument(
+        "--summary-entries", type=int, default=200, help="1日あたりのエントリ数"
+    )
+    group.add_argument(
+        "--entry-chars", type=int, default=100, help="エントリ本文の文字数"
+    )
+
+    group = parser.add_argument_group("Geminiの模擬")
+    group.add_argument(
+        "--latency",
+        default=DEFAULT_LATENCY,
+        help="モデルごとの応答時間 (model=最初の断片までの秒数:ばらつき:トークン/秒,...)",
+    )
+    group.add_argument(
+        "--rate-limit-rate", type=float, default=0.0, help="HTTP 429 を返す割合"
+    )
+    group.add_argument(
+        "--server-error-rate", type=float, default=0.0, help="HTTP 500 を返す割合"
+    )
+    group.add_argument(
+        "--output-chars", type=int, default=400, help="補足などの応答の文字数"
+    )
+    group.add_argument(
+        "--rate-limits",
+        default="",
+        help="GEMINI_RATE_LIMITS の値 (既定は制限なし、'config' で .env の設定を使う)",
+    )
+
+    group = parser.add_argument_group("HTTPの模擬")
+    group.add_argument(
+        "--http-latency",
+        type=float,
+        default=0.05,
+        help="ページと画像の応答時間の中央値 (秒)",
+    )
+    group.add_argument(
+        "--page-bytes", type=int, default=64 * 1024, help="HTMLページの大きさ"
+    )
+    group.add_argument("--image-width", type=int, default=1600)
+    group.add_argument("--image-height", type=int, default=1200)
+
+    group = parser.add_argument_group("その他")
+    group.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="設定 (config.py の環境変数) を上書きする。複数指定できる",
+    )
+    group.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    group.add_argument("--log-level", default="ERROR", help="Botのログレベル")
+    group.add_argument("--json", help="結果をJSONで保存するファイル")
+    group.add_argument("--compare", help="比較する基準の結果 (--json で保存したもの)")
+    group.add_argument(
+        "--keep",
+        action="store_true",
+        help="ノートなどを書き込んだ一時ディレクトリを残す",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    cwd = os.getcwd()
+    json_path = os.path.abspath(args.json) if args.json else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    workdir = _prepare_environment(args)
+    try:
+        result = asyncio.run(_run(args))
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"作業ディレクトリ: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    _print_report(result)
+    if compare_path:
+        with open(compare_path, encoding="utf-8") as f:
+            _print_comparison(result, json.load(f))
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
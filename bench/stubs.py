@@ -0,0 +1,92 @@
+import itertools
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+
+_ids = itertools.count(1_000_000)
+
+
+@dataclass
+class StubAttachment:
+    """discord.Attachment のうち、メモ処理が使う属性だけを持つ"""
+
+    url: str
+    filename: str
+    content_type: str
+    size: int
+
+
+@dataclass
+class StubAuthor:
+    name: str = "bench-user"
+    display_name: str = "bench-user"
+
+
+@dataclass
+class StubMessage:
+    """discord.Message のうち、メモ処理が使う属性だけを持つ"""
+
+    content: str
+    channel_id: int
+    attachments: list[StubAttachment] = field(default_factory=list)
+    author: StubAuthor = field(default_factory=StubAuthor)
+    id: int = field(default_factory=lambda: next(_ids))
+
+    @property
+    def channel(self):
+        return SimpleNamespace(id=self.channel_id)
+
+
+class StubWebhookMessage:
+    """followup.send(wait=True) が返すメッセージ (編集内容を保持する)"""
+
+    def __init__(self, content: str):
+        self.content = content
+
+    async def edit(self, content: str | None = None, **kwargs):
+        if content is not None:
+            self.content = content
+
+
+class _StubResponse:
+    def __init__(self, interaction: "StubInteraction"):
+        self._interaction = interaction
+
+    async def defer(self, **kwargs):
+        self._interaction.deferred = True
+
+    async def send_message(self, content: str | None = None, **kwargs):
+        self._interaction.sent.append(content or kwargs.get("embed"))
+
+
+class _StubFollowup:
+    def __init__(self, interaction: "StubInteraction"):
+        self._interaction = interaction
+
+    async def send(self, content: str | None = None, wait: bool = False, **kwargs):
+        self._interaction.sent.append(content or kwargs.get("embed"))
+        return StubWebhookMessage(content or "")
+
+
+class StubInteraction:
+    """discord.Interaction の代わり。送信した内容を sent に記録する"""
+
+    def __init__(self, user=None):
+        self.user = user or StubAuthor()
+        self.deferred = False
+        self.sent: list = []
+        self.response = _StubResponse(self)
+        self.followup = _StubFollowup(self)
+
+
+class StubBot:
+    """Cogの初期化に必要な最小限の commands.Bot の代わり"""
+
+    def __init__(self):
+        self.user = StubAuthor(name="bench-bot", display_name="bench-bot")
+        self.tree = SimpleNamespace(add_command=lambda command: None)
+
+    async def is_owner(self, user) -> bool:
+        return True
+
+    def get_channel(self, channel_id: int):
+        return None
@@ -1,20 +1,46 @@
+import asyncio
 import discord
+import hashlib
 from discord.ext import commands
 import os
 import re
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
 import config
 import aiohttp
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
 from logger_config import logger
+from http_client import create_http_session
+from html_metadata import fetch_page_metadata
+from url_cache import UrlCacheEntry, UrlMetadataCache
+from metrics import (
+    JOB_QUEUE_JOBS,
+    MEMO_LATENCY,
+    MEMO_PROCESS,
+    THUMBNAIL_BYTES,
+    THUMBNAIL_DOWNLOAD,
+    URL_FETCH,
+    registry,
+)
+from attachment_store import AttachmentStore
+from thumbnails import thumbnail_transcoder
+from note_writer import note_writer
+from rolling_digest import rolling_digest
+from search_index import search_index
+from vault_index import KIND_DAILY
+from memo_text import AI_TIP_HEADER, URL_SUMMARY_HEADER, placeholder
+from job_queue import JobQueue, PermanentJobError
+from gemini_scheduler import PRIORITY_INTERACTIVE
+from supplement_batcher import SupplementBatcher
+from topic_prefetch import TopicPrefetcher
 from discord import app_commands, Interaction, Message, SelectOption
 from discord.ui import Select, View
 from ai_summarizer import (
+    enrich_message,
     generate_flash_supplement,
-    extract_topics,
     generate_topic_summary,
+    stream_topic_summary,
 )
+from discord_stream import StreamingFollowup
 
 
 def get_template(date_obj):
@@ -33,97 +59,279 @@ def get_template(date_obj):
 """
 
 
-async def get_url_summary(url):
-    """URLからタイトル、description、og:imageを取得する"""
-    logger.debug(f"Attempting to fetch URL: {url}")
+def _daily_note_path(date_obj) -> str:
+    return os.path.join(config.SAVE_DIR, f"{date_obj.strftime('%Y-%m-%d')}.md")
+
+
+async def append_to_daily_note(date_obj, content: str):
+    """デイリーノートにエントリを追記する (必要ならテンプレートを作成し、ダイジェストと検索インデックスも更新する)"""
+    await note_writer.append(
+        _daily_note_path(date_obj), content, template=get_template(date_obj)
+    )
+    await _index_daily_entry(date_obj, content)
+
+
+async def _index_daily_entry(date_obj, content: str):
+    """デイリーノートに書き込んだエントリを、ダイジェストと検索インデックスに反映する"""
+    date_str = date_obj.strftime("%Y-%m-%d")
+    file_path = _daily_note_path(date_obj)
+    if config.ROLLING_DIGEST_ENABLED:
+        await rolling_digest.add_entry(date_str, content)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                logger.debug(f"URL: {url}, Status: {response.status}")
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-                    title = soup.title.string if soup.title else "タイトルなし"
-                    description_tag = soup.find("meta", attrs={"name": "description"})
-                    description = (
-                        description_tag["content"] if description_tag else "説明文なし"
-                    )
+        await search_index.add_entry(file_path, KIND_DAILY, date_str, content)
+    except Exception as e:  # noqa: BLE001 - 下記のとおり、追記の成否には影響させない
+        # 検索インデックスは定期的な同期でも更新されるため、失敗してもメモの追記は続行する
+        logger.error(f"Failed to index entry for {date_str}: {e}")
 
-                    og_image_url = None
-                    og_image_tag = soup.find("meta", property="og:image")
-                    if og_image_tag and "content" in og_image_tag.attrs:
-                        og_image_url = og_image_tag["content"]
-                        logger.debug(f"Extracted og:image: {og_image_url}")
 
-                    logger.debug(
-                        f"Extracted Title: {title.strip()}, Description: {description.strip()}"
-                    )
-                    return (
-                        f"タイトル: {title.strip()}\n説明: {description.strip()}",
+URL_PATTERN = re.compile(r"https?://\S+")
+
+
+def _entry_header(received_at: datetime, content: str) -> str:
+    """エントリの先頭 (時刻行と本文)"""
+    return f"\n{received_at.strftime('%H:%M')}\n{content}\n"
+
+
+def _format_tip(supplement: str) -> str:
+    """AIによる補足の引用ブロック (前の空行なし)"""
+    return f"{AI_TIP_HEADER}\n> {supplement.replace('\n', '\n> ')}\n"
+
+
+@dataclass
+class UrlPreview:
+    """メッセージ内の1つのURLについて取得できた概要とサムネイル"""
+
+    url: str
+    summary: str | None = None
+    thumbnail: str | None = None
+
+
+def _format_url_summary(title: str | None, description: str | None) -> str:
+    title = (title or "タイトルなし").strip()
+    description = (description or "説明文なし").strip()
+    return f"タイトル: {title}\n説明: {description}"
+
+
+async def get_url_summary(
+    session: aiohttp.ClientSession, url, cache: UrlMetadataCache | None = None
+):
+    """URLからタイトル、description、og:imageを取得する (キャッシュがあれば利用する)"""
+    with URL_FETCH.timer(outcome="fetched") as labels:
+        return await _fetch_url_summary(session, url, cache, labels)
+
+
+async def _fetch_url_summary(
+    session: aiohttp.ClientSession,
+    url,
+    cache: UrlMetadataCache | None,
+    labels: dict[str, str],
+):
+    entry = await cache.get(url) if cache else None
+    if entry and entry.is_fresh():
+        logger.debug(f"URL cache hit: {url}")
+        labels["outcome"] = "cache_hit"
+        return _format_url_summary(entry.title, entry.description), entry.image_url
+    if entry and entry.in_backoff():
+        logger.debug(f"URL fetch is backing off after a failure: {url}")
+        return _failed(entry, entry.error_message, labels, "backoff")
+
+    # 期限切れでも検証子があれば条件付きリクエストで再検証する
+    headers = entry.conditional_headers() if entry and entry.has_metadata else {}
+    logger.debug(f"Attempting to fetch URL: {url}")
+    try:
+        async with session.get(url, headers=headers) as response:
+            logger.debug(f"URL: {url}, Status: {response.status}")
+            if response.status == 304 and headers:
+                logger.debug(f"URL not modified, reusing cached metadata: {url}")
+                labels["outcome"] = "not_modified"
+                await cache.refresh(url)
+                return (
+                    _format_url_summary(entry.title, entry.description),
+                    entry.image_url,
+                )
+            if response.status == 200:
+                metadata = await fetch_page_metadata(
+                    response, config.URL_METADATA_MAX_BYTES
+                )
+                og_image_url = metadata.image_url
+                if og_image_url:
+                    logger.debug(f"Extracted og:image: {og_image_url}")
+
+                logger.debug(
+                    f"Extracted Title: {metadata.title}, Description: {metadata.description}"
+                )
+                if cache:
+                    await cache.put(
+                        url,
+                        metadata.title,
+                        metadata.description,
                         og_image_url,
+                        etag=response.headers.get("ETag"),
+                        last_modified=response.headers.get("Last-Modified"),
                     )
-                else:
-                    return (
-                        f"ページの取得に失敗しました。ステータスコード: {response.status}",
-                        None,
-                    )
+                return (
+                    _format_url_summary(metadata.title, metadata.description),
+                    og_image_url,
+                )
+            else:
+                message = (
+                    f"ページの取得に失敗しました。ステータスコード: {response.status}"
+                )
+                if cache and response.status >= 400:
+                    await cache.put_error(url, message)
+                return _failed(entry, message, labels, "http_error")
+    except TimeoutError:
+        logger.error(f"Timed out fetching URL {url}")
+        message = "URLの取得がタイムアウトしました。"
+        if cache:
+            await cache.put_error(url, message)
+        return _failed(entry, message, labels, "timeout")
     except aiohttp.ClientError as e:
         logger.error(f"aiohttp ClientError fetching URL {url}: {e}")
-        return "URLの取得中にネットワークエラーが発生しました。", None
+        message = "URLの取得中にネットワークエラーが発生しました。"
+        if cache:
+            await cache.put_error(url, message)
+        return _failed(entry, message, labels, "network_error")
     except Exception as e:
         logger.error(f"Unexpected error fetching or parsing URL {url}: {e}")
+        labels["outcome"] = "error"
         return "URLの処理中に予期せぬエラーが発生しました。", None
 
 
-async def download_thumbnail(url, base_filename):
-    """指定されたURLから画像をダウンロードし、適切な拡張子で保存する"""
+def _failed(
+    entry: UrlCacheEntry | None,
+    message: str,
+    labels: dict[str, str],
+    outcome: str,
+) -> tuple[str, str | None]:
+    """取得できなかったURLの結果 (前回取得したメタデータがあれば期限切れでもそれを使う)"""
+    if entry and entry.has_metadata:
+        labels["outcome"] = "stale"
+        return _format_url_summary(entry.title, entry.description), entry.image_url
+    labels["outcome"] = outcome
+    return message, None
+
+
+async def _read_limited(
+    response: aiohttp.ClientResponse, max_bytes: int
+) -> bytes | None:
+    """レスポンス本文をチャンク単位で読み込みます。上限を超えた場合は None を返します。"""
+    if response.content_length is not None and response.content_length > max_bytes:
+        return None
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(64 * 1024):
+        body += chunk
+        if len(body) > max_bytes:
+            return None
+    return bytes(body)
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def download_thumbnail(session: aiohttp.ClientSession, url, base_filename):
+    """
+    指定されたURLから画像をダウンロードし、縮小・再エンコードして保存する
+
+    変換はプロセスプールで行います。デコードできない画像は受け取ったまま保存します。
+    """
+    with THUMBNAIL_DOWNLOAD.timer(outcome="saved") as labels:
+        return await _download_thumbnail(session, url, base_filename, labels)
+
+
+async def _download_thumbnail(
+    session: aiohttp.ClientSession, url, base_filename, labels: dict[str, str]
+):
+    labels["outcome"] = "skipped"
     logger.debug(f"Attempting to download thumbnail from: {url}")
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    content_type = response.headers.get("Content-Type", "")
-                    if "image/" in content_type:
-                        # Content-Typeから適切な拡張子を決定
-                        if "image/jpeg" in content_type:
-                            ext = ".jpg"
-                        elif "image/png" in content_type:
-                            ext = ".png"
-                        elif "image/gif" in content_type:
-                            ext = ".gif"
-                        elif "image/webp" in content_type:
-                            ext = ".webp"
-                        else:
-                            logger.debug(
-                                f"Unsupported image content type: {content_type}"
-                            )
-                            return None
-
-                        filename = f"{base_filename}{ext}"
-                        save_path = os.path.join(config.IMAGE_SAVE_DIR, filename)
-                        with open(save_path, "wb") as f:
-                            f.write(await response.read())
-                        logger.debug(f"Saved thumbnail: {save_path}")
-                        return filename
+        async with session.get(url) as response:
+            if response.status == 200:
+                content_type = response.headers.get("Content-Type", "")
+                if "image/" in content_type:
+                    # Content-Typeから適切な拡張子を決定
+                    if "image/jpeg" in content_type:
+                        ext = ".jpg"
+                    elif "image/png" in content_type:
+                        ext = ".png"
+                    elif "image/gif" in content_type:
+                        ext = ".gif"
+                    elif "image/webp" in content_type:
+                        ext = ".webp"
                     else:
-                        logger.debug(f"URL content is not an image: {content_type}")
+                        logger.debug(f"Unsupported image content type: {content_type}")
                         return None
-                else:
-                    logger.error(
-                        f"Failed to download thumbnail from {url}. Status: {response.status}"
+
+                    data = await _read_limited(
+                        response, config.THUMBNAIL_MAX_DOWNLOAD_BYTES
                     )
+                    if data is None:
+                        logger.info(
+                            f"Thumbnail exceeds {config.THUMBNAIL_MAX_DOWNLOAD_BYTES} bytes: {url}"
+                        )
+                        return None
+                else:
+                    logger.debug(f"URL content is not an image: {content_type}")
                     return None
+            else:
+                logger.error(
+                    f"Failed to download thumbnail from {url}. Status: {response.status}"
+                )
+                labels["outcome"] = "http_error"
+                return None
+    except TimeoutError:
+        logger.error(f"Timed out downloading thumbnail {url}")
+        labels["outcome"] = "timeout"
+        return None
     except aiohttp.ClientError as e:
         logger.error(f"aiohttp ClientError downloading thumbnail {url}: {e}")
+        labels["outcome"] = "network_error"
         return None
     except Exception as e:
         logger.error(f"Unexpected error downloading thumbnail {url}: {e}")
+        labels["outcome"] = "error"
         return None
 
+    THUMBNAIL_BYTES.inc(len(data), stage="downloaded")
+
+    if config.THUMBNAIL_TRANSCODE_ENABLED:
+        try:
+            transcoded, transcoded_ext = await thumbnail_transcoder.transcode(data)
+            logger.debug(
+                f"Transcoded thumbnail {url}: {len(data)} -> {len(transcoded)} bytes"
+            )
+            data, ext = transcoded, transcoded_ext
+        except Exception as e:  # noqa: BLE001 - 変換できなければ受け取ったまま保存する
+            logger.warning(f"Failed to transcode thumbnail {url}, saving as is: {e}")
+
+    filename = f"{base_filename}{ext}"
+    save_path = os.path.join(config.IMAGE_SAVE_DIR, filename)
+    await asyncio.to_thread(_write_bytes, save_path, data)
+    THUMBNAIL_BYTES.inc(len(data), stage="stored")
+    labels["outcome"] = "saved"
+    logger.debug(f"Saved thumbnail: {save_path}")
+    return filename
+
 
 class MemoHandler(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # URLプレビューとサムネイル取得で共有するHTTPセッション (cog_loadで作成)
+        self.http_session: aiohttp.ClientSession | None = None
+        self.url_cache = UrlMetadataCache()
+        # 添付画像の保存 (内容のハッシュで重複を除く)
+        self.attachment_store = AttachmentStore()
+        # on_message はジョブを記録してすぐ戻り、メモ処理はワーカーが行う
+        self.job_queue = JobQueue(self._handle_job)
+        registry.add_collector(self._collect_metrics)
+        # ジョブ投入時点のMessageを保持し、ワーカーでの再取得を省く (再起動後は再取得する)
+        self._pending_messages: dict[int, Message] = {}
+        # 補足生成のマイクロバッチ (SUPPLEMENT_BATCH_ENABLED が有効な場合のみ使用)
+        self.supplement_batcher = SupplementBatcher()
+        # コンテキストメニュー用の話題の先行抽出 (TOPIC_PREFETCH_ENABLED が有効な場合に受信時に開始)
+        self.topic_prefetcher = TopicPrefetcher()
         self.add_to_memo_context_menu = app_commands.ContextMenu(
             name="メモに追加",
             callback=self.add_to_memo_callback,
@@ -148,74 +356,289 @@ class MemoHandler(commands.Cog):
                 os.makedirs(dir_path)
                 logger.info(f"Created directory: {dir_path}")
 
-    async def process_message_for_memo(self, message: Message, force_add: bool = False):
-        """メッセージを処理してメモファイルに追記する共通ロジック"""
+    async def cog_load(self):
+        self.http_session = create_http_session()
+        if config.THUMBNAIL_TRANSCODE_ENABLED:
+            await thumbnail_transcoder.start()
+        await self.job_queue.start()
+
+    async def cog_unload(self):
+        registry.remove_collector(self._collect_metrics)
+        await self.job_queue.stop()
+        self.topic_prefetcher.close()
+        thumbnail_transcoder.shutdown()
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
+            logger.info("Closed shared HTTP session")
+        self.http_session = None
+        self.url_cache.close()
+        self.attachment_store.close()
+        await note_writer.flush()
+
+    async def _collect_metrics(self):
+        """ジョブキューの未処理・デッドレターの件数をメトリクスに反映する"""
+        JOB_QUEUE_JOBS.set(await self.job_queue.pending_count(), status="pending")
+        JOB_QUEUE_JOBS.set(await self.job_queue.dead_count(), status="dead")
+
+    async def _get_thumbnail(self, page_url: str, og_image_url: str):
+        """ページのサムネイルを取得する (保存済みであればダウンロードしない)"""
+        entry = await self.url_cache.get(page_url)
+        if (
+            entry
+            and entry.thumbnail
+            and os.path.exists(os.path.join(config.IMAGE_SAVE_DIR, entry.thumbnail))
+        ):
+            logger.debug(f"Reusing cached thumbnail: {entry.thumbnail}")
+            return entry.thumbnail
+
+        hash_object = hashlib.md5(og_image_url.encode())
+        base_thumbnail_filename = f"thumbnail_{hash_object.hexdigest()}"
+        downloaded_filename = await download_thumbnail(
+            self.http_session, og_image_url, base_thumbnail_filename
+        )
+        if downloaded_filename:
+            await self.url_cache.set_thumbnail(page_url, downloaded_filename)
+        return downloaded_filename
+
+    async def _resolve_url(self, preview: UrlPreview):
+        """
+        URLの概要とサムネイルを取得し、preview に順に書き込む
+
+        キャッシュに前回の og:image があれば、ページの取得 (再検証) と並行してサムネイルも取得します。
+        締め切りで取り消された場合でも、それまでに書き込んだ結果は使われます。
+        """
+        url = preview.url
+        logger.debug(f"URL detected: {url}")
+        entry = await self.url_cache.get(url)
+        cached_image_url = entry.image_url if entry and entry.has_metadata else None
+        thumbnail_task = None
+        if cached_image_url:
+            thumbnail_task = asyncio.create_task(
+                self._get_thumbnail(url, cached_image_url)
+            )
+        try:
+            summary, og_image_url = await get_url_summary(
+                self.http_session, url, self.url_cache
+            )
+            preview.summary = summary
+            if thumbnail_task and og_image_url != cached_image_url:
+                # og:image が変わっていたら先行して取得したサムネイルは使わない
+                thumbnail_task.cancel()
+                thumbnail_task = None
+            if og_image_url and thumbnail_task is None:
+                thumbnail_task = asyncio.create_task(
+                    self._get_thumbnail(url, og_image_url)
+                )
+            if thumbnail_task:
+                preview.thumbnail = await thumbnail_task
+        finally:
+            if thumbnail_task and not thumbnail_task.done():
+                thumbnail_task.cancel()
+
+    async def _resolve_urls(self, urls: list[str]) -> list[UrlPreview]:
+        """
+        メッセージ内のすべてのURLを並行して処理し、元の順序で結果を返す
+
+        全体で URL_PROCESSING_DEADLINE 秒を過ぎた処理は取り消し、
+        概要が得られなかったURLはタイムアウトとして扱います。
+        """
+        previews = [UrlPreview(url) for url in urls]
+        if not previews:
+            return []
+        tasks = [asyncio.create_task(self._resolve_url(p)) for p in previews]
+        done, pending = await asyncio.wait(
+            tasks, timeout=config.URL_PROCESSING_DEADLINE
+        )
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(
+                f"URL processing deadline exceeded for {len(pending)} of {len(urls)} URL(s)"
+            )
+            await asyncio.gather(*pending, return_exceptions=True)
+        for preview, task in zip(previews, tasks):
+            if task in done and task.exception() is not None:
+                logger.error(f"Failed to process URL {preview.url}: {task.exception()}")
+            if preview.summary is None:
+                preview.summary = (
+                    "URLの取得がタイムアウトしました。"
+                    if task in pending
+                    else "URLの処理中に予期せぬエラーが発生しました。"
+                )
+        return previews
+
+    async def _handle_job(self, kind: str, payload: dict):
+        """ジョブキューのワーカーから呼ばれる処理"""
+        if kind == "tip":
+            await self._fill_tip(payload)
+            return
+        if kind != "memo":
+            raise PermanentJobError(f"Unknown job kind: {kind}")
+
+        message_id = payload["message_id"]
+        message = self._pending_messages.pop(message_id, None)
+        if message is None:
+            message = await self._fetch_message(payload["channel_id"], message_id)
+        received_at = datetime.fromisoformat(payload["received_at"])
+        with MEMO_PROCESS.timer(outcome="ok"):
+            await self.process_message_for_memo(
+                message,
+                received_at=received_at,
+                reserved=payload.get("reserved", False),
+            )
+        # 受信から書き込みまで (キューでの待ちと再試行を含む)
+        MEMO_LATENCY.observe((datetime.now() - received_at).total_seconds())
+
+    async def _fill_tip(self, payload: dict):
+        """補足の生成に失敗したエントリへ、後から補足を書き込む (失敗したらジョブごと再試行)"""
+        message_id = payload["message_id"]
+        supplement = await self._generate_supplement(
+            message_id, payload["content"], payload.get("url_summary")
+        )
+        file_path = _daily_note_path(date.fromisoformat(payload["date"]))
+        if await note_writer.replace_once(
+            file_path, f"{placeholder('tip', message_id)}\n", _format_tip(supplement)
+        ):
+            logger.info(
+                f"Added deferred AI tip for message {message_id} to {file_path}"
+            )
+        else:
+            # 既に書き込み済みか、ノートが手で編集されてプレースホルダーが消えている
+            logger.info(
+                f"No AI tip placeholder for message {message_id} in {file_path}"
+            )
+
+    async def _fetch_message(self, channel_id: int, message_id: int) -> Message:
+        """再起動後のジョブ再実行のために、IDからメッセージを取得する"""
+        try:
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(
+                channel_id
+            )
+            return await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden) as e:
+            raise PermanentJobError(f"Message {message_id} is unavailable: {e}")
+
+    async def process_message_for_memo(
+        self,
+        message: Message,
+        force_add: bool = False,
+        received_at: datetime | None = None,
+        reserved: bool = False,
+    ):
+        """
+        メッセージを処理してメモファイルに追記する共通ロジック
+
+        reserved の場合は、受信時に _reserve_entry で確保した位置 (本文の直後) に
+        URLの概要・画像・補足を書き込みます。ワーカーの並行処理や再試行で処理の完了順が
+        前後しても、ノート上のエントリは投稿順に並びます。
+        補足の生成 (Gemini) に失敗した場合は、補足の位置にプレースホルダーを置いて追記し、
+        補足は "tip" ジョブとしてバックオフ付きで再試行します (メモ自体の追記は遅らせない)。
+        """
         if not force_add and message.channel.id != config.CHANNEL_ID:
             logger.debug(f"Message is not in target channel: {message.channel.id}")
             return
 
-        today = datetime.now().date()
+        # キュー経由の場合は受信時刻を基準にする (処理が遅れても日付と時刻がずれない)
+        received_at = received_at or datetime.now()
+        today = received_at.date()
         file_name = f"{today.strftime('%Y-%m-%d')}.md"
-        file_path = os.path.join(config.SAVE_DIR, file_name)
 
-        if not os.path.exists(file_path):
-            template = get_template(today)
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(template)
+        entry_header = _entry_header(received_at, message.content)
+        # 本文の後ろに続くブロック (画像・URLの概要・補足)
+        content_to_append = ""
 
-        timestamp = datetime.now().strftime("%H:%M")
-        content_to_append = f"\n{timestamp}\n{message.content}\n"
-
-        # 添付画像を保存してリンクを追記
-        if message.attachments:
-            logger.debug("Message has attachments.")
-            for attachment in message.attachments:
-                if attachment.content_type and attachment.content_type.startswith(
-                    "image/"
-                ):
-                    save_path = os.path.join(config.IMAGE_SAVE_DIR, attachment.filename)
-                    await attachment.save(save_path)
-                    content_to_append += f"\n![[{attachment.filename}]]\n"
-                    logger.debug(f"Saved image: {save_path}")
-
-        # URLを検出して要約とサムネイルを追加
-        url_match = re.search(r"https?://\S+", message.content)
-        url_summary = None
-        if url_match:
-            url = url_match.group(0)
-            logger.debug(f"URL detected: {url}")
-            summary, og_image_url = await get_url_summary(url)
-            url_summary = summary  # 概要を保存
-            content_to_append += f"\n> URLの概要:\n> {summary.replace('\n', '\n> ')}\n"
-
-            if og_image_url:
-                import hashlib
-
-                parsed_url = urlparse(og_image_url)
-                path_parts = parsed_url.path.split("/")
-                original_filename = path_parts[-1] if path_parts[-1] else "image"
-                os.path.splitext(original_filename)[1] or ".png"
-                hash_object = hashlib.md5(og_image_url.encode())
-                base_thumbnail_filename = f"thumbnail_{hash_object.hexdigest()}"
-                downloaded_filename = await download_thumbnail(
-                    og_image_url, base_thumbnail_filename
-                )
-                if downloaded_filename:
-                    content_to_append += f"\n![[{downloaded_filename}]]\n"
-        else:
+        # 添付画像の保存とURLの概要・サムネイルの取得を並行して行う
+        urls = list(dict.fromkeys(URL_PATTERN.findall(message.content)))
+        if not urls:
             logger.debug(f"No URL detected in message: {message.content}")
+        urls_task = asyncio.create_task(self._resolve_urls(urls))
+        try:
+            if message.attachments:
+                logger.debug("Message has attachments.")
+                # 同じ内容の画像は既存のファイルを参照する
+                stored = await self.attachment_store.save_all(
+                    self.http_session, message.attachments
+                )
+                for filename in dict.fromkeys(item.filename for item in stored):
+                    content_to_append += f"\n![[{filename}]]\n"
+        except BaseException:
+            # 添付の保存に失敗したらジョブごと再試行されるため、URLの処理も打ち切る
+            urls_task.cancel()
+            raise
+
+        # URLの要約とサムネイルを元の順序で追加
+        previews = await urls_task
+        for preview in previews:
+            # 見出しは compact_memo が認識できるよう、URLが複数でも同じ書き出しにする
+            heading = (
+                URL_SUMMARY_HEADER
+                if len(previews) == 1
+                else f"{URL_SUMMARY_HEADER} {preview.url}"
+            )
+            content_to_append += (
+                f"\n{heading}\n> {preview.summary.replace('\n', '\n> ')}\n"
+            )
+            if preview.thumbnail:
+                content_to_append += f"\n![[{preview.thumbnail}]]\n"
+        url_summary = "\n\n".join(p.summary for p in previews) or None
 
         # AIによる補足を生成
-        supplement = generate_flash_supplement(message.content, url_summary=url_summary)
-        content_to_append += (
-            f"\n> [!info] AI's Small Tip\n> {supplement.replace('\n', '\n> ')}\n"
-        )
-
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(content_to_append)
+        try:
+            supplement = await self._generate_supplement(
+                message.id, message.content, url_summary
+            )
+        except Exception as e:  # noqa: BLE001 - 補足は後から再試行し、メモの追記は続ける
+            logger.warning(f"Deferring AI tip for message {message.id}: {e}")
+            supplement = None
+            content_to_append += f"\n{placeholder('tip', message.id)}\n"
+        else:
+            content_to_append += f"\n{_format_tip(supplement)}"
+
+        if reserved:
+            if not await note_writer.replace_once(
+                _daily_note_path(today),
+                f"{placeholder('memo', message.id)}\n",
+                content_to_append,
+            ):
+                # 前回の実行で書き込み済み (書き込み後、ジョブの完了前に停止した場合など)
+                logger.info(f"Entry for message {message.id} is already in {file_name}")
+                return
+            await _index_daily_entry(today, entry_header + content_to_append)
+        else:
+            await append_to_daily_note(today, entry_header + content_to_append)
         logger.info(
             f"Appended message from {message.author.display_name} to {file_name}"
         )
+        if supplement is None:
+            await self.job_queue.enqueue(
+                "tip",
+                {
+                    "date": today.strftime("%Y-%m-%d"),
+                    "message_id": message.id,
+                    "content": message.content,
+                    "url_summary": url_summary,
+                },
+            )
+
+    async def _generate_supplement(
+        self, message_id: int, content: str, url_summary: str | None
+    ) -> str:
+        """設定に応じた方法で補足を生成する (失敗した場合は例外を送出する)"""
+        if config.MESSAGE_ENRICHMENT_ENABLED:
+            # 補足と話題を1回の呼び出しで生成し、話題はコンテキストメニュー用に保持する
+            enrichment = await enrich_message(content, url_summary=url_summary)
+            if enrichment.topics or enrichment.key_terms:
+                self.topic_prefetcher.put(
+                    message_id,
+                    content,
+                    list(dict.fromkeys(enrichment.topics + enrichment.key_terms)),
+                )
+            return enrichment.tip
+        if config.SUPPLEMENT_BATCH_ENABLED:
+            return await self.supplement_batcher.submit(
+                content, url_summary=url_summary
+            )
+        return await generate_flash_supplement(content, url_summary=url_summary)
 
     @commands.Cog.listener()
     async def on_message(self, message: Message):
@@ -223,8 +646,54 @@ class MemoHandler(commands.Cog):
         if message.author == self.bot.user:
             return
 
+        if message.channel.id != config.CHANNEL_ID:
+            return
+
         logger.debug(f"Message received from {message.author}: {message.content}")
-        await self.process_message_for_memo(message)
+        received_at = datetime.now()
+        self._pending_messages[message.id] = message
+        if config.TOPIC_PREFETCH_ENABLED and not config.MESSAGE_ENRICHMENT_ENABLED:
+            # エンリッチメントが有効な場合は、メモ処理の中で話題も得られるため先行抽出しない
+            self.topic_prefetcher.prefetch(message.id, message.content)
+        await self._reserve_entry(message, received_at)
+        await self.job_queue.enqueue(
+            "memo",
+            {
+                "channel_id": message.channel.id,
+                "message_id": message.id,
+                "received_at": received_at.isoformat(),
+                "reserved": True,
+            },
+        )
+
+    async def _reserve_entry(self, message: Message, received_at: datetime):
+        """
+        受信した順にエントリの本文とプレースホルダーを追記し、ノート上の位置を確保する
+
+        ジョブの投入より前に書き込むため、メモ処理が失敗し続けても本文は残ります。
+        """
+        await note_writer.append(
+            _daily_note_path(received_at.date()),
+            _entry_header(received_at, message.content)
+            + f"{placeholder('memo', message.id)}\n",
+            template=get_template(received_at.date()),
+        )
+
+    @app_commands.command(
+        name="requeue_jobs",
+        description="失敗したまま残っているメモ処理を再実行します (オーナーのみ)。",
+    )
+    async def requeue_jobs(self, interaction: Interaction):
+        """デッドレターに送られたジョブを再実行します (オーナーのみ)。"""
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message(
+                "このコマンドはBotのオーナーのみ実行できます。", ephemeral=True
+            )
+            return
+        requeued = await self.job_queue.requeue_dead()
+        await interaction.response.send_message(
+            f"{requeued} 件のジョブを再実行します。", ephemeral=True
+        )
 
     async def add_to_memo_callback(self, interaction: Interaction, message: Message):
         """コンテキストメニューから呼び出されたときの処理"""
@@ -240,28 +709,31 @@ class MemoHandler(commands.Cog):
                 "メモへの追加中にエラーが発生しました。", ephemeral=True
             )
 
+    async def _collect_topics(self, message: Message) -> list[str]:
+        """メッセージ内のURLと、AIで抽出した話題を重複なく並べる (両方のメニューで共有)"""
+        topics = []
+        # メッセージ内のURLを抽出
+        url_matches = URL_PATTERN.findall(message.content)
+        if url_matches:
+            topics.extend(url_matches)
+
+        # AIでトピックを抽出 (監視チャンネルのメッセージは受信時やメモ処理時に抽出済み)
+        ai_topics = await self.topic_prefetcher.get_topics(message.id, message.content)
+        topics.extend(ai_topics)
+
+        # 重複を削除し、リストをユニークにする (セレクトメニューの選択肢は25件まで)
+        return list(dict.fromkeys(topics))[:25]
+
     async def extract_topic_callback(self, interaction: Interaction, message: Message):
         await interaction.response.defer(ephemeral=True)
         try:
-            topics = []
-            # メッセージ内のURLを抽出
-            url_matches = re.findall(r"https?://\S+", message.content)
-            if url_matches:
-                topics.extend(url_matches)
-
-            # AIでトピックを抽出
-            ai_topics = extract_topics(message.content)
-            topics.extend(ai_topics)
-
+            topics = await self._collect_topics(message)
             if not topics:
                 await interaction.followup.send(
                     "抽出できる単語や話題が見つかりませんでした。", ephemeral=True
                 )
                 return
 
-            # 重複を削除し、リストをユニークにする
-            topics = list(dict.fromkeys(topics))
-
             view = TopicSelectView(topics, message, self, "add_to_memo")
             await interaction.followup.send(
                 "メモに追加するトピックを選択してください。", view=view, ephemeral=True
@@ -278,24 +750,26 @@ class MemoHandler(commands.Cog):
     ):
         today = datetime.now().date()
         file_name = f"{today.strftime('%Y-%m-%d')}.md"
-        file_path = os.path.join(config.SAVE_DIR, file_name)
-
-        if not os.path.exists(file_path):
-            template = get_template(today)
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(template)
 
         timestamp = datetime.now().strftime("%H:%M")
 
-        # AIによる補足を生成
-        supplement = generate_flash_supplement(selected_topic)
+        # AIによる補足を生成 (失敗した場合はエラーの文言を書き込まずに中止する)
+        try:
+            supplement = await generate_flash_supplement(
+                selected_topic, priority=PRIORITY_INTERACTIVE
+            )
+        except Exception as e:  # noqa: BLE001 - 操作したユーザーに失敗を伝える
+            logger.error(f"Failed to generate supplement for '{selected_topic}': {e}")
+            await interaction.followup.send(
+                "補足の生成中にエラーが発生しました。", ephemeral=True
+            )
+            return
         content_to_append = f"\n{timestamp}\n{selected_topic}\n"
         content_to_append += (
             f"\n> [!info] AI's Small Tip\n> {supplement.replace('\n', '\n> ')}\n"
         )
 
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(content_to_append)
+        await append_to_daily_note(today, content_to_append)
 
         logger.info(
             f"Appended topic '{selected_topic}' from {original_message.author.display_name} to {file_name}"
@@ -307,34 +781,45 @@ class MemoHandler(commands.Cog):
     async def _handle_lookup_topic_selection(
         self, interaction: Interaction, selected_topic: str, original_message: Message
     ):
-        summary = generate_topic_summary(selected_topic)
-        view = SummaryDisplayView(selected_topic, summary)
-        await interaction.followup.send(
-            f"**{selected_topic}** の概要:\n{summary}", view=view, ephemeral=True
+        header = f"**{selected_topic}** の概要:\n"
+        # 生成を待たずに返信し、生成されたそばから編集して表示する
+        message = await interaction.followup.send(
+            header + "生成中...", ephemeral=True, wait=True
         )
+        reply = StreamingFollowup(message, header)
+        try:
+            async for chunk in stream_topic_summary(selected_topic):
+                await reply.append(chunk)
+        except Exception as e:  # noqa: BLE001 - 受信済みの分か通常の呼び出しで応答する
+            if reply.text:
+                logger.error(f"Topic summary stream for '{selected_topic}' broke: {e}")
+                reply.text += "\n(生成が途中で中断されました)"
+            else:
+                # 何も受信できなかった場合は、リトライ付きの通常の呼び出しに切り替える
+                logger.warning(
+                    f"Falling back to non-streaming topic summary for "
+                    f"'{selected_topic}': {e}"
+                )
+                try:
+                    reply.text = await generate_topic_summary(selected_topic)
+                except Exception as e:  # noqa: BLE001 - 操作したユーザーに失敗を伝える
+                    logger.error(f"Topic summary for '{selected_topic}' failed: {e}")
+                    # エラーの文言はメモに追加できないよう、ボタンを付けずに表示する
+                    await reply.finish("概要の生成中にエラーが発生しました。")
+                    return
+        summary = reply.text.strip()
+        await reply.finish(summary, view=SummaryDisplayView(selected_topic, summary))
 
     async def lookup_topic_callback(self, interaction: Interaction, message: Message):
         await interaction.response.defer(ephemeral=True)
         try:
-            topics = []
-            # メッセージ内のURLを抽出
-            url_matches = re.findall(r"https?://\S+", message.content)
-            if url_matches:
-                topics.extend(url_matches)
-
-            # AIでトピックを抽出
-            ai_topics = extract_topics(message.content)
-            topics.extend(ai_topics)
-
+            topics = await self._collect_topics(message)
             if not topics:
                 await interaction.followup.send(
                     "抽出できる単語や話題が見つかりませんでした。", ephemeral=True
                 )
                 return
 
-            # 重複を削除し、リストをユニークにする
-            topics = list(dict.fromkeys(topics))
-
             view = TopicSelectView(topics, message, self, "lookup_topic")
             await interaction.followup.send(
                 "概要を調べるトピックを選択してください。", view=view, ephemeral=True
@@ -408,12 +893,6 @@ class SummaryDisplayView(View):
         await interaction.response.defer(ephemeral=True)
         today = datetime.now().date()
         file_name = f"{today.strftime('%Y-%m-%d')}.md"
-        file_path = os.path.join(config.SAVE_DIR, file_name)
-
-        if not os.path.exists(file_path):
-            template = get_template(today)
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(template)
 
         timestamp = datetime.now().strftime("%H:%M")
         content_to_append = f"""
@@ -423,8 +902,7 @@ class SummaryDisplayView(View):
         """
         content_to_append = f"\n{timestamp}\n{self.topic}\n> [info] {self.topic} の検索結果 by AI\n> {self.summary.replace('\n', '\n> ')}\n"
 
-        with open(file_path, "a", encoding="utf-8") as f:
-            f.write(content_to_append)
+        await append_to_daily_note(today, content_to_append)
 
         logger.info(f"Appended summary for '{self.topic}' to {file_name}")
         await interaction.followup.send(
@@ -0,0 +1,72 @@
+import time
+from urllib.parse import quote
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import config
+from logger_config import logger
+from search_index import SearchResult, search_index
+from vault_index import KIND_DAILY
+
+
+def _obsidian_link(result: SearchResult) -> str:
+    """結果のノートへのリンク (ボルト名が設定されていなければ Obsidian 形式のリンク文字列)"""
+    if not config.OBSIDIAN_VAULT:
+        return f"[[{result.name}]]"
+    uri = (
+        f"obsidian://open?vault={quote(config.OBSIDIAN_VAULT)}"
+        f"&file={quote(result.name)}"
+    )
+    return f"[[{result.name}]] `{uri}`"
+
+
+class SearchCog(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @app_commands.command(
+        name="search",
+        description="過去のメモとタグノートを全文検索します。",
+    )
+    @app_commands.describe(query="検索する語句")
+    async def search(self, interaction: discord.Interaction, query: str):
+        """過去のメモとタグノートを全文検索します。"""
+        await interaction.response.defer(ephemeral=True)
+        started = time.perf_counter()
+        try:
+            results = await search_index.search(query, config.SEARCH_RESULT_LIMIT)
+        except Exception as e:  # noqa: BLE001 - 失敗しても利用者には必ず応答を返す
+            logger.error(f"Search failed for {query!r}: {e}")
+            await interaction.followup.send(
+                "検索中にエラーが発生しました。", ephemeral=True
+            )
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Search {query!r}: {len(results)} result(s) in {elapsed_ms:.1f}ms")
+
+        if not results:
+            await interaction.followup.send(
+                f"「{query}」に一致するメモは見つかりませんでした。", ephemeral=True
+            )
+            return
+
+        embed = discord.Embed(
+            title=f"「{query}」の検索結果",
+            color=discord.Color.blue(),
+        )
+        for result in results:
+            label = "📅" if result.kind == KIND_DAILY else "🏷️"
+            embed.add_field(
+                name=f"{label} {result.name}"[:256],
+                value=f"{result.snippet}\n{_obsidian_link(result)}"[:1024],
+                inline=False,
+            )
+        embed.set_footer(text=f"{len(results)}件 ({elapsed_ms:.0f}ms)")
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(SearchCog(bot))
+    logger.info("Loaded cog: search_cog")
@@ -0,0 +1,182 @@
+import time
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+import config
+from logger_config import logger
+from metrics import (
+    GEMINI_LATENCY,
+    GEMINI_QUEUE_DEPTH,
+    GEMINI_QUEUE_WAIT,
+    GEMINI_REQUESTS,
+    GEMINI_RETRIES,
+    GEMINI_TOKENS,
+    JOB_FAILURES,
+    JOB_QUEUE_JOBS,
+    LLM_CACHE_LOOKUPS,
+    MEMO_LATENCY,
+    MEMO_PROCESS,
+    MODEL_ROUTE_DECISIONS,
+    NOTE_WRITE,
+    NOTE_WRITE_ENTRIES,
+    NOTE_WRITE_QUEUE_DEPTH,
+    SUMMARY_RUN,
+    SUMMARY_STAGE,
+    THUMBNAIL_BYTES,
+    THUMBNAIL_DOWNLOAD,
+    URL_FETCH,
+    Counter,
+    Histogram,
+    registry,
+    start_http_server,
+)
+
+
+def _total(counter: Counter, **labels) -> float:
+    """指定したラベルに一致する系列の合計 (省略したラベルは問わない)"""
+    return sum(
+        value
+        for series_labels, value in counter.series()
+        if all(series_labels[name] == v for name, v in labels.items())
+    )
+
+
+def _latency(histogram: Histogram, **labels) -> str:
+    count = histogram.count(**labels)
+    if count == 0:
+        return "記録なし"
+    p50, p95, p99 = (histogram.quantile(q, **labels) for q in (0.5, 0.95, 0.99))
+    return f"p50 {p50:.2f}s / p95 {p95:.2f}s / p99 {p99:.2f}s (n={count})"
+
+
+def _bytes(value: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+    return f"{value:.1f}GB"
+
+
+def _gemini_lines() -> list[str]:
+    models = sorted({labels["model"] for labels, _ in GEMINI_REQUESTS.series()})
+    lines = []
+    for model in models:
+        ok = _total(GEMINI_REQUESTS, model=model, outcome="ok")
+        limited = _total(GEMINI_REQUESTS, model=model, outcome="rate_limited")
+        errors = _total(GEMINI_REQUESTS, model=model) - ok - limited
+        prompt = _total(GEMINI_TOKENS, model=model, type="prompt")
+        output = _total(GEMINI_TOKENS, model=model, type="output")
+        lines.append(
+            f"**{model}**: 成功 {ok:.0f} / 429 {limited:.0f} / エラー {errors:.0f}, "
+            f"入力 {prompt:.0f} / 出力 {output:.0f} トークン\n"
+            f"  {_latency(GEMINI_LATENCY, model=model)}\n"
+            f"  枠待ち {_latency(GEMINI_QUEUE_WAIT, model=model)}, "
+            f"待機中 {GEMINI_QUEUE_DEPTH.value(model=model):.0f}"
+        )
+    hits = _total(LLM_CACHE_LOOKUPS, result="hit")
+    lookups = _total(LLM_CACHE_LOOKUPS)
+    hit_rate = f"{hits / lookups:.0%}" if lookups else "-"
+    lines.append(
+        f"再試行 {_total(GEMINI_RETRIES):.0f} 回, 応答キャッシュのヒット率 {hit_rate}"
+    )
+    switched = _total(MODEL_ROUTE_DECISIONS) - _total(
+        MODEL_ROUTE_DECISIONS, reason="primary"
+    )
+    lines.append(
+        f"経路の切り替え {switched:.0f} 回 "
+        f"(タイムアウト {_total(MODEL_ROUTE_DECISIONS, outcome='timeout'):.0f})"
+    )
+    return lines
+
+
+class StatsCog(commands.Cog):
+    """処理時間やGeminiの使用量などのメトリクスを表示する (METRICS_PORT でHTTPでも公開)"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.started_at = time.monotonic()
+        self._runner = None
+
+    async def cog_load(self):
+        if config.METRICS_PORT > 0:
+            try:
+                self._runner = await start_http_server(
+                    config.METRICS_HOST, config.METRICS_PORT
+                )
+            except OSError as e:
+                logger.error(f"Failed to start metrics endpoint: {e}")
+
+    async def cog_unload(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @app_commands.command(
+        name="stats",
+        description="Botの処理時間やGeminiの使用量を表示します (オーナーのみ)。",
+    )
+    async def stats(self, interaction: discord.Interaction):
+        """Botの処理時間やGeminiの使用量を表示します (オーナーのみ)。"""
+        if not await self.bot.is_owner(interaction.user):
+            await interaction.response.send_message(
+                "このコマンドはBotのオーナーのみ実行できます。", ephemeral=True
+            )
+            return
+        await registry.collect()
+
+        uptime = int(time.monotonic() - self.started_at)
+        embed = discord.Embed(
+            title="Botの統計",
+            description=f"起動から {uptime // 3600}時間{uptime % 3600 // 60}分",
+            color=discord.Color.green(),
+        )
+        embed.add_field(
+            name="Gemini", value="\n".join(_gemini_lines())[:1024], inline=False
+        )
+        embed.add_field(
+            name="メモ処理",
+            value=(
+                f"処理 {_latency(MEMO_PROCESS)}\n"
+                f"受信から書き込みまで {_latency(MEMO_LATENCY)}\n"
+                f"未処理 {JOB_QUEUE_JOBS.value(status='pending'):.0f} / "
+                f"デッドレター {JOB_QUEUE_JOBS.value(status='dead'):.0f} / "
+                f"再試行 {_total(JOB_FAILURES, result='retry'):.0f}"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="URL・サムネイル",
+            value=(
+                f"URL {_latency(URL_FETCH)}\n"
+                f"  取得 {_latency(URL_FETCH, outcome='fetched')}\n"
+                f"サムネイル {_latency(THUMBNAIL_DOWNLOAD, outcome='saved')}, "
+                f"{_bytes(_total(THUMBNAIL_BYTES, stage='downloaded'))} → "
+                f"{_bytes(_total(THUMBNAIL_BYTES, stage='stored'))}"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="ノートの書き込み",
+            value=(
+                f"{_latency(NOTE_WRITE)}\n"
+                f"{NOTE_WRITE_ENTRIES.value():.0f} 件, "
+                f"待機中 {NOTE_WRITE_QUEUE_DEPTH.value():.0f}"
+            ),
+            inline=False,
+        )
+        embed.add_field(
+            name="まとめ生成",
+            value=(
+                f"全体 {_latency(SUMMARY_RUN, outcome='ok')}\n"
+                f"生成 {_latency(SUMMARY_STAGE, stage='generate')}"
+            ),
+            inline=False,
+        )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+async def setup(bot):
+    await bot.add_cog(StatsCog(bot))
+    logger.info("Loaded cog: stats_cog")
@@ -1,103 +1,318 @@
 import asyncio
 import datetime
+import hashlib
 import os
+from collections import Counter
 from discord.ext import commands, tasks
 from discord import app_commands
 import discord
 
 import config
-from ai_summarizer import summarize_and_tag_and_explain
+from ai_summarizer import (
+    prepare_summary_input,
+    stream_summary_sections,
+    stream_tag_explanations,
+)
 from logger_config import logger
+from metrics import SUMMARY_RUN, SUMMARY_STAGE
+from note_writer import note_writer
+from memo_text import compact_memo, split_entries
+from rolling_digest import rolling_digest
+from search_index import search_index
+from related_notes import format_related_section, related_notes
+from summary_stream import (
+    EVENT_SUMMARY,
+    EVENT_TAGS,
+    SummaryEvent,
+    SummaryProgress,
+    parse_tags_line,
+)
+from tag_notes import (
+    canonical_tag,
+    merge_tag_notes,
+    normalize_tags_line,
+    resolve_tag_names,
+)
+from vault_index import KIND_DAILY, KIND_TAG, vault_index
 
 
 class SummaryCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.daily_summary.start()
+        self.vault_scan.start()
 
     def cog_unload(self):
         self.daily_summary.cancel()
+        self.vault_scan.cancel()
 
     async def _run_summary(self, date_to_summarize: datetime.date):
         """指定された日付のメモを要約し、タグファイルを作成する共通ロジック"""
+        with SUMMARY_RUN.timer(outcome="ok") as labels:
+            return await self._summarize(date_to_summarize, labels)
+
+    async def _summarize(self, date_to_summarize: datetime.date, labels: dict):
         file_path = os.path.join(
             config.SAVE_DIR, f"{date_to_summarize.strftime('%Y-%m-%d')}.md"
         )
 
-        if not os.path.exists(file_path):
-            logger.warning(
-                f"Memo file for {date_to_summarize.strftime('%Y-%m-%d')} not found."
-            )
-            return "対象のメモファイルが見つかりませんでした。"
+        date_str = date_to_summarize.strftime("%Y-%m-%d")
+        if vault_index.has_summary(date_str):
+            # インデックスで判定できる場合はファイルを読まずに終了する
+            logger.info(f"Summary already exists for {file_path} (vault index)")
+            labels["outcome"] = "skipped"
+            return "既にまとめが存在します。"
 
         try:
-            with open(file_path, "r+", encoding="utf-8") as f:
-                content = f.read()
-
-                if "## まとめ" in content:
-                    logger.info(f"Summary already exists for {file_path}")
-                    return "既にまとめが存在します。"
-
-                memo_section = content.split("## メモ")
-                if len(memo_section) < 2:
-                    logger.warning(f"'## メモ' section not found in {file_path}")
-                    return "メモセクションが見つかりませんでした。"
-
-                memo_content = memo_section[1]
-                if not memo_content.strip():
-                    logger.info(f"Memo content is empty for {file_path}")
-                    return "メモの内容が空です。"
-
-                date_str = date_to_summarize.strftime("%Y-%m-%d")
-                summary, tags, explanations = summarize_and_tag_and_explain(
-                    memo_content, date_str
+            # 保留中の追記を反映した後の内容を読む (書き込みパイプライン経由)
+            content = await note_writer.read(file_path)
+            if content is None:
+                logger.warning(
+                    f"Memo file for {date_to_summarize.strftime('%Y-%m-%d')} not found."
                 )
+                labels["outcome"] = "skipped"
+                return "対象のメモファイルが見つかりませんでした。"
+
+            if "## まとめ" in content:
+                logger.info(f"Summary already exists for {file_path}")
+                labels["outcome"] = "skipped"
+                return "既にまとめが存在します。"
+
+            memo_section = content.split("## メモ")
+            if len(memo_section) < 2:
+                logger.warning(f"'## メモ' section not found in {file_path}")
+                labels["outcome"] = "skipped"
+                return "メモセクションが見つかりませんでした。"
+
+            memo_content = memo_section[1]
+            if not memo_content.strip():
+                logger.info(f"Memo content is empty for {file_path}")
+                labels["outcome"] = "skipped"
+                return "メモの内容が空です。"
+
+            with SUMMARY_STAGE.timer(stage="prepare"):
+                digest = None
+                if config.ROLLING_DIGEST_ENABLED:
+                    expected_entries = len(split_entries(compact_memo(memo_content)))
+                    digest = await rolling_digest.finalize(date_str, expected_entries)
+
+                if digest:
+                    # 追記のたびに更新したダイジェストを仕上げるだけなので、メモの量によらず一定のコスト
+                    logger.info(
+                        f"Finalizing summary for {date_str} from rolling digest"
+                    )
+                    summary_input = digest
+                else:
+                    summary_input = await prepare_summary_input(memo_content, date_str)
+
+            # 1. まとめを受信しながら、完成したタグの解説から順にタグノートへ追記する
+            with SUMMARY_STAGE.timer(stage="generate"):
+                progress = await self._generate_summary(date_str, summary_input)
+            if progress.summary is None or progress.tags_line is None:
+                labels["outcome"] = "error"
+                return "まとめの生成中にエラーが発生しました。再実行すると途中から再開します。"
+
+            # 2. 元のメモファイルに追記するまとめとタグ (タグノートと表記を揃える)
+            summary_block = "" if content.endswith("\n") else "\n"
+            summary_block += "\n## まとめ\n"
+            summary_block += progress.summary + "\n"
+            summary_block += normalize_tags_line(progress.tags_line) + "\n"
 
-                # 1. 元のメモファイルにまとめとタグを追記
-                f.seek(0, os.SEEK_END)
-                if f.tell() > 0:
-                    f.seek(f.tell() - 1, os.SEEK_SET)
-                    if f.read(1) != "\n":
-                        f.write("\n")
-                f.write("\n## まとめ\n")
-                f.write(summary + "\n")
-                f.write(tags + "\n")
-                logger.info(f"Added summary and tags to {file_path}")
-
-                # 2. タグごとの解説ファイルを作成し、デイリーノートにバックリンクを追記
-                if not os.path.exists(config.NOTES_DIR):
-                    os.makedirs(config.NOTES_DIR)
-                    logger.info(f"Created directory: {config.NOTES_DIR}")
-
-                backlinks = []
-                for tag, explanation in explanations.items():
-                    tag_file_path = os.path.join(config.NOTES_DIR, f"{tag}.md")
-                    with open(tag_file_path, "w", encoding="utf-8") as tag_f:
-                        date_str = date_to_summarize.strftime("%Y-%m-%d")
-                        file_content = (
-                            f"# {tag}\n\n[[{date_str}]]\n\n{explanation}\n\n#{tag}"
-                        )
-                        tag_f.write(file_content)
-                    logger.info(f"Created tag explanation file: {tag_file_path}")
-                    backlinks.append(f"[[{tag}]]")
-
-                # 3. デイリーノートにバックリンクを追記
-                if backlinks:
-                    f.write("\n## 詳細ノート\n")
-                    f.write(" ".join(backlinks) + "\n")
-                    logger.info(f"Added backlinks to {file_path}")
-
-                return f"{date_to_summarize.strftime('%Y-%m-%d')}のメモの要約とタグ付けが完了しました。"
+            # 3. デイリーノートにバックリンクと関連ノートを追記
+            tag_names = list(dict.fromkeys(progress.written.values()))
+            backlinks = [f"[[{name}]]" for name in tag_names]
+            if backlinks:
+                summary_block += "\n## 詳細ノート\n"
+                summary_block += " ".join(backlinks) + "\n"
+            daily_key = (KIND_DAILY, date_str)
+            related = await self._find_related(
+                {daily_key: f"{progress.summary}\n{compact_memo(memo_content)}"},
+                {daily_key: set(tag_names)},
+            )
+            related = related.get(daily_key, [])
+            if related:
+                summary_block += "\n" + format_related_section(related) + "\n"
+
+            # 書き込み中のメモ追記と混ざらないよう、まとめて1件として追記する
+            with SUMMARY_STAGE.timer(stage="write"):
+                await note_writer.append(file_path, summary_block)
+                await vault_index.record_append(file_path, KIND_DAILY, summary_block)
+                await asyncio.to_thread(progress.clear)
+            logger.info(f"Added summary and tags to {file_path}")
+            if backlinks:
+                logger.info(f"Added backlinks to {file_path}")
+
+            return f"{date_to_summarize.strftime('%Y-%m-%d')}のメモの要約とタグ付けが完了しました。"
 
         except Exception as e:
             logger.error(f"Error processing {file_path}: {e}")
+            labels["outcome"] = "error"
             return f"処理中にエラーが発生しました: {e}"
 
+    async def _generate_summary(
+        self, date_str: str, summary_input: str
+    ) -> SummaryProgress:
+        """
+        まとめをストリーミングで生成し、途中経過を保存しながらタグノートを書き込む。
+
+        同じ入力での途中経過が保存されていればそこから再開する。ストリームが失敗した場合は
+        試行回数まで待ってから生成し直し、解説の足りないタグは1回だけ再要求して、
+        それでも届かなかったタグの解説は省略する。
+        """
+        input_digest = hashlib.sha256(summary_input.encode("utf-8")).hexdigest()
+        progress = SummaryProgress(date_str, input_digest)
+        if await asyncio.to_thread(progress.load):
+            logger.info(
+                f"Resuming summary for {date_str} "
+                f"({len(progress.explanations)} explanation(s) already done)"
+            )
+
+        requested_missing = False
+        for attempt in range(config.SUMMARY_STREAM_ATTEMPTS):
+            if progress.summary is None or progress.tags_line is None:
+                events = stream_summary_sections(summary_input, date_str)
+            else:
+                missing = progress.missing_tags(canonical_tag)
+                if not missing or requested_missing:
+                    break
+                requested_missing = True
+                logger.info(
+                    f"Requesting missing explanations for {date_str}: {missing}"
+                )
+                events = stream_tag_explanations(summary_input, date_str, missing)
+            try:
+                async for event in events:
+                    await self._handle_summary_event(progress, date_str, event)
+            except Exception as e:  # noqa: BLE001 - 途中経過を残して生成し直す
+                logger.error(
+                    f"Summary stream for {date_str} failed "
+                    f"(attempt {attempt + 1}/{config.SUMMARY_STREAM_ATTEMPTS}): {e}"
+                )
+                # 待ってから作り直すのは要約かタグの行が届いていない場合だけ
+                if (
+                    progress.summary is None or progress.tags_line is None
+                ) and attempt + 1 < config.SUMMARY_STREAM_ATTEMPTS:
+                    await asyncio.sleep(min(4 * 2**attempt, 60))
+
+        missing = progress.missing_tags(canonical_tag)
+        if missing:
+            logger.warning(f"Omitting explanations for {date_str}: {missing}")
+
+        # 同じノートになる他のタグの解説が届かなかったものも、届いた分だけで書き込む
+        await self._write_tag_notes(progress, date_str, final=True)
+        await asyncio.to_thread(progress.save)
+        return progress
+
+    async def _handle_summary_event(
+        self, progress: SummaryProgress, date_str: str, event: SummaryEvent
+    ):
+        """受信したセクションを途中経過に記録し、解説の揃ったタグノートへすぐに追記する"""
+        if event.kind == EVENT_SUMMARY:
+            progress.summary = event.text
+            logger.info(f"Generated Summary: {event.text}")
+        elif event.kind == EVENT_TAGS:
+            progress.tags_line = event.text
+            logger.info(f"Generated Tags: {event.text}")
+        elif event.tag:
+            progress.explanations[event.tag] = event.text
+            await self._write_tag_notes(progress, date_str)
+        await asyncio.to_thread(progress.save)
+
+    async def _write_tag_notes(
+        self, progress: SummaryProgress, date_str: str, final: bool = False
+    ):
+        """
+        まだ書き込んでいない解説を、タグノートにその日のセクションとして追記する。
+
+        表記ゆれで同じノートになるタグは1つのセクションにまとめるため、タグの行に挙がっている
+        同じノートのタグの解説がすべて届くまで待つ (final の場合は届いた分だけで書き込む)。
+        """
+        pending = [tag for tag in progress.explanations if tag not in progress.written]
+        if not pending:
+            return
+        expected = parse_tags_line(progress.tags_line or "")
+        resolved = resolve_tag_names(
+            dict.fromkeys(expected + list(progress.explanations))
+        )
+        groups: dict[str, list[str]] = {}
+        for tag in pending:
+            if tag in resolved:
+                groups.setdefault(resolved[tag], []).append(tag)
+        if not final:
+            # 同じノートになるタグの数だけ解説が届いたノートから書き込む
+            expected_count = Counter(
+                resolved[t] for t in set(expected) if t in resolved
+            )
+            received_count = Counter(
+                resolved[t] for t in progress.explanations if t in resolved
+            )
+            groups = {
+                name: tags
+                for name, tags in groups.items()
+                if received_count[name] >= expected_count[name]
+            }
+        if not groups:
+            return
+
+        related = await self._find_related(
+            {
+                (KIND_TAG, name): "\n\n".join(progress.explanations[t] for t in tags)
+                for name, tags in groups.items()
+            },
+            {(KIND_TAG, name): {date_str} for name in groups},
+        )
+        merged = await merge_tag_notes(
+            date_str,
+            {
+                tag: progress.explanations[tag]
+                for tags in groups.values()
+                for tag in tags
+            },
+            {name: related.get((KIND_TAG, name), []) for name in groups},
+        )
+        for name, appended in merged.items():
+            if not appended:
+                logger.info(
+                    f"Kept the existing {date_str} section of {name}; "
+                    f"explanations for {groups[name]} were not added"
+                )
+            for tag in groups[name]:
+                progress.written[tag] = name
+
+    async def _find_related(
+        self,
+        targets: dict[tuple[str, str], str],
+        exclude: dict[tuple[str, str], set[str]],
+    ) -> dict[tuple[str, str], list[str]]:
+        """
+        ノートの関連ノートをまとめて求める (Gemini は使わず、ボルト内の TF-IDF 類似度から計算)
+
+        失敗した場合は関連ノートなしとして扱う。
+        """
+        if not config.RELATED_NOTES_ENABLED:
+            return {}
+        try:
+            return await related_notes.find_related(targets, exclude)
+        except Exception as e:  # noqa: BLE001 - 関連ノートがなくてもまとめは書き込む
+            logger.error(f"Failed to compute related notes for {list(targets)}: {e}")
+            return {}
+
     @tasks.loop(hours=24)
     async def daily_summary(self):
         yesterday = datetime.date.today() - datetime.timedelta(days=1)
         await self._run_summary(yesterday)
 
+    @tasks.loop(seconds=config.VAULT_SCAN_INTERVAL)
+    async def vault_scan(self):
+        """Obsidian側での編集も含め、変更のあったノートをインデックスと検索インデックスに反映する"""
+        try:
+            await vault_index.scan()
+            await search_index.sync()
+            if config.RELATED_NOTES_ENABLED:
+                await related_notes.refresh()
+        except Exception as e:  # noqa: BLE001 - 失敗しても次の周期でスキャンし直す
+            logger.error(f"Failed to scan vault: {e}")
+
     @daily_summary.before_loop
     async def before_daily_summary(self):
         now = datetime.datetime.now()
@@ -9,3 +9,154 @@ IMAGE_SAVE_DIR = os.getenv("IMAGE_SAVE_DIR")
 NOTES_DIR = os.getenv("NOTES_DIR")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# キャッシュやインデックスなど、Bot内部の状態を保存するディレクトリ (既定ではSAVE_DIRと同じ階層)
+STATE_DIR = os.getenv("STATE_DIR") or os.path.join(
+    os.path.dirname(os.path.abspath(SAVE_DIR or ".")), ".obsidian-discord"
+)
+
+# URLプレビュー/サムネイル取得用HTTPクライアントの設定
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "32"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "4"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_TOTAL_TIMEOUT = float(os.getenv("HTTP_TOTAL_TIMEOUT", "20"))
+
+# URLメタデータ取得時に読み込む最大バイト数 (</head> に達した時点でも打ち切る)
+URL_METADATA_MAX_BYTES = int(os.getenv("URL_METADATA_MAX_BYTES", str(512 * 1024)))
+
+# URLメタデータキャッシュの設定 (TTLは秒)
+URL_CACHE_TTL = int(os.getenv("URL_CACHE_TTL", str(7 * 24 * 60 * 60)))
+URL_CACHE_NEGATIVE_TTL = int(os.getenv("URL_CACHE_NEGATIVE_TTL", "600"))
+URL_CACHE_NEGATIVE_MAX_TTL = int(
+    os.getenv("URL_CACHE_NEGATIVE_MAX_TTL", str(24 * 60 * 60))
+)
+URL_CACHE_MAX_ENTRIES = int(os.getenv("URL_CACHE_MAX_ENTRIES", "5000"))
+
+# LLM応答キャッシュの設定 (TTLは秒、0でその関数のキャッシュを無効化)
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+LLM_CACHE_TTL_SUPPLEMENT = int(os.getenv("LLM_CACHE_TTL_SUPPLEMENT", "86400"))
+LLM_CACHE_TTL_TOPICS = int(os.getenv("LLM_CACHE_TTL_TOPICS", "604800"))
+LLM_CACHE_TTL_TOPIC_SUMMARY = int(os.getenv("LLM_CACHE_TTL_TOPIC_SUMMARY", "86400"))
+
+# デイリーノート書き込みパイプラインの設定
+# NOTE_FSYNC: none (OSに任せる) / always (書き込みごとにfsync) / interval (NOTE_FSYNC_INTERVAL秒ごと)
+NOTE_FSYNC = os.getenv("NOTE_FSYNC", "none")
+NOTE_FSYNC_INTERVAL = float(os.getenv("NOTE_FSYNC_INTERVAL", "5"))
+NOTE_COALESCE_DELAY = float(os.getenv("NOTE_COALESCE_DELAY", "0.05"))
+NOTE_MAX_BATCH_BYTES = int(os.getenv("NOTE_MAX_BATCH_BYTES", str(256 * 1024)))
+NOTE_WRITER_IDLE_TIMEOUT = float(os.getenv("NOTE_WRITER_IDLE_TIMEOUT", "300"))
+
+# メモ処理ジョブキューの設定
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+
+# Gemini呼び出しのレート制御 ("モデル:RPM:TPM" をカンマ区切りで指定)
+GEMINI_RATE_LIMITS = os.getenv(
+    "GEMINI_RATE_LIMITS",
+    "gemini-2.5-flash:10:250000,gemini-2.0-flash:15:1000000,gemini-1.5-flash:15:250000",
+)
+# 上限に対して実際に使う割合と、1分間の上限のうち一度に使えるバースト幅の割合
+GEMINI_RATE_HEADROOM = float(os.getenv("GEMINI_RATE_HEADROOM", "0.9"))
+GEMINI_RATE_BURST_RATIO = float(os.getenv("GEMINI_RATE_BURST_RATIO", "0.25"))
+# トークン数の見積もりに使う係数 (1文字あたりのトークン数) と、出力トークンの見積もり
+GEMINI_TOKENS_PER_CHAR = float(os.getenv("GEMINI_TOKENS_PER_CHAR", "1.0"))
+GEMINI_OUTPUT_TOKEN_ESTIMATE = int(os.getenv("GEMINI_OUTPUT_TOKEN_ESTIMATE", "1024"))
+
+# 補足生成のマイクロバッチ (有効にする場合は JOB_WORKERS をバッチ件数以上にする)
+SUPPLEMENT_BATCH_ENABLED = (
+    os.getenv("SUPPLEMENT_BATCH_ENABLED", "false").lower() == "true"
+)
+SUPPLEMENT_BATCH_SIZE = int(os.getenv("SUPPLEMENT_BATCH_SIZE", "8"))
+SUPPLEMENT_BATCH_MAX_WAIT = float(os.getenv("SUPPLEMENT_BATCH_MAX_WAIT", "2.0"))
+
+# デイリーまとめの map-reduce 設定 (トークン数)
+SUMMARY_MAP_REDUCE_THRESHOLD = int(os.getenv("SUMMARY_MAP_REDUCE_THRESHOLD", "12000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+LLM_CACHE_TTL_MEMO_CHUNK = int(os.getenv("LLM_CACHE_TTL_MEMO_CHUNK", "86400"))
+
+# メモの追記に合わせてその日のダイジェストを更新し、夜間のまとめ生成の入力にする
+ROLLING_DIGEST_ENABLED = os.getenv("ROLLING_DIGEST_ENABLED", "false").lower() == "true"
+ROLLING_DIGEST_DEBOUNCE = float(os.getenv("ROLLING_DIGEST_DEBOUNCE", "60"))
+ROLLING_DIGEST_MAX_CHARS = int(os.getenv("ROLLING_DIGEST_MAX_CHARS", "3000"))
+
+# ノートのインデックスを差分更新する間隔 (秒)
+VAULT_SCAN_INTERVAL = float(os.getenv("VAULT_SCAN_INTERVAL", "300"))
+
+# /search の結果に obsidian:// リンクを付ける場合のボルト名 (空ならリンクなし)
+OBSIDIAN_VAULT = os.getenv("OBSIDIAN_VAULT", "")
+SEARCH_RESULT_LIMIT = int(os.getenv("SEARCH_RESULT_LIMIT", "5"))
+
+# 関連ノート (TF-IDFのコサイン類似度) の件数と、関連とみなす類似度の下限
+RELATED_NOTES_ENABLED = os.getenv("RELATED_NOTES_ENABLED", "true").lower() == "true"
+RELATED_NOTES_TOP_K = int(os.getenv("RELATED_NOTES_TOP_K", "5"))
+RELATED_NOTES_MIN_SIMILARITY = float(os.getenv("RELATED_NOTES_MIN_SIMILARITY", "0.1"))
+
+# 話題の概要をストリーミング表示する際のメッセージ編集の最小間隔 (秒)
+TOPIC_STREAM_EDIT_INTERVAL = float(os.getenv("TOPIC_STREAM_EDIT_INTERVAL", "1.0"))
+
+# 監視チャンネルのメッセージの話題を受信時に先行して抽出する (コンテキストメニューを即座に開くため)
+TOPIC_PREFETCH_ENABLED = os.getenv("TOPIC_PREFETCH_ENABLED", "true").lower() == "true"
+TOPIC_PREFETCH_MAX_ENTRIES = int(os.getenv("TOPIC_PREFETCH_MAX_ENTRIES", "256"))
+
+# メモ処理時に補足・話題・重要語を1回の構造化出力でまとめて生成する (オプトイン)
+# 有効にすると補足は検索によるグラウンディングなしで生成され、補足のマイクロバッチと話題の先行抽出は使われない
+MESSAGE_ENRICHMENT_ENABLED = (
+    os.getenv("MESSAGE_ENRICHMENT_ENABLED", "false").lower() == "true"
+)
+
+# 夜間のまとめ生成 (ストリーミング) の試行回数。解説の足りないタグの再要求は1回だけで、届かなければ省略する
+SUMMARY_STREAM_ATTEMPTS = int(os.getenv("SUMMARY_STREAM_ATTEMPTS", "3"))
+
+# 添付画像の保存 (内容のハッシュをファイル名にして重複を保存しない)
+ATTACHMENT_CONCURRENCY = int(os.getenv("ATTACHMENT_CONCURRENCY", "4"))
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+ATTACHMENT_DOWNLOAD_TIMEOUT = float(os.getenv("ATTACHMENT_DOWNLOAD_TIMEOUT", "120"))
+# 保存する Content-Type (カンマ区切り)。"image/*" のように種類だけを指定するとその種類の全形式を許可する
+ATTACHMENT_ALLOWED_TYPES = frozenset(
+    t.strip().lower()
+    for t in os.getenv("ATTACHMENT_ALLOWED_TYPES", "image/*").split(",")
+    if t.strip()
+)
+
+# URLのサムネイルの縮小・再エンコード (長辺の最大ピクセル数、形式は webp または jpeg)
+THUMBNAIL_TRANSCODE_ENABLED = (
+    os.getenv("THUMBNAIL_TRANSCODE_ENABLED", "true").lower() == "true"
+)
+THUMBNAIL_MAX_SIZE = int(os.getenv("THUMBNAIL_MAX_SIZE", "640"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_MAX_DOWNLOAD_BYTES = int(
+    os.getenv("THUMBNAIL_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024))
+)
+THUMBNAIL_MAX_PIXELS = int(os.getenv("THUMBNAIL_MAX_PIXELS", str(50_000_000)))
+
+# 1つのメッセージ内のURL (概要とサムネイル) をすべて処理し終えるまでの締め切り (秒)
+URL_PROCESSING_DEADLINE = float(os.getenv("URL_PROCESSING_DEADLINE", "30"))
+
+# Prometheus形式のメトリクスを /metrics で公開するHTTPサーバー (0で無効)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# タスクごとのモデルの経路 ("タスク=モデル>モデル" をカンマ区切りで指定、左から順に試す)
+MODEL_ROUTES = os.getenv(
+    "MODEL_ROUTES",
+    "summary=gemini-2.5-flash>gemini-2.0-flash,"
+    "digest=gemini-2.0-flash>gemini-1.5-flash,"
+    "supplement=gemini-2.0-flash>gemini-1.5-flash,"
+    "topics=gemini-1.5-flash>gemini-2.0-flash,"
+    "topic_summary=gemini-1.5-flash>gemini-2.0-flash",
+)
+# タスクごとの目標応答時間 ("タスク=秒" をカンマ区切りで指定)。超える見込みのモデルは後回しにする
+MODEL_ROUTE_SLOS = os.getenv(
+    "MODEL_ROUTE_SLOS",
+    "summary=300,digest=60,supplement=20,topics=8,topic_summary=15",
+)
+# レート制限を受けたモデルを後回しにする秒数と、経路の選択を記録しておく件数
+MODEL_ROUTE_COOLDOWN = float(os.getenv("MODEL_ROUTE_COOLDOWN", "60"))
+MODEL_ROUTE_LOG_MAX_ROWS = int(os.getenv("MODEL_ROUTE_LOG_MAX_ROWS", "10000"))
@@ -0,0 +1,83 @@
+import time
+
+import discord
+
+import config
+from logger_config import logger
+
+# Discordのメッセージ本文と埋め込みの説明文の最大文字数
+MESSAGE_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+
+
+def layout_message(
+    header: str, body: str, cursor: str = ""
+) -> tuple[str, discord.Embed | None]:
+    """
+    本文を2000文字のメッセージに収まるよう配置します。
+
+    収まらない場合は、メッセージ本文に入る分だけを残し、続きを埋め込みの説明文に移します。
+    埋め込みにも収まらない分は切り詰めます。
+
+    Returns:
+        (メッセージ本文, 埋め込み または None)
+    """
+    content = header + body + cursor
+    if len(content) <= MESSAGE_LIMIT:
+        return content, None
+    available = MESSAGE_LIMIT - len(header)
+    # 改行の位置で分けて、続きが読みやすいようにする
+    split_at = body.rfind("\n", 0, available)
+    if split_at <= 0:
+        split_at = available
+    overflow = body[split_at:].lstrip("\n") + cursor
+    if len(overflow) > EMBED_DESCRIPTION_LIMIT:
+        overflow = overflow[: EMBED_DESCRIPTION_LIMIT - 1] + "…"
+    return header + body[:split_at], discord.Embed(description=overflow)
+
+
+class StreamingFollowup:
+    """
+    生成中のテキストでフォローアップメッセージを少しずつ編集するクラス。
+
+    編集は TOPIC_STREAM_EDIT_INTERVAL 秒に1回までに抑え (Discordの編集のレート制限対策)、
+    間引いた分は次の編集か finish() でまとめて反映します。
+    """
+
+    CURSOR = " ▌"
+
+    def __init__(
+        self,
+        message: discord.WebhookMessage,
+        header: str,
+        interval: float = config.TOPIC_STREAM_EDIT_INTERVAL,
+    ):
+        self.message = message
+        self.header = header
+        self.interval = interval
+        self.text = ""
+        self._last_edit = 0.0
+
+    async def _edit(self, cursor: str, **kwargs):
+        content, embed = layout_message(self.header, self.text, cursor)
+        await self.message.edit(
+            content=content, embeds=[embed] if embed else [], **kwargs
+        )
+        self._last_edit = time.monotonic()
+
+    async def append(self, chunk: str):
+        """生成されたテキストを追加し、前回の編集から一定時間経っていればメッセージに反映します。"""
+        self.text += chunk
+        if time.monotonic() - self._last_edit < self.interval:
+            return
+        try:
+            await self._edit(self.CURSOR)
+        except discord.HTTPException as e:
+            # 途中の編集に失敗しても、最後の編集で全文を反映する
+            logger.warning(f"Failed to edit streaming message: {e}")
+
+    async def finish(self, text: str | None = None, **kwargs):
+        """全文でメッセージを確定します (view などの追加の引数は edit にそのまま渡します)。"""
+        if text is not None:
+            self.text = text
+        await self._edit("", **kwargs)
@@ -0,0 +1,261 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import config
+from logger_config import logger
+from metrics import GEMINI_QUEUE_DEPTH, GEMINI_QUEUE_WAIT, registry
+
+# 優先度 (値が小さいほど先に処理される)
+PRIORITY_INTERACTIVE = 0  # コンテキストメニューなど、ユーザーが待っている呼び出し
+PRIORITY_MESSAGE = 1  # メッセージごとの補足生成
+PRIORITY_BATCH = 2  # 夜間のまとめ生成などのバッチ処理
+
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[int, int]]:
+    """
+    "model:rpm:tpm,model:rpm:tpm" 形式の文字列をパースします。
+
+    Returns:
+        {モデル名: (1分あたりのリクエスト数, 1分あたりのトークン数)}
+    """
+    limits = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, rpm, tpm = item.rsplit(":", 2)
+        limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+def estimate_tokens(text: str) -> int:
+    """プロンプトのトークン数を文字数から概算します (日本語はおおむね1文字1トークン)。"""
+    return max(1, math.ceil(len(text) * config.GEMINI_TOKENS_PER_CHAR))
+
+
+class TokenBucket:
+    """一定速度で補充されるトークンバケット"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated_at) * self.refill_per_second,
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """amount を取り出せるようになるまでの秒数 (今すぐ取り出せるなら0)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def time_until(self, amount: float) -> float:
+        """amount 分がたまるまでの秒数 (容量を超える量も、補充速度どおりに見積もる)"""
+        self._refill()
+        return max(0.0, (amount - self.tokens) / self.refill_per_second)
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    sequence: int
+    tokens: int = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class Slot:
+    """スケジューラから割り当てられた1回分の呼び出し枠"""
+
+    model: str
+    estimated_tokens: int
+    used_tokens: int | None = None
+
+
+class _ModelLimiter:
+    """1モデル分のRPM/TPMバケットと優先度付き待ち行列"""
+
+    def __init__(self, model: str, rpm: int, tpm: int):
+        headroom = config.GEMINI_RATE_HEADROOM
+        burst = config.GEMINI_RATE_BURST_RATIO
+        rpm = max(1.0, rpm * headroom)
+        tpm = max(1.0, tpm * headroom)
+        # バースト幅を1分間の上限より小さくして、短時間に枠を使い切らないよう平滑化する
+        self.requests = TokenBucket(max(1.0, math.ceil(rpm * burst)), rpm / 60)
+        self.tokens = TokenBucket(max(1.0, tpm * burst), tpm / 60)
+        self.model = model
+        self.waiters: list[_Waiter] = []
+        self.timer: asyncio.TimerHandle | None = None
+
+    def dispatch(self):
+        """先頭の待機者から、両方のバケットに余裕がある限り枠を割り当てる"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.waiters:
+            waiter = self.waiters[0]
+            if waiter.future.done():
+                heapq.heappop(self.waiters)
+                continue
+            delay = max(
+                self.requests.wait_time(1), self.tokens.wait_time(waiter.tokens)
+            )
+            if delay > 0:
+                loop = asyncio.get_running_loop()
+                self.timer = loop.call_later(delay, self.dispatch)
+                return
+            heapq.heappop(self.waiters)
+            self.requests.take(1)
+            self.tokens.take(waiter.tokens)
+            waiter.future.set_result(None)
+
+
+class GeminiScheduler:
+    """
+    すべてのGemini呼び出しが通る、モデルごとのレート制御スケジューラ。
+
+    モデルごとに1分あたりのリクエスト数(RPM)とトークン数(TPM)のトークンバケットを持ち、
+    待機中の呼び出しは優先度順 (同じ優先度なら到着順) に枠を割り当てます。
+    上限を超えてから再試行するのではなく、上限に達する前に呼び出しを待たせます。
+    レート制限の定義がないモデルは制御せずにそのまま通します。
+    """
+
+    def __init__(self, limits: dict[str, tuple[int, int]] | None = None):
+        if limits is None:
+            limits = parse_rate_limits(config.GEMINI_RATE_LIMITS)
+        self._limiters = {
+            model: _ModelLimiter(model, rpm, tpm)
+            for model, (rpm, tpm) in limits.items()
+        }
+        self._sequence = itertools.count()
+
+    async def acquire(self, model: str, priority: int, tokens: int):
+        """
+        指定モデルの呼び出し枠が空くまで待機します。
+
+        Args:
+            model: モデル名。
+            priority: 優先度 (PRIORITY_*)。
+            tokens: 見積もりトークン数。
+        """
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            return
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            limiter.waiters,
+            _Waiter(priority, next(self._sequence), tokens, future),
+        )
+        limiter.dispatch()
+        if not future.done():
+            logger.debug(
+                f"Waiting for Gemini quota: model={model}, priority={priority}, "
+                f"queued={len(limiter.waiters)}"
+            )
+        try:
+            await future
+        except asyncio.CancelledError:
+            # キャンセルされた待機者は dispatch 時に取り除かれる
+            limiter.dispatch()
+            raise
+        GEMINI_QUEUE_WAIT.observe(time.monotonic() - started, model=model)
+
+    def settle(self, model: str, estimated_tokens: int, used_tokens: int):
+        """実際の使用トークン数で見積もりとの差分をバケットに反映します。"""
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            return
+        difference = used_tokens - estimated_tokens
+        if difference > 0:
+            limiter.tokens.take(difference)
+        elif difference < 0:
+            limiter.tokens.give_back(-difference)
+            limiter.dispatch()
+
+    def penalize(self, model: str):
+        """レート制限エラーを受けた場合に、そのモデルのバケットを空にして送信を控えます。"""
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            return
+        logger.warning(f"Gemini quota exhausted for {model}, draining rate buckets")
+        limiter.requests.drain()
+        limiter.tokens.drain()
+
+    def queue_depth(self, model: str | None = None) -> int:
+        """待機中の呼び出し数を返します。"""
+        if model is None:
+            limiters = list(self._limiters.values())
+        else:
+            limiters = [self._limiters[model]] if model in self._limiters else []
+        return sum(
+            sum(1 for w in limiter.waiters if not w.future.done())
+            for limiter in limiters
+        )
+
+    def estimate_wait(self, model: str, tokens: int) -> float:
+        """
+        今 tokens の呼び出しを追加した場合に、枠が割り当てられるまでのおおよその秒数。
+
+        待機中の呼び出しの分もバケットから引かれるものとして見積もります (優先度は考慮しません)。
+        """
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            return 0.0
+        waiting = [w for w in limiter.waiters if not w.future.done()]
+        return max(
+            limiter.requests.time_until(1 + len(waiting)),
+            limiter.tokens.time_until(tokens + sum(w.tokens for w in waiting)),
+        )
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int, estimated_tokens: int):
+        """
+        呼び出し枠を確保するコンテキストマネージャ。
+
+        ブロック内で slot.used_tokens に実際の使用トークン数を設定すると、
+        終了時に見積もりとの差分が精算されます。
+        """
+        await self.acquire(model, priority, estimated_tokens)
+        current = Slot(model=model, estimated_tokens=estimated_tokens)
+        try:
+            yield current
+        finally:
+            if current.used_tokens is not None:
+                self.settle(model, estimated_tokens, current.used_tokens)
+
+    def collect_metrics(self):
+        """モデルごとの待機数をメトリクスに反映します。"""
+        for model in self._limiters:
+            GEMINI_QUEUE_DEPTH.set(self.queue_depth(model), model=model)
+
+
+# すべての ai_summarizer の呼び出しで共有するスケジューラ
+scheduler = GeminiScheduler()
+registry.add_collector(scheduler.collect_metrics)
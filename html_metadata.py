@@ -0,0 +1,197 @@
+import asyncio
+import codecs
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+import aiohttp
+
+CHUNK_SIZE = 8192
+DEFAULT_CHARSET = "utf-8"
+
+_HEAD_END_PATTERN = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+_META_CHARSET_PATTERN = re.compile(
+    rb"""<meta[^>]+charset\s*=\s*["']?\s*([a-zA-Z0-9_\-:.]+)""", re.IGNORECASE
+)
+_HEADER_CHARSET_PATTERN = re.compile(r"charset\s*=\s*[\"']?([^\s;\"']+)", re.IGNORECASE)
+
+# 取得対象の <meta> キー (name / property 属性の値)
+_META_KEYS = {
+    "description",
+    "og:title",
+    "og:description",
+    "og:image",
+    "og:image:url",
+    "og:image:secure_url",
+    "twitter:title",
+    "twitter:description",
+    "twitter:image",
+    "twitter:image:src",
+}
+
+
+@dataclass
+class PageMetadata:
+    """ページの<head>から抽出したメタデータ"""
+
+    title: str | None = None
+    description: str | None = None
+    image_url: str | None = None
+
+
+class _HeadMetadataParser(HTMLParser):
+    """<head> 内の <title> と <meta> だけを拾う軽量パーサー"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title_parts: list[str] = []
+        self.meta: dict[str, str] = {}
+        self._in_title = False
+        self._done = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._done:
+            return
+        if tag == "body":
+            self._done = True
+        elif tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            attr_map = {k.lower(): v for k, v in attrs if v is not None}
+            key = (attr_map.get("property") or attr_map.get("name") or "").lower()
+            content = attr_map.get("content")
+            # 同じキーが複数ある場合は最初のものを優先する
+            if key in _META_KEYS and content and key not in self.meta:
+                self.meta[key] = content.strip()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag == "head":
+            self._done = True
+
+    def handle_data(self, data):
+        if self._in_title and not self._done:
+            self.title_parts.append(data)
+
+
+def detect_charset(content_type: str | None, head_bytes: bytes) -> str:
+    """
+    Content-Type ヘッダーと <meta charset> / http-equiv から文字コードを判定します。
+
+    Args:
+        content_type: レスポンスの Content-Type ヘッダー。
+        head_bytes: ページ先頭のバイト列。
+
+    Returns:
+        Pythonで利用可能なエンコーディング名。判定できない場合は utf-8。
+    """
+    candidates = []
+    if content_type:
+        match = _HEADER_CHARSET_PATTERN.search(content_type)
+        if match:
+            candidates.append(match.group(1))
+    match = _META_CHARSET_PATTERN.search(head_bytes)
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+
+    for candidate in candidates:
+        try:
+            return codecs.lookup(candidate.strip()).name
+        except LookupError:
+            continue
+    return DEFAULT_CHARSET
+
+
+def extract_metadata(
+    head_bytes: bytes, content_type: str | None, base_url: str
+) -> PageMetadata:
+    """
+    <head> 部分のバイト列からタイトル、説明文、画像URLを抽出します。
+
+    CPUを使う処理のため、イベントループ上では asyncio.to_thread 経由で呼び出してください。
+
+    Args:
+        head_bytes: ページ先頭 (</head> まで、または上限まで) のバイト列。
+        content_type: レスポンスの Content-Type ヘッダー。
+        base_url: 相対URLを解決するための基準URL。
+
+    Returns:
+        抽出した PageMetadata。
+    """
+    charset = detect_charset(content_type, head_bytes)
+    html = head_bytes.decode(charset, errors="replace")
+
+    parser = _HeadMetadataParser()
+    parser.feed(html)
+    parser.close()
+
+    meta = parser.meta
+    title = " ".join("".join(parser.title_parts).split()) or None
+    title = title or meta.get("og:title") or meta.get("twitter:title")
+    description = (
+        meta.get("description")
+        or meta.get("og:description")
+        or meta.get("twitter:description")
+    )
+    image_url = (
+        meta.get("og:image")
+        or meta.get("og:image:secure_url")
+        or meta.get("og:image:url")
+        or meta.get("twitter:image")
+        or meta.get("twitter:image:src")
+    )
+    if image_url:
+        image_url = urljoin(base_url, image_url)
+
+    return PageMetadata(title=title, description=description, image_url=image_url)
+
+
+async def read_head(response: aiohttp.ClientResponse, max_bytes: int) -> bytes:
+    """
+    レスポンス本文をストリーミングで読み込み、</head> (または <body>) に達するか
+    max_bytes を超えた時点で読み込みを打ち切ります。
+
+    Args:
+        response: aiohttp のレスポンス。
+        max_bytes: 読み込む最大バイト数。
+
+    Returns:
+        読み込んだ先頭部分のバイト列。
+    """
+    buffer = bytearray()
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        # チャンク境界をまたいだタグも検出できるよう、少し手前から探索する
+        search_from = max(0, len(buffer) - 16)
+        buffer.extend(chunk)
+        match = _HEAD_END_PATTERN.search(buffer, search_from)
+        if match:
+            del buffer[match.end() :]
+            break
+        if len(buffer) >= max_bytes:
+            del buffer[max_bytes:]
+            break
+    return bytes(buffer)
+
+
+async def fetch_page_metadata(
+    response: aiohttp.ClientResponse, max_bytes: int
+) -> PageMetadata:
+    """
+    レスポンスの<head>だけを読み込み、メタデータの解析をスレッドで実行します。
+
+    Args:
+        response: ステータス200の aiohttp のレスポンス。
+        max_bytes: 読み込む最大バイト数。
+
+    Returns:
+        抽出した PageMetadata。
+    """
+    head_bytes = await read_head(response, max_bytes)
+    return await asyncio.to_thread(
+        extract_metadata,
+        head_bytes,
+        response.headers.get("Content-Type"),
+        str(response.url),
+    )
@@ -0,0 +1,40 @@
+import aiohttp
+
+import config
+from logger_config import logger
+
+USER_AGENT = "Mozilla/5.0 (compatible; Obsidian-discord-bot; +https://github.com/ry2x/Obsidian-discord)"
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """
+    Botの稼働中ずっと使い回す共有HTTPセッションを作成します。
+
+    コネクションプール(全体/ホスト毎の上限)、DNSキャッシュ、keep-alive、
+    接続/読み取りタイムアウトを設定し、URLごとのDNS/TCP/TLSのセットアップを省きます。
+    イベントループ上で呼び出す必要があります。
+
+    Returns:
+        設定済みの aiohttp.ClientSession。
+    """
+    connector = aiohttp.TCPConnector(
+        limit=config.HTTP_POOL_LIMIT,
+        limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=config.HTTP_DNS_CACHE_TTL,
+        use_dns_cache=True,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config.HTTP_TOTAL_TIMEOUT,
+        sock_connect=config.HTTP_CONNECT_TIMEOUT,
+        sock_read=config.HTTP_READ_TIMEOUT,
+    )
+    logger.info(
+        f"Created shared HTTP session (limit={config.HTTP_POOL_LIMIT}, "
+        f"per_host={config.HTTP_POOL_LIMIT_PER_HOST})"
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={"User-Agent": USER_AGENT},
+    )
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import config
+from logger_config import logger
+from metrics import JOB_FAILURES
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DEAD = "dead"
+
+
+class PermanentJobError(Exception):
+    """再試行しても成功しない失敗 (元メッセージの削除など)。即座にデッドレターへ送られます。"""
+
+
+JobHandler = Callable[[str, dict[str, Any]], Awaitable[None]]
+
+
+class JobQueue:
+    """
+    SQLiteのジャーナルに永続化されるバックグラウンドジョブキュー。
+
+    enqueue したジョブはコミットされてから呼び出し元に戻るため、クラッシュしても失われません。
+    固定数のワーカーがジョブを取り出して handler(kind, payload) を実行し、
+    失敗時は指数バックオフで再試行、max_attempts 回失敗したジョブは dead 状態で残します
+    (requeue_dead() で再実行できます)。
+    start() 時には前回実行中のまま終了したジョブを pending に戻して再実行します。
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        path: str | None = None,
+        workers: int = config.JOB_WORKERS,
+        max_attempts: int = config.JOB_MAX_ATTEMPTS,
+        retry_base_delay: float = config.JOB_RETRY_BASE_DELAY,
+        retry_max_delay: float = config.JOB_RETRY_MAX_DELAY,
+    ):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "jobs.sqlite3")
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_run_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_next_run "
+            "ON jobs (status, next_run_at)"
+        )
+        self._conn.commit()
+        self._wakeup = asyncio.Event()
+        self._worker_tasks: list[asyncio.Task] = []
+
+    # --- 同期処理 (スレッド上で実行される) ---
+
+    def _insert(self, kind: str, payload: dict[str, Any]) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO jobs (kind, payload, status, next_run_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    kind,
+                    json.dumps(payload, ensure_ascii=False),
+                    STATUS_PENDING,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _claim(self) -> tuple[int, str, dict[str, Any], int] | float | None:
+        """実行可能なジョブを running にして返す。なければ次の実行予定時刻 (なければ None)。"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """
+                SELECT id, kind, payload, attempts FROM jobs
+                WHERE status = ? AND next_run_at <= ?
+                ORDER BY id LIMIT 1
+                """,
+                (STATUS_PENDING, now),
+            ).fetchone()
+            if row is None:
+                (next_run_at,) = self._conn.execute(
+                    "SELECT MIN(next_run_at) FROM jobs WHERE status = ?",
+                    (STATUS_PENDING,),
+                ).fetchone()
+                return next_run_at
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                (STATUS_RUNNING, now, row[0]),
+            )
+            self._conn.commit()
+        return row[0], row[1], json.loads(row[2]), row[3]
+
+    def _complete(self, job_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.commit()
+
+    def _fail(self, job_id: int, attempts: int, error: str, permanent: bool) -> bool:
+        """失敗を記録する。デッドレターに送った場合は True。"""
+        now = time.time()
+        dead = permanent or attempts >= self.max_attempts
+        delay = min(
+            self.retry_base_delay * (2 ** (attempts - 1)), self.retry_max_delay
+        ) * random.uniform(0.8, 1.2)
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE jobs SET status = ?, attempts = ?, next_run_at = ?,
+                    last_error = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (
+                    STATUS_DEAD if dead else STATUS_PENDING,
+                    attempts,
+                    now + delay,
+                    error,
+                    now,
+                    job_id,
+                ),
+            )
+            self._conn.commit()
+        return dead
+
+    def _requeue(self, kind: str | None) -> int:
+        now = time.time()
+        query = (
+            "UPDATE jobs SET status = ?, attempts = 0, next_run_at = ?, updated_at = ? "
+            "WHERE status = ?"
+        )
+        params: tuple = (STATUS_PENDING, now, now, STATUS_DEAD)
+        if kind is not None:
+            query += " AND kind = ?"
+            params += (kind,)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _recover(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ? WHERE status = ?",
+                (STATUS_PENDING, STATUS_RUNNING),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def _count(self, status: str) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)
+            ).fetchone()
+        return count
+
+    # --- 非同期API ---
+
+    async def enqueue(self, kind: str, payload: dict[str, Any]) -> int:
+        """
+        ジョブをジャーナルに書き込み、ワーカーを起こします。
+
+        Args:
+            kind: ジョブの種類。
+            payload: JSONにシリアライズ可能なジョブの内容。
+
+        Returns:
+            ジョブID。
+        """
+        job_id = await asyncio.to_thread(self._insert, kind, payload)
+        self._wakeup.set()
+        logger.debug(f"Enqueued job {job_id} ({kind})")
+        return job_id
+
+    async def start(self):
+        """未完了のジョブを復旧し、ワーカーを起動します。"""
+        recovered = await asyncio.to_thread(self._recover)
+        if recovered:
+            logger.info(f"Recovered {recovered} interrupted job(s)")
+        pending = await asyncio.to_thread(self._count, STATUS_PENDING)
+        logger.info(f"Starting {self.workers} job worker(s), {pending} pending job(s)")
+        self._worker_tasks = [
+            asyncio.create_task(self._run_worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """ワーカーを停止します。実行中だったジョブは次回の start() で再実行されます。"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        with self._lock:
+            self._conn.close()
+
+    async def pending_count(self) -> int:
+        """未処理 (再試行待ちを含む) のジョブ数を返します。"""
+        return await asyncio.to_thread(self._count, STATUS_PENDING)
+
+    async def dead_count(self) -> int:
+        """デッドレターに送られたジョブ数を返します。"""
+        return await asyncio.to_thread(self._count, STATUS_DEAD)
+
+    async def requeue_dead(self, kind: str | None = None) -> int:
+        """
+        デッドレターのジョブを試行回数をリセットして pending に戻し、ワーカーを起こします。
+
+        Args:
+            kind: 指定した場合は、その種類のジョブだけを戻します。
+
+        Returns:
+            戻したジョブ数。
+        """
+        requeued = await asyncio.to_thread(self._requeue, kind)
+        if requeued:
+            self._wakeup.set()
+            logger.info(f"Requeued {requeued} dead job(s)")
+        return requeued
+
+    async def _run_worker(self, worker_id: int):
+        while True:
+            # 取り出しより前にクリアし、その間に積まれたジョブの通知を取りこぼさない
+            self._wakeup.clear()
+            claimed = await asyncio.to_thread(self._claim)
+            if not isinstance(claimed, tuple):
+                # 実行可能なジョブがなければ、新規ジョブか次の再試行時刻まで待つ
+                timeout = 60.0
+                if claimed is not None:
+                    timeout = max(0.0, min(timeout, claimed - time.time()))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except TimeoutError:
+                    pass
+                continue
+
+            job_id, kind, payload, attempts = claimed
+            try:
+                await self.handler(kind, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # noqa: BLE001 - 失敗したジョブは再試行かデッドレターに回す
+                permanent = isinstance(e, PermanentJobError)
+                dead = await asyncio.to_thread(
+                    self._fail, job_id, attempts + 1, repr(e), permanent
+                )
+                JOB_FAILURES.inc(kind=kind, result="dead" if dead else "retry")
+                if dead:
+                    logger.error(
+                        f"Job {job_id} ({kind}) moved to dead letter after "
+                        f"{attempts + 1} attempt(s): {e}"
+                    )
+                else:
+                    logger.warning(
+                        f"Job {job_id} ({kind}) failed (attempt {attempts + 1}), "
+                        f"will retry: {e}"
+                    )
+                    self._wakeup.set()
+            else:
+                await asyncio.to_thread(self._complete, job_id)
+                logger.debug(f"Worker {worker_id} completed job {job_id} ({kind})")
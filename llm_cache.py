@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import config
+from logger_config import logger
+
+
+def make_cache_key(model: str, prompt: str, generate_config) -> str:
+    """
+    モデル名、プロンプト、生成設定からキャッシュキー(SHA-256)を作成します。
+
+    Args:
+        model: モデル名。
+        prompt: プロンプト文字列。
+        generate_config: GenerateContentConfig (pydanticモデル) または dict。
+
+    Returns:
+        16進数のハッシュ文字列。
+    """
+    if hasattr(generate_config, "model_dump"):
+        config_dump = generate_config.model_dump(mode="json", exclude_none=True)
+    else:
+        config_dump = generate_config or {}
+    payload = json.dumps(
+        {"model": model, "prompt": prompt, "config": config_dump},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    LLMの応答テキストをコンテンツアドレスで保存する2段キャッシュ。
+
+    メモリ上のLRU (LLM_CACHE_MEMORY_ITEMS件) の背後に SQLite の永続ストアを置きます。
+    エントリごとにTTLを持ち、永続ストアの合計サイズが LLM_CACHE_MAX_BYTES を超えると
+    最終アクセスが古いものから削除されます。関数名ごとにヒット/ミス数を数えます。
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        memory_items: int = config.LLM_CACHE_MEMORY_ITEMS,
+        max_bytes: int = config.LLM_CACHE_MAX_BYTES,
+    ):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "llm_cache.sqlite3")
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        # key -> (value, expires_at)
+        self._memory: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        # name -> {"memory_hits", "disk_hits", "misses"}
+        self.counters: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        )
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access "
+            "ON llm_cache (last_access)"
+        )
+        self._conn.commit()
+        logger.info(f"Opened LLM response cache: {path}")
+
+    def _remember(self, key: str, value: str, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _get_from_disk(self, key: str) -> tuple[str, float] | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+        return row[0], row[1]
+
+    def _put_to_disk(self, key: str, name: str, value: str, expires_at: float):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_cache
+                    (key, name, value, size, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, name, value, size, expires_at, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        (total,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY last_access ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        logger.debug(f"Evicted {removed} LLM cache entries")
+
+    async def get(self, key: str, name: str) -> str | None:
+        """
+        キャッシュされた応答を取得します。
+
+        Args:
+            key: make_cache_key で作成したキー。
+            name: 集計用の関数名。
+
+        Returns:
+            キャッシュされた応答テキスト。存在しないか期限切れの場合は None。
+        """
+        counter = self.counters[name]
+        cached = self._memory.get(key)
+        if cached is not None:
+            if cached[1] > time.time():
+                self._memory.move_to_end(key)
+                counter["memory_hits"] += 1
+                return cached[0]
+            del self._memory[key]
+
+        cached = await asyncio.to_thread(self._get_from_disk, key)
+        if cached is not None:
+            self._remember(key, *cached)
+            counter["disk_hits"] += 1
+            return cached[0]
+
+        counter["misses"] += 1
+        return None
+
+    async def put(self, key: str, name: str, value: str, ttl: int):
+        """
+        応答をメモリと永続ストアの両方に保存します。
+
+        Args:
+            key: make_cache_key で作成したキー。
+            name: 関数名。
+            value: 応答テキスト。
+            ttl: 有効期間(秒)。0以下の場合は保存しません。
+        """
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        await asyncio.to_thread(self._put_to_disk, key, name, value, expires_at)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """関数名ごとのヒット/ミス数を返します。"""
+        return {name: dict(counter) for name, counter in self.counters.items()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
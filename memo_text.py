@@ -0,0 +1,115 @@
+import re
+
+# デイリーノートのエントリ先頭の時刻行 (例: "14:05")
+_TIMESTAMP_LINE = re.compile(r"^\d{2}:\d{2}$")
+_URL_TITLE_LINE = re.compile(r"^>\s*タイトル:\s*(.*)$")
+# URLの概要の見出し (URLが複数の場合は "> URLの概要: <url>"、以前の "> URLの概要 (<url>):" も含む)
+_URL_SUMMARY_LINE = re.compile(r"^>\s*URLの概要\s*[:(]")
+
+# 後から内容を埋める位置を示す行 (Obsidian のコメントなので表示されない)
+_PLACEHOLDER_LINE = re.compile(r"^%%[a-z]+:\d+%%$")
+
+# Bot自身が追記する引用ブロックの見出し
+AI_TIP_HEADER = "> [!info] AI's Small Tip"
+URL_SUMMARY_HEADER = "> URLの概要:"
+LOOKUP_RESULT_PREFIX = "> [info] "
+
+
+def placeholder(kind: str, message_id: int) -> str:
+    """後から内容を埋める位置を示す行 (例: "%%tip:123%%") を返します。"""
+    return f"%%{kind}:{message_id}%%"
+
+
+def compact_memo(text: str) -> str:
+    """
+    デイリーノートのメモ部分から、Botが追記したブロックを取り除きます。
+
+    AI's Small Tip と検索結果のブロック、画像の埋め込み、プレースホルダーは削除し、
+    URLの概要はタイトルだけの1行に圧縮します。連続する空行は1行にまとめます。
+
+    Args:
+        text: "## メモ" 以降のテキスト。
+
+    Returns:
+        要約に渡すための圧縮済みテキスト。
+    """
+    output = []
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+        if stripped.startswith((AI_TIP_HEADER, LOOKUP_RESULT_PREFIX)):
+            i += 1
+            while i < len(lines) and lines[i].startswith(">"):
+                i += 1
+            continue
+        if _URL_SUMMARY_LINE.match(stripped):
+            i += 1
+            title = None
+            while i < len(lines) and lines[i].startswith(">"):
+                match = _URL_TITLE_LINE.match(lines[i].strip())
+                if match and title is None:
+                    title = match.group(1).strip()
+                i += 1
+            if title:
+                output.append(f"(リンク: {title})")
+            continue
+        if (
+            stripped.startswith("![[") and stripped.endswith("]]")
+        ) or _PLACEHOLDER_LINE.match(stripped):
+            i += 1
+            continue
+        if stripped or (output and output[-1].strip()):
+            output.append(line)
+        i += 1
+    return "\n".join(output).strip()
+
+
+def split_entries(text: str) -> list[str]:
+    """
+    メモのテキストを、時刻行で始まるエントリごとに分割します。
+
+    Args:
+        text: メモのテキスト。
+
+    Returns:
+        エントリ文字列のリスト。時刻行より前のテキストがあれば先頭の要素になります。
+    """
+    entries: list[list[str]] = [[]]
+    for line in text.splitlines():
+        if _TIMESTAMP_LINE.match(line.strip()) and any(
+            part.strip() for part in entries[-1]
+        ):
+            entries.append([])
+        entries[-1].append(line)
+    return ["\n".join(entry).strip() for entry in entries if "\n".join(entry).strip()]
+
+
+def chunk_entries(entries: list[str], max_tokens: int, count_tokens) -> list[str]:
+    """
+    エントリを、1チャンクあたり max_tokens 以下になるよう順番にまとめます。
+
+    1件で max_tokens を超えるエントリは単独のチャンクになります。
+
+    Args:
+        entries: エントリのリスト。
+        max_tokens: 1チャンクあたりの最大トークン数。
+        count_tokens: テキストのトークン数を返す関数。
+
+    Returns:
+        チャンク文字列のリスト。
+    """
+    chunks = []
+    current: list[str] = []
+    current_tokens = 0
+    for entry in entries:
+        tokens = count_tokens(entry)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(entry)
+        current_tokens += tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
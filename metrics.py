@@ -0,0 +1,417 @@
+import asyncio
+import inspect
+import math
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from logger_config import logger
+
+# 既定のヒストグラムの上限値 (秒)。Geminiの呼び出しやまとめ生成の長い処理まで含める
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = (f'{name}="{_escape(str(value))}"' for name, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    """ラベルの組ごとに値を持つメトリクスの基底クラス"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def series(self) -> list[tuple[dict[str, str], object]]:
+        """(ラベル, 値) の一覧"""
+        return [(self._labels(key), value) for key, value in self._values.items()]
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for key, value in sorted(self._values.items()):
+            lines.extend(self._render_series(self._labels(key), value))
+        return lines
+
+    def _render_series(self, labels: dict[str, str], value) -> list[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """増加だけする累計値 (リクエスト数、トークン数など)"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """現在値 (キューの長さなど)"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class _HistogramValue:
+    __slots__ = ("bucket_counts", "count", "sum")
+
+    def __init__(self, buckets: int):
+        self.bucket_counts = [0] * buckets
+        self.count = 0
+        self.sum = 0.0
+
+
+class Histogram(_Metric):
+    """
+    観測値の分布 (処理時間など) を固定の区間ごとの件数で保持するメトリクス。
+
+    分位点は Prometheus の histogram_quantile と同じく、該当する区間内の線形補間で推定します。
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = _HistogramValue(len(self.buckets))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state.bucket_counts[i] += 1
+                break
+        state.count += 1
+        state.sum += value
+
+    @contextmanager
+    def timer(self, **labels):
+        """
+        ブロックの処理時間を記録します。ラベルの辞書を返すため、ブロック内で結果を書き換えられます。
+
+        ラベルに outcome がある場合、例外で抜けたときは "error" (取り消しは "cancelled") にします。
+        """
+        started = time.perf_counter()
+        try:
+            yield labels
+        except asyncio.CancelledError:
+            if "outcome" in labels:
+                labels["outcome"] = "cancelled"
+            raise
+        except Exception:
+            if "outcome" in labels:
+                labels["outcome"] = "error"
+            raise
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def quantile(self, q: float, **labels) -> float | None:
+        """
+        分位点 (0〜1) を推定します。観測がなければ None。
+
+        labels を省略したラベルは、すべての値を合算して求めます。
+        """
+        counts = [0] * len(self.buckets)
+        total = 0
+        for key, state in self._values.items():
+            series_labels = self._labels(key)
+            if any(series_labels[name] != str(v) for name, v in labels.items()):
+                continue
+            for i, count in enumerate(state.bucket_counts):
+                counts[i] += count
+            total += state.count
+        if total == 0:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                if math.isinf(self.buckets[i]):
+                    # 最後の区間は上限がないため、有限の最大の境界を返す
+                    return self.buckets[i - 1] if i > 0 else 0.0
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+    def count(self, **labels) -> int:
+        """観測数 (labels を省略したラベルは合算)"""
+        return sum(
+            state.count
+            for key, state in self._values.items()
+            if all(self._labels(key)[name] == str(v) for name, v in labels.items())
+        )
+
+    def _render_series(self, labels: dict[str, str], value: _HistogramValue):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value.bucket_counts):
+            cumulative += count
+            bucket_labels = {**labels, "le": _format_value(bound)}
+            lines.append(
+                f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {value.sum!r}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {value.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Bot内の処理のメトリクスを集めるレジストリ。
+
+    メトリクスはイベントループ上から更新する前提で、ロックは取りません。
+    キューの長さのように都度求める値は、add_collector で登録した関数が
+    出力の直前にゲージへ設定します (関数は同期・非同期のどちらでも構いません)。
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, tuple(labelnames)))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, tuple(labelnames)))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames=(),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, documentation, tuple(labelnames), buckets)
+        )
+
+    def add_collector(self, collector: Callable):
+        """出力の直前に呼ばれる関数 (ゲージの更新用) を登録します。"""
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    async def collect(self):
+        """登録された関数を呼び出して、都度求める値を更新します。"""
+        for collector in list(self._collectors):
+            try:
+                result = collector()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:  # noqa: BLE001 - 1つの失敗で他のメトリクスの出力を止めない
+                logger.warning(f"Metrics collector failed: {e}")
+
+    async def render(self) -> str:
+        """Prometheus のテキスト形式で全メトリクスを出力します。"""
+        await self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Bot全体で共有するレジストリと、各処理のメトリクス
+registry = MetricsRegistry()
+
+GEMINI_REQUESTS = registry.counter(
+    "gemini_requests_total",
+    "Gemini API calls by model, function and outcome.",
+    ("model", "function", "outcome"),
+)
+GEMINI_LATENCY = registry.histogram(
+    "gemini_request_duration_seconds",
+    "Gemini API call latency (until the last chunk for streaming calls).",
+    ("model", "function"),
+)
+GEMINI_QUEUE_WAIT = registry.histogram(
+    "gemini_queue_wait_seconds",
+    "Time spent waiting for a rate-limit slot in the Gemini scheduler.",
+    ("model",),
+)
+GEMINI_TOKENS = registry.counter(
+    "gemini_tokens_total",
+    "Tokens reported by Gemini usage_metadata.",
+    ("model", "function", "type"),
+)
+GEMINI_RETRIES = registry.counter(
+    "gemini_retries_total",
+    "Retries of Gemini calls after rate-limit errors.",
+    ("function",),
+)
+LLM_CACHE_LOOKUPS = registry.counter(
+    "llm_cache_lookups_total",
+    "LLM response cache lookups.",
+    ("function", "result"),
+)
+MODEL_ROUTE_DECISIONS = registry.counter(
+    "model_route_decisions_total",
+    "Model routing attempts by chosen model, reason and outcome.",
+    ("task", "model", "reason", "outcome"),
+)
+GEMINI_QUEUE_DEPTH = registry.gauge(
+    "gemini_scheduler_queue_depth",
+    "Calls waiting for a rate-limit slot.",
+    ("model",),
+)
+URL_FETCH = registry.histogram(
+    "url_fetch_duration_seconds",
+    "URL metadata lookup latency by outcome.",
+    ("outcome",),
+)
+THUMBNAIL_DOWNLOAD = registry.histogram(
+    "thumbnail_download_duration_seconds",
+    "Thumbnail download and transcoding latency by outcome.",
+    ("outcome",),
+)
+THUMBNAIL_BYTES = registry.counter(
+    "thumbnail_bytes_total",
+    "Thumbnail bytes downloaded and stored.",
+    ("stage",),
+)
+NOTE_WRITE = registry.histogram(
+    "note_write_duration_seconds",
+    "Time to append one coalesced batch to a note file.",
+)
+NOTE_WRITE_ENTRIES = registry.counter(
+    "note_write_entries_total",
+    "Entries appended to note files.",
+)
+NOTE_WRITE_QUEUE_DEPTH = registry.gauge(
+    "note_write_queue_depth",
+    "Appends waiting in the note writer queues.",
+)
+MEMO_PROCESS = registry.histogram(
+    "memo_process_duration_seconds",
+    "Time to turn one message into a daily note entry.",
+    ("outcome",),
+)
+MEMO_LATENCY = registry.histogram(
+    "memo_end_to_end_seconds",
+    "Time from receiving a message to its entry being written.",
+)
+JOB_QUEUE_JOBS = registry.gauge(
+    "job_queue_jobs",
+    "Jobs in the memo job journal by status.",
+    ("status",),
+)
+JOB_FAILURES = registry.counter(
+    "job_failures_total",
+    "Failed memo jobs by whether they will be retried or moved to the dead letter.",
+    ("kind", "result"),
+)
+SUMMARY_RUN = registry.histogram(
+    "summary_run_duration_seconds",
+    "Nightly summary run latency by outcome.",
+    ("outcome",),
+)
+SUMMARY_STAGE = registry.histogram(
+    "summary_stage_duration_seconds",
+    "Nightly summary latency per stage.",
+    ("stage",),
+)
+
+
+def record_retry(retry_state):
+    """tenacity の before_sleep に渡して、再試行の回数を数えます。"""
+    GEMINI_RETRIES.inc(function=retry_state.fn.__name__)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        text=await registry.render(),
+        content_type="text/plain",
+        charset="utf-8",
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
+
+
+async def start_http_server(host: str, port: int) -> web.AppRunner:
+    """
+    /metrics で Prometheus 形式のメトリクスを返すHTTPサーバーを起動します。
+
+    Returns:
+        停止時に cleanup() を呼ぶ AppRunner。
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
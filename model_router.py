@@ -0,0 +1,309 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+import config
+from gemini_scheduler import scheduler
+from logger_config import logger
+from metrics import MODEL_ROUTE_DECISIONS
+
+# ai_summarizer の呼び出しをまとめたタスクの種類
+TASK_SUMMARY = "summary"  # 夜間のまとめ (要約・タグ・解説)
+TASK_DIGEST = "digest"  # map フェーズの要点圧縮とローリングダイジェスト
+TASK_SUPPLEMENT = "supplement"  # メッセージごとの補足・話題の生成
+TASK_TOPICS = "topics"  # 話題の抽出
+TASK_TOPIC_SUMMARY = "topic_summary"  # 話題の概要
+TASKS = (TASK_SUMMARY, TASK_DIGEST, TASK_SUPPLEMENT, TASK_TOPICS, TASK_TOPIC_SUMMARY)
+
+# 経路の選択理由 (1回目の試行)。2回目以降の試行は REASON_FALLBACK
+REASON_PRIMARY = "primary"  # 先頭のモデルをそのまま使う
+REASON_SLO = "slo"  # 先頭のモデルでは目標時間に収まらない見込み
+REASON_COOLDOWN = "cooldown"  # 先頭のモデルがレート制限を受けた直後
+REASON_FALLBACK = "fallback"  # 前のモデルが失敗した
+
+# 応答時間の指数移動平均の重み
+_EWMA_ALPHA = 0.2
+# 起動時に応答時間の初期値として読み込む直近の記録数
+_SEED_ROWS = 1000
+
+
+def parse_model_routes(spec: str) -> dict[str, list[str]]:
+    """
+    "task=model>model,task=model>model" 形式の文字列をパースします。
+
+    Returns:
+        {タスク名: [試す順のモデル名, ...]}
+    """
+    routes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        task, chain = item.split("=", 1)
+        models = [model.strip() for model in chain.split(">") if model.strip()]
+        if models:
+            routes[task.strip()] = models
+    return routes
+
+
+def parse_route_slos(spec: str) -> dict[str, float]:
+    """
+    "task=秒,task=秒" 形式の文字列をパースします。
+
+    Returns:
+        {タスク名: 目標応答時間(秒)}
+    """
+    slos = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        task, seconds = item.split("=", 1)
+        slos[task.strip()] = float(seconds)
+    return slos
+
+
+@dataclass
+class RouteChoice:
+    """1回の試行で使うモデル"""
+
+    model: str
+    reason: str
+    # 応答時間の予測 (記録がない場合は None)
+    predicted_seconds: float | None
+    # この試行を打ち切る秒数 (最後の試行は None で打ち切らない)
+    timeout: float | None
+
+
+@dataclass
+class _LatencyEstimate:
+    """(タスク, モデル) ごとの応答時間と入力トークン数の指数移動平均"""
+
+    seconds: float
+    tokens: float
+
+    def update(self, seconds: float, tokens: int):
+        self.seconds += _EWMA_ALPHA * (seconds - self.seconds)
+        self.tokens += _EWMA_ALPHA * (tokens - self.tokens)
+
+    def predict(self, tokens: int) -> float:
+        # 応答時間の半分は入力の量によらず、残りは入力トークン数に比例するものとみなす
+        return self.seconds * (0.5 + 0.5 * tokens / max(self.tokens, 1.0))
+
+
+class ModelRouter:
+    """
+    タスクごとのモデルの経路 (先頭から順に試すモデルの列) を管理するクラス。
+
+    各モデルの応答時間を入力トークン数とあわせて記録し、スケジューラでの枠待ちの見込みと
+    合わせて目標時間 (SLO) に収まらないモデルや、レート制限を受けて間もないモデルは
+    後回しにします。呼び出し側は plan() の順にモデルを試し、レート制限やタイムアウトの場合は
+    次のモデルにフォールバックします。選択と結果はすべてSQLiteに記録し、調整に使えるようにします。
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, list[str]] | None = None,
+        slos: dict[str, float] | None = None,
+        path: str | None = None,
+        cooldown: float = config.MODEL_ROUTE_COOLDOWN,
+        max_rows: int = config.MODEL_ROUTE_LOG_MAX_ROWS,
+    ):
+        if routes is None:
+            routes = parse_model_routes(config.MODEL_ROUTES)
+        if slos is None:
+            slos = parse_route_slos(config.MODEL_ROUTE_SLOS)
+        missing = [task for task in TASKS if task not in routes]
+        if missing:
+            raise ValueError(f"MODEL_ROUTES has no route for: {', '.join(missing)}")
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "model_routes.sqlite3")
+        self.routes = routes
+        self.slos = slos
+        self.cooldown = cooldown
+        self.max_rows = max_rows
+        self._latency: dict[tuple[str, str], _LatencyEstimate] = {}
+        self._cooldown_until: dict[str, float] = {}
+        self._writes: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS route_decisions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                task TEXT NOT NULL,
+                function TEXT NOT NULL,
+                model TEXT NOT NULL,
+                attempt INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                estimated_tokens INTEGER NOT NULL,
+                predicted_seconds REAL,
+                seconds REAL NOT NULL,
+                outcome TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self._seed_latency()
+        logger.info(f"Opened model route log: {path}")
+
+    def _seed_latency(self):
+        """前回までの記録から、成功した呼び出しの応答時間の初期値を読み込みます。"""
+        rows = self._conn.execute(
+            """
+            SELECT task, model, AVG(seconds), AVG(estimated_tokens)
+            FROM (
+                SELECT task, model, seconds, estimated_tokens FROM route_decisions
+                WHERE outcome = 'ok' ORDER BY id DESC LIMIT ?
+            )
+            GROUP BY task, model
+            """,
+            (_SEED_ROWS,),
+        ).fetchall()
+        for task, model, seconds, tokens in rows:
+            self._latency[(task, model)] = _LatencyEstimate(seconds, tokens)
+
+    def primary(self, task: str) -> str:
+        """タスクの経路の先頭のモデル (応答キャッシュのキーに使う) を返します。"""
+        return self.routes[task][0]
+
+    def predict(self, task: str, model: str, tokens: int) -> float | None:
+        """応答時間の予測 (秒)。まだ記録がない場合は None を返します。"""
+        estimate = self._latency.get((task, model))
+        return estimate.predict(tokens) if estimate else None
+
+    def plan(self, task: str, estimated_tokens: int) -> list[RouteChoice]:
+        """
+        タスクの呼び出しで試すモデルを、試す順に返します。
+
+        枠待ちの見込みと応答時間の予測の合計が SLO を超えるモデルと、レート制限を受けて
+        MODEL_ROUTE_COOLDOWN 秒以内のモデルは、経路の順序を保ったまま末尾に回します
+        (すべてが該当する場合も、最後の手段として試します)。
+        最後の試行以外は、枠を確保してからのAPIの呼び出しを SLO の秒数で打ち切り、
+        次のモデルに切り替えます (枠待ちは見込みとして選択に含めるだけで、打ち切りの対象にしない)。
+
+        Args:
+            task: タスク名 (TASK_*)。
+            estimated_tokens: 見積もりトークン数。
+        """
+        slo = self.slos.get(task)
+        now = time.monotonic()
+        ready, deferred = [], []
+        skipped_reason = None
+        for model in self.routes[task]:
+            predicted = self.predict(task, model, estimated_tokens)
+            if self._cooldown_until.get(model, 0.0) > now:
+                reason = REASON_COOLDOWN
+            elif (
+                slo is not None
+                and scheduler.estimate_wait(model, estimated_tokens)
+                + (predicted or 0.0)
+                > slo
+            ):
+                reason = REASON_SLO
+            else:
+                ready.append((model, predicted))
+                continue
+            deferred.append((model, predicted))
+            skipped_reason = skipped_reason or reason
+
+        ordered = ready + deferred
+        choices = []
+        for i, (model, predicted) in enumerate(ordered):
+            if i > 0:
+                reason = REASON_FALLBACK
+            elif model == self.primary(task):
+                reason = REASON_PRIMARY
+            else:
+                reason = skipped_reason
+            last = i == len(ordered) - 1
+            choices.append(RouteChoice(model, reason, predicted, None if last else slo))
+        if choices[0].reason != REASON_PRIMARY:
+            logger.info(
+                f"Routing {task} to {choices[0].model} "
+                f"({choices[0].reason}, ~{estimated_tokens} tokens)"
+            )
+        return choices
+
+    def record(
+        self,
+        task: str,
+        function: str,
+        choice: RouteChoice,
+        attempt: int,
+        estimated_tokens: int,
+        seconds: float,
+        outcome: str,
+    ):
+        """
+        1回の試行の結果を記録します。
+
+        seconds はスケジューラの枠を確保してからの時間です (枠待ちは estimate_wait で別に見込む)。
+        成功とタイムアウトは応答時間の予測に反映し (タイムアウトは下限として扱う)、
+        レート制限の場合はそのモデルを一定時間後回しにします。SQLiteへの書き込みは
+        バックグラウンドで行います (ストリームの後始末からも呼べるよう、待機しません)。
+
+        Args:
+            outcome: "ok", "rate_limited", "timeout", "error", "cancelled" のいずれか。
+        """
+        if outcome in ("ok", "timeout"):
+            key = (task, choice.model)
+            estimate = self._latency.get(key)
+            if estimate is None:
+                self._latency[key] = _LatencyEstimate(seconds, estimated_tokens)
+            else:
+                estimate.update(seconds, estimated_tokens)
+        elif outcome == "rate_limited":
+            self._cooldown_until[choice.model] = time.monotonic() + self.cooldown
+        MODEL_ROUTE_DECISIONS.inc(
+            task=task, model=choice.model, reason=choice.reason, outcome=outcome
+        )
+        row = (
+            time.time(),
+            task,
+            function,
+            choice.model,
+            attempt,
+            choice.reason,
+            estimated_tokens,
+            choice.predicted_seconds,
+            seconds,
+            outcome,
+        )
+        write = asyncio.create_task(asyncio.to_thread(self._insert, row))
+        self._writes.add(write)
+        write.add_done_callback(self._writes.discard)
+
+    # --- 同期処理 (スレッド上で実行される) ---
+
+    def _insert(self, row: tuple):
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO route_decisions (
+                    created_at, task, function, model, attempt, reason,
+                    estimated_tokens, predicted_seconds, seconds, outcome
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                row,
+            )
+            # 直近 max_rows 件だけを残す
+            self._conn.execute(
+                "DELETE FROM route_decisions WHERE id <= ?",
+                (cursor.lastrowid - self.max_rows,),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# すべての ai_summarizer の呼び出しで共有するルーター
+model_router = ModelRouter()
@@ -0,0 +1,255 @@
+import asyncio
+import os
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+import config
+from logger_config import logger
+from metrics import NOTE_WRITE, NOTE_WRITE_ENTRIES, NOTE_WRITE_QUEUE_DEPTH, registry
+
+FSYNC_NONE = "none"
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+
+
+@dataclass
+class _WriteRequest:
+    """書き込みキューに積まれる1件の要求"""
+
+    future: asyncio.Future
+    text: str | None = None
+    template: str | None = None
+    func: Callable[[], Any] | None = None
+    size: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        if self.text is not None:
+            self.size = len(self.text)
+
+
+class NoteWriter:
+    """
+    ノートファイルへの追記をファイルごとに1つの書き込みタスクへ集約するクラス。
+
+    追記要求はファイルごとの asyncio.Queue に積まれ、書き込みタスクが
+    連続する要求をまとめて1回の書き込み(スレッド上)で反映します。
+    キューの順序どおりに書き込まれ、1件の要求が途中で他の要求と混ざることはありません。
+    ファイルが存在しない場合は最初の要求のテンプレートを先に書き込みます。
+    """
+
+    def __init__(
+        self,
+        fsync_policy: str = config.NOTE_FSYNC,
+        fsync_interval: float = config.NOTE_FSYNC_INTERVAL,
+        coalesce_delay: float = config.NOTE_COALESCE_DELAY,
+        max_batch_bytes: int = config.NOTE_MAX_BATCH_BYTES,
+        idle_timeout: float = config.NOTE_WRITER_IDLE_TIMEOUT,
+    ):
+        if fsync_policy not in (FSYNC_NONE, FSYNC_ALWAYS, FSYNC_INTERVAL):
+            raise ValueError(f"Unknown NOTE_FSYNC policy: {fsync_policy}")
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.coalesce_delay = coalesce_delay
+        self.max_batch_bytes = max_batch_bytes
+        self.idle_timeout = idle_timeout
+        self._queues: dict[str, asyncio.Queue[_WriteRequest]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._last_fsync: dict[str, float] = {}
+
+    def _enqueue(self, path: str, request: _WriteRequest) -> asyncio.Future:
+        path = os.path.abspath(path)
+        queue = self._queues.get(path)
+        if queue is None:
+            queue = asyncio.Queue()
+            self._queues[path] = queue
+            self._tasks[path] = asyncio.create_task(self._run_writer(path, queue))
+        queue.put_nowait(request)
+        return request.future
+
+    async def append(self, path: str, text: str, template: str | None = None):
+        """
+        ファイルに追記します。書き込みが完了するまで待機します。
+
+        Args:
+            path: 追記先のファイルパス。
+            text: 追記する文字列 (1件のエントリ全体)。
+            template: ファイルが存在しない場合に先頭へ書き込む文字列。
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._enqueue(
+            path, _WriteRequest(future=future, text=text, template=template)
+        )
+
+    async def run_exclusive(self, path: str, func: Callable[[], Any]) -> Any:
+        """
+        ファイルへの他の書き込みと順序を保ったまま、同期関数をスレッド上で実行します。
+
+        それ以前に積まれた追記がすべて反映された後に実行され、実行中に
+        同じファイルへの追記が割り込むことはありません。
+
+        Args:
+            path: 対象のファイルパス。
+            func: 実行する同期関数。
+
+        Returns:
+            func の戻り値。
+        """
+        future = asyncio.get_running_loop().create_future()
+        return await self._enqueue(path, _WriteRequest(future=future, func=func))
+
+    async def read(self, path: str) -> str | None:
+        """保留中の追記を反映した後のファイル内容を読み込みます。存在しなければ None。"""
+
+        def _read():
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+
+        return await self.run_exclusive(path, _read)
+
+    async def replace_once(self, path: str, old: str, new: str) -> bool:
+        """
+        保留中の追記を反映した後、ファイル内の最初の old を new に置き換えます。
+
+        一時ファイルに書き込んでから置き換えるため、途中で落ちても元の内容が残ります。
+
+        Returns:
+            置き換えた場合は True。ファイルがないか old が見つからない場合は False。
+        """
+
+        def _replace():
+            if not os.path.exists(path):
+                return False
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            if old not in text:
+                return False
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text.replace(old, new, 1))
+                f.flush()
+                if self._should_fsync(path):
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            return True
+
+        return await self.run_exclusive(path, _replace)
+
+    async def _run_writer(self, path: str, queue: asyncio.Queue[_WriteRequest]):
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except TimeoutError:
+                    # 一定時間書き込みがなければタスクを終了する (日付ごとにファイルが変わるため)
+                    self._queues.pop(path, None)
+                    self._tasks.pop(path, None)
+                    self._last_fsync.pop(path, None)
+                    return
+
+                if first.func is not None:
+                    await self._run_call(first)
+                    continue
+
+                # 短時間待って、バースト中の追記を1回の書き込みにまとめる
+                if self.coalesce_delay > 0 and queue.empty():
+                    await asyncio.sleep(self.coalesce_delay)
+                batch = [first]
+                batch_bytes = first.size
+                pending_call = None
+                while not queue.empty() and batch_bytes < self.max_batch_bytes:
+                    request = queue.get_nowait()
+                    if request.func is not None:
+                        # 関数の実行要求はこのバッチの書き込み後に順番どおり実行する
+                        pending_call = request
+                        break
+                    batch.append(request)
+                    batch_bytes += request.size
+
+                try:
+                    with NOTE_WRITE.timer():
+                        await asyncio.to_thread(self._write_batch, path, batch)
+                except Exception as e:  # noqa: BLE001 - 追記を待っている呼び出し元に渡す
+                    logger.error(f"Failed to write note {path}: {e}")
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_exception(e)
+                else:
+                    for request in batch:
+                        if not request.future.done():
+                            request.future.set_result(None)
+                    NOTE_WRITE_ENTRIES.inc(len(batch))
+                    logger.debug(f"Wrote {len(batch)} entries to {path}")
+                if pending_call is not None:
+                    await self._run_call(pending_call)
+        except asyncio.CancelledError:
+            # 停止時に残っている要求は失敗として通知する
+            while not queue.empty():
+                request = queue.get_nowait()
+                if not request.future.done():
+                    request.future.cancel()
+            raise
+
+    async def _run_call(self, request: _WriteRequest):
+        try:
+            result = await asyncio.to_thread(request.func)
+        except Exception as e:  # noqa: BLE001 - 呼び出し元に渡す
+            if not request.future.done():
+                request.future.set_exception(e)
+        else:
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def _write_batch(self, path: str, batch: list[_WriteRequest]):
+        parts = []
+        if not os.path.exists(path):
+            template = next((r.template for r in batch if r.template), None)
+            if template:
+                parts.append(template)
+        parts.extend(request.text for request in batch)
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("".join(parts))
+            f.flush()
+            if self._should_fsync(path):
+                os.fsync(f.fileno())
+
+    def _should_fsync(self, path: str) -> bool:
+        if self.fsync_policy == FSYNC_ALWAYS:
+            return True
+        if self.fsync_policy == FSYNC_INTERVAL:
+            now = time.monotonic()
+            if now - self._last_fsync.get(path, 0.0) >= self.fsync_interval:
+                self._last_fsync[path] = now
+                return True
+        return False
+
+    async def flush(self):
+        """現在キューに積まれているすべての書き込みの完了を待ちます。"""
+        await asyncio.gather(
+            *(self.run_exclusive(path, lambda: None) for path in list(self._queues)),
+            return_exceptions=True,
+        )
+
+    async def close(self):
+        """保留中の書き込みを反映してから、すべての書き込みタスクを停止します。"""
+        await self.flush()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queues.clear()
+        self._tasks.clear()
+        self._last_fsync.clear()
+
+    def collect_metrics(self):
+        """キューに積まれている書き込み要求の数をメトリクスに反映します。"""
+        NOTE_WRITE_QUEUE_DEPTH.set(sum(q.qsize() for q in self._queues.values()))
+
+
+# Bot全体で共有する書き込みパイプライン
+note_writer = NoteWriter()
+registry.add_collector(note_writer.collect_metrics)
@@ -0,0 +1,266 @@
+import asyncio
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+import numpy as np
+from scipy import sparse
+
+import config
+from logger_config import logger
+from search_index import tokenize
+from vault_index import vault_index
+
+
+@dataclass
+class _Row:
+    """TF-IDF 行列の1行 (1ノート) 分の語の出現回数"""
+
+    kind: str
+    name: str
+    mtime: float
+    size: int
+    term_ids: np.ndarray
+    counts: np.ndarray
+
+
+@dataclass
+class _Corpus:
+    """ボルト全体の正規化済み TF-IDF 行列 (ノートが変わるまで使い回す)"""
+
+    names: np.ndarray
+    matrix: sparse.csr_matrix
+    idf: np.ndarray
+    unseen_idf: float
+
+
+class RelatedNotes:
+    """
+    ノート間の TF-IDF コサイン類似度から関連ノートを求めるクラス。
+
+    語は検索インデックスと同じ文字 n-gram を使い、ノートごとの出現回数をメモリ上に保持します。
+    mtime とサイズが変わったノートだけを読み直すため、行列の更新は変更分の
+    トークン化と、保持している配列を連結した疎行列の組み立てだけで済みます。
+    類似度は対象ノートをまとめた行列とボルト全体の行列の積で一括して計算します。
+    ボルト全体の行列はノートが変わるまで保持し、呼び出しごとには対象ノートの行列だけを作ります。
+    語彙はボルト内のノートに現れる語だけで、対象ノートにしか現れない語は語彙に加えません。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # 語 → 列番号 (挿入順が列番号の順になる)
+        self._vocabulary: dict[str, int] = {}
+        self._rows: dict[str, _Row] = {}
+        self._corpus: _Corpus | None = None
+
+    def _vectorize(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        """ボルト内のノートの本文を語の出現回数にします (新しい語は語彙に加えます)。"""
+        counts = Counter(tokenize(text))
+        term_ids = np.fromiter(
+            (
+                self._vocabulary.setdefault(term, len(self._vocabulary))
+                for term in counts
+            ),
+            dtype=np.int64,
+            count=len(counts),
+        )
+        values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        return term_ids, values
+
+    def _vectorize_query(self, text: str) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        対象ノートの本文を語の出現回数にします。語彙は変更しません。
+
+        語彙にない語はどのノートとも共通しないため行列には含めませんが、
+        ベクトルの大きさには含める必要があるため、その出現回数を別に返します。
+
+        Returns:
+            (語彙にある語の列番号, その出現回数, 語彙にない語の出現回数)
+        """
+        counts = Counter(tokenize(text))
+        known = [
+            (self._vocabulary[term], count)
+            for term, count in counts.items()
+            if term in self._vocabulary
+        ]
+        term_ids = np.array([term_id for term_id, _ in known], dtype=np.int64)
+        values = np.array([count for _, count in known], dtype=np.float64)
+        unseen = np.array(
+            [count for term, count in counts.items() if term not in self._vocabulary],
+            dtype=np.float64,
+        )
+        return term_ids, values, unseen
+
+    def _compact_vocabulary(self):
+        """どのノートにも現れなくなった語を語彙から除き、列番号を詰め直します。"""
+        rows = list(self._rows.values())
+        if rows:
+            used = np.unique(np.concatenate([row.term_ids for row in rows]))
+        else:
+            used = np.zeros(0, dtype=np.int64)
+        if len(used) == len(self._vocabulary):
+            return
+        mapping = np.full(len(self._vocabulary), -1, dtype=np.int64)
+        mapping[used] = np.arange(len(used))
+        terms = list(self._vocabulary)
+        self._vocabulary = {terms[old]: new for new, old in enumerate(used.tolist())}
+        for row in rows:
+            row.term_ids = mapping[row.term_ids]
+
+    def _refresh(self) -> int:
+        """VaultIndex と比べて変更のあったノートの行を作り直します。"""
+        records = vault_index.records()
+        seen = set()
+        changed = 0
+        for record in records:
+            seen.add(record.path)
+            row = self._rows.get(record.path)
+            if row and (row.mtime, row.size) == (record.mtime, record.size):
+                continue
+            try:
+                with open(record.path, "r", encoding="utf-8") as f:
+                    term_ids, counts = self._vectorize(f.read())
+            except (OSError, UnicodeDecodeError) as e:
+                logger.warning(f"Failed to read {record.path} for related notes: {e}")
+                continue
+            self._rows[record.path] = _Row(
+                record.kind, record.name, record.mtime, record.size, term_ids, counts
+            )
+            changed += 1
+        removed = [path for path in self._rows if path not in seen]
+        for path in removed:
+            del self._rows[path]
+        if changed or removed:
+            self._compact_vocabulary()
+            self._corpus = None
+        return changed
+
+    def _matrix(self, rows: list[tuple[np.ndarray, np.ndarray]]) -> sparse.csr_matrix:
+        lengths = [len(term_ids) for term_ids, _ in rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        if rows:
+            indices = np.concatenate([term_ids for term_ids, _ in rows])
+            data = np.concatenate([counts for _, counts in rows])
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            data = np.zeros(0, dtype=np.float64)
+        matrix = sparse.csr_matrix(
+            (np.log1p(data), indices, indptr),
+            shape=(len(rows), len(self._vocabulary)),
+        )
+        matrix.sum_duplicates()
+        return matrix
+
+    @staticmethod
+    def _normalize(
+        matrix: sparse.csr_matrix, extra_squares: np.ndarray | None = None
+    ) -> sparse.csr_matrix:
+        squares = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+        if extra_squares is not None:
+            squares = squares + extra_squares
+        norms = np.sqrt(squares)
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ matrix
+
+    def _corpus_model(self) -> _Corpus:
+        """ボルト全体の TF-IDF 行列を返します (前回から変更がなければ保持しているものを使います)。"""
+        if self._corpus is not None:
+            return self._corpus
+        rows = list(self._rows.values())
+        matrix = self._matrix([(row.term_ids, row.counts) for row in rows])
+        # 逆文書頻度はボルト内のノートから求める
+        document_frequency = np.bincount(
+            matrix.indices, minlength=len(self._vocabulary)
+        )
+        document_count = len(rows)
+        idf = np.log((1 + document_count) / (1 + document_frequency)) + 1
+        self._corpus = _Corpus(
+            names=np.array([row.name for row in rows], dtype=object),
+            matrix=self._normalize(matrix @ sparse.diags(idf)).tocsr(),
+            idf=idf,
+            unseen_idf=np.log(1 + document_count) + 1,
+        )
+        return self._corpus
+
+    def _find(
+        self,
+        targets: dict[tuple[str, str], str],
+        top_k: int,
+        min_similarity: float,
+        exclude: dict[tuple[str, str], set[str]],
+    ) -> dict[tuple[str, str], list[str]]:
+        with self._lock:
+            changed = self._refresh()
+            if changed:
+                logger.info(f"Related notes: re-vectorized {changed} note(s)")
+            if not self._rows:
+                return {key: [] for key in targets}
+            corpus = self._corpus_model()
+            queries = [self._vectorize_query(text) for text in targets.values()]
+            query_matrix = self._matrix(
+                [(term_ids, counts) for term_ids, counts, _ in queries]
+            )
+            unseen_squares = np.array(
+                [
+                    np.sum((np.log1p(unseen) * corpus.unseen_idf) ** 2)
+                    for _, _, unseen in queries
+                ]
+            )
+            query_matrix = self._normalize(
+                query_matrix @ sparse.diags(corpus.idf), unseen_squares
+            )
+            similarities = (query_matrix @ corpus.matrix.T).toarray()
+
+        results = {}
+        names = corpus.names
+        for i, key in enumerate(targets):
+            scores = similarities[i]
+            # 自分自身と、既にリンクしているノートは除く
+            scores[np.isin(names, list(exclude.get(key, set()) | {key[1]}))] = -1.0
+            candidates = np.argsort(-scores)[:top_k]
+            results[key] = [names[j] for j in candidates if scores[j] >= min_similarity]
+        return results
+
+    async def refresh(self):
+        """変更のあったノートを読み直し、次回の計算に備えます。"""
+
+        def _refresh_locked():
+            with self._lock:
+                return self._refresh()
+
+        changed = await asyncio.to_thread(_refresh_locked)
+        if changed:
+            logger.debug(f"Related notes: re-vectorized {changed} note(s)")
+
+    async def find_related(
+        self,
+        targets: dict[tuple[str, str], str],
+        exclude: dict[tuple[str, str], set[str]] | None = None,
+        top_k: int = config.RELATED_NOTES_TOP_K,
+        min_similarity: float = config.RELATED_NOTES_MIN_SIMILARITY,
+    ) -> dict[tuple[str, str], list[str]]:
+        """
+        対象ノートごとに、類似度の高いノートの名前を返します。
+
+        Args:
+            targets: {(種類, ノート名): 本文}。まだ書き込んでいないノートの内容も渡せます。
+            exclude: {(種類, ノート名): 結果から除くノート名の集合}。
+            top_k: 1ノートあたりの最大件数。
+            min_similarity: これ未満のコサイン類似度のノートは含めません。
+
+        Returns:
+            {(種類, ノート名): [関連ノート名, ...]} (類似度の高い順)
+        """
+        return await asyncio.to_thread(
+            self._find, targets, top_k, min_similarity, exclude or {}
+        )
+
+
+def format_related_section(names: list[str], heading: str = "## 関連ノート") -> str:
+    """関連ノートへのリンクを並べたセクション (前後の改行なし) を作ります。"""
+    return f"{heading}\n" + " ".join(f"[[{name}]]" for name in names)
+
+
+# Bot全体で共有する関連ノートの計算器
+related_notes = RelatedNotes()
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import config
+from ai_summarizer import update_rolling_digest
+from logger_config import logger
+from memo_text import compact_memo
+from state_files import write_json_atomic
+
+
+class RollingDigest:
+    """
+    メモの追記に合わせて、その日の要約(ダイジェスト)を少しずつ更新するクラス。
+
+    状態は STATE_DIR/digests/{日付}.json に保存されます。追記されたエントリはまず
+    未反映エントリとして保存され、ROLLING_DIGEST_DEBOUNCE 秒ごとにまとめて
+    LLMでダイジェストへ反映されます。日付が変わった後のまとめ生成では、
+    全文の代わりにこのダイジェストを入力にできます。
+    """
+
+    def __init__(
+        self,
+        state_dir: str | None = None,
+        debounce: float = config.ROLLING_DIGEST_DEBOUNCE,
+    ):
+        self.state_dir = state_dir or os.path.join(config.STATE_DIR, "digests")
+        self.debounce = debounce
+        # 日付ごとのロックと、その取得を待っている処理の数 (0 になったら破棄する)
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._lock_users: Counter[str] = Counter()
+        self._timers: dict[str, asyncio.Task] = {}
+
+    def _state_path(self, date_str: str) -> str:
+        return os.path.join(self.state_dir, f"{date_str}.json")
+
+    def _load(self, date_str: str) -> dict:
+        path = self._state_path(date_str)
+        if not os.path.exists(path):
+            return {"digest": "", "entries": 0, "pending": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, date_str: str, state: dict):
+        state["updated_at"] = time.time()
+        write_json_atomic(self._state_path(date_str), state)
+
+    @asynccontextmanager
+    async def _locked(self, date_str: str):
+        """日付ごとのロックを取得する (使う処理がなくなったロックは破棄する)"""
+        lock = self._locks.setdefault(date_str, asyncio.Lock())
+        self._lock_users[date_str] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[date_str] -= 1
+            if not self._lock_users[date_str]:
+                del self._lock_users[date_str]
+                del self._locks[date_str]
+
+    async def add_entry(self, date_str: str, entry: str):
+        """
+        追記されたエントリを未反映エントリとして保存し、ダイジェストの更新を予約します。
+
+        Args:
+            date_str: yyyy-mm-dd形式の日付文字列。
+            entry: デイリーノートに追記したエントリ。
+        """
+        compacted = compact_memo(entry)
+        async with self._locked(date_str):
+            state = await asyncio.to_thread(self._load, date_str)
+            state["pending"].append(compacted)
+            await asyncio.to_thread(self._save, date_str, state)
+        if date_str not in self._timers:
+            self._timers[date_str] = asyncio.create_task(self._fold_later(date_str))
+
+    async def _fold_later(self, date_str: str):
+        try:
+            await asyncio.sleep(self.debounce)
+        finally:
+            self._timers.pop(date_str, None)
+        await self.fold(date_str)
+
+    async def fold(self, date_str: str) -> dict:
+        """
+        未反映エントリをダイジェストに反映します。
+
+        Returns:
+            更新後の状態 ({"digest", "entries", "pending"})。
+        """
+        async with self._locked(date_str):
+            state = await asyncio.to_thread(self._load, date_str)
+            pending = state["pending"]
+            if not pending:
+                return state
+            try:
+                digest = await update_rolling_digest(state["digest"], pending)
+            except Exception as e:  # noqa: BLE001 - どの失敗でも同じく次回に回す
+                # 未反映エントリは残しておき、次回の更新で再度反映する
+                logger.error(f"Failed to update rolling digest for {date_str}: {e}")
+                return state
+            state["digest"] = digest
+            state["entries"] += len(pending)
+            state["pending"] = []
+            await asyncio.to_thread(self._save, date_str, state)
+            logger.info(
+                f"Updated rolling digest for {date_str} "
+                f"(+{len(pending)} entries, {state['entries']} total)"
+            )
+            return state
+
+    async def finalize(self, date_str: str, expected_entries: int) -> str | None:
+        """
+        未反映エントリを反映し、まとめ生成に使えるダイジェストを返します。
+
+        Args:
+            date_str: yyyy-mm-dd形式の日付文字列。
+            expected_entries: デイリーノート上のエントリ数。
+
+        Returns:
+            ダイジェストが全エントリを反映している場合はその文字列、それ以外は None。
+        """
+        timer = self._timers.pop(date_str, None)
+        if timer is not None:
+            timer.cancel()
+        state = await self.fold(date_str)
+        if state["pending"] or not state["digest"]:
+            return None
+        if state["entries"] < expected_entries:
+            # Obsidian上での手動追記など、ダイジェストに含まれないエントリがある
+            logger.info(
+                f"Rolling digest for {date_str} covers {state['entries']}/"
+                f"{expected_entries} entries, falling back to full summary"
+            )
+            return None
+        return state["digest"]
+
+
+# Bot全体で共有するダイジェスト
+rolling_digest = RollingDigest()
@@ -0,0 +1,462 @@
+import asyncio
+import hashlib
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+import config
+from logger_config import logger
+from memo_text import compact_memo, split_entries
+from vault_index import KIND_DAILY, vault_index
+
+_WORD_PATTERN = re.compile(r"\w+")
+_SQLITE_MAX_VARIABLES = 500
+
+# BM25 のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize(text: str) -> str:
+    """検索用に全角/半角と大文字/小文字の違いを取り除きます。"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    テキストを文字の bi-gram と tri-gram に分割します。
+
+    分かち書きされない日本語でも検索できるよう、記号や空白で区切った
+    各まとまりから連続する2文字・3文字を取り出します。1文字だけのまとまりはそのまま使います。
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(normalize(text)):
+        if len(word) == 1:
+            tokens.append(word)
+            continue
+        tokens.extend(word[i : i + 2] for i in range(len(word) - 1))
+        tokens.extend(word[i : i + 3] for i in range(len(word) - 2))
+    return tokens
+
+
+def _encode_postings(postings: list[tuple[int, int]], last_doc: int) -> bytes:
+    # 文書IDは昇順に追加されるため、直前のIDとの差分と出現回数を可変長整数で並べる
+    out = bytearray()
+    for doc_id, tf in postings:
+        for value in (doc_id - last_doc, tf):
+            while value >= 0x80:
+                out.append((value & 0x7F) | 0x80)
+                value >>= 7
+            out.append(value)
+        last_doc = doc_id
+    return bytes(out)
+
+
+def _decode_postings(data: bytes) -> list[tuple[int, int]]:
+    postings = []
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    doc_id = 0
+    for i in range(0, len(values) - 1, 2):
+        doc_id += values[i]
+        postings.append((doc_id, values[i + 1]))
+    return postings
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def split_documents(content: str, kind: str) -> list[str]:
+    """
+    ノートを検索の単位 (文書) に分割します。
+
+    デイリーノートはメモのエントリごと、まとめ以降をひとまとまりとし、
+    タグノートはファイル全体を1つの文書とします。
+    """
+    if kind != KIND_DAILY:
+        return [content.strip()] if content.strip() else []
+    parts = content.split("## メモ", 1)
+    if len(parts) < 2:
+        return [content.strip()] if content.strip() else []
+    memo, _, summary = parts[1].partition("\n## まとめ")
+    documents = [compact_memo(entry) for entry in split_entries(memo)]
+    if summary.strip():
+        documents.append(f"## まとめ{summary}".strip())
+    return [document for document in documents if document]
+
+
+@dataclass
+class SearchResult:
+    """検索結果の1件"""
+
+    name: str
+    kind: str
+    path: str
+    score: float
+    snippet: str
+
+
+class SearchIndex:
+    """
+    SAVE_DIR と NOTES_DIR のノートに対する全文検索インデックス。
+
+    文字 n-gram の転置インデックスを SQLite に保存し、BM25 でスコア付けします。
+    ポスティングリストは文書IDの差分と出現回数を可変長整数で詰めたバイト列で、
+    新しい文書はリストの末尾に追記するだけで登録できます。
+    文書の長さはメモリ上に保持し、検索時には問い合わせの n-gram の行だけを読み込みます。
+    削除した文書は検索時に除外し、一定数たまった時点でポスティングリストを詰め直します。
+    """
+
+    def __init__(self, path: str | None = None):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "search_index.sqlite3")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_path ON docs (path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL,
+                last_doc INTEGER NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS indexed_files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        self._doc_lengths: dict[int, int] = {}
+        self._total_length = 0
+        self._files: dict[str, tuple[float, int]] = {}
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            for doc_id, length in self._conn.execute("SELECT id, length FROM docs"):
+                self._doc_lengths[doc_id] = length
+            self._total_length = sum(self._doc_lengths.values())
+            for path, mtime, size in self._conn.execute(
+                "SELECT path, mtime, size FROM indexed_files"
+            ):
+                self._files[path] = (mtime, size)
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'next_doc_id'"
+            ).fetchone()
+            self._next_doc_id = row[0] if row else 1
+            row = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'deleted'"
+            ).fetchone()
+            self._deleted = row[0] if row else 0
+        logger.info(
+            f"Loaded search index with {len(self._doc_lengths)} document(s) "
+            f"from {len(self._files)} file(s)"
+        )
+
+    def _save_meta(self):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [("next_doc_id", self._next_doc_id), ("deleted", self._deleted)],
+        )
+
+    # --- 登録・削除 ---
+
+    def _add_documents(self, path: str, kind: str, name: str, texts: list[str]):
+        """文書を登録し、各 n-gram のポスティングリストの末尾に追記します。"""
+        new_postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        for text in texts:
+            doc_id = self._next_doc_id
+            self._next_doc_id += 1
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._conn.execute(
+                """
+                INSERT INTO docs (id, path, kind, name, digest, length, text)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (doc_id, path, kind, name, _digest(text), length, text),
+            )
+            self._doc_lengths[doc_id] = length
+            self._total_length += length
+            for term, tf in counts.items():
+                new_postings[term].append((doc_id, tf))
+        if not new_postings:
+            return
+
+        terms = list(new_postings)
+        last_docs = {}
+        for i in range(0, len(terms), _SQLITE_MAX_VARIABLES):
+            batch = terms[i : i + _SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            last_docs.update(
+                self._conn.execute(
+                    f"SELECT term, last_doc FROM postings WHERE term IN ({placeholders})",
+                    batch,
+                )
+            )
+        updates, inserts = [], []
+        for term, postings in new_postings.items():
+            last_doc = last_docs.get(term)
+            if last_doc is None:
+                data = _encode_postings(postings, 0)
+                inserts.append((term, len(postings), postings[-1][0], data))
+            else:
+                data = _encode_postings(postings, last_doc)
+                updates.append((len(postings), postings[-1][0], data, term))
+        self._conn.executemany(
+            "INSERT INTO postings (term, df, last_doc, data) VALUES (?, ?, ?, ?)",
+            inserts,
+        )
+        self._conn.executemany(
+            """
+            UPDATE postings
+            SET df = df + ?, last_doc = ?, data = CAST(data || ? AS BLOB)
+            WHERE term = ?
+            """,
+            updates,
+        )
+
+    def _delete_documents(self, doc_ids: list[int]):
+        # ポスティングリストには残し、検索時に除外する (詰め直しは _compact で行う)
+        for doc_id in doc_ids:
+            self._total_length -= self._doc_lengths.pop(doc_id, 0)
+            self._conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+        self._deleted += len(doc_ids)
+
+    def _index_file(self, path: str, kind: str, name: str):
+        """ファイルを読み込み、変更のあった文書だけを登録し直します。"""
+        if not os.path.exists(path):
+            self._remove_file(path)
+            return
+        stat = os.stat(path)
+        with open(path, "r", encoding="utf-8") as f:
+            texts = split_documents(f.read(), kind)
+        existing = defaultdict(list)
+        for doc_id, digest in self._conn.execute(
+            "SELECT id, digest FROM docs WHERE path = ?", (path,)
+        ):
+            existing[digest].append(doc_id)
+        added = []
+        for text in texts:
+            ids = existing.get(_digest(text))
+            if ids:
+                ids.pop()
+            else:
+                added.append(text)
+        removed = [doc_id for ids in existing.values() for doc_id in ids]
+        self._delete_documents(removed)
+        self._add_documents(path, kind, name, added)
+        self._set_file_stat(path, stat.st_mtime, stat.st_size)
+
+    def _set_file_stat(self, path: str, mtime: float, size: int):
+        self._files[path] = (mtime, size)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO indexed_files (path, mtime, size) VALUES (?, ?, ?)",
+            (path, mtime, size),
+        )
+
+    def _remove_file(self, path: str):
+        doc_ids = [
+            row[0]
+            for row in self._conn.execute("SELECT id FROM docs WHERE path = ?", (path,))
+        ]
+        self._delete_documents(doc_ids)
+        self._files.pop(path, None)
+        self._conn.execute("DELETE FROM indexed_files WHERE path = ?", (path,))
+
+    def _compact(self):
+        """削除済み文書をポスティングリストから取り除きます。"""
+        rows = self._conn.execute("SELECT term, data FROM postings").fetchall()
+        for term, data in rows:
+            postings = [
+                (doc_id, tf)
+                for doc_id, tf in _decode_postings(data)
+                if doc_id in self._doc_lengths
+            ]
+            if not postings:
+                self._conn.execute("DELETE FROM postings WHERE term = ?", (term,))
+                continue
+            self._conn.execute(
+                "UPDATE postings SET df = ?, last_doc = ?, data = ? WHERE term = ?",
+                (len(postings), postings[-1][0], _encode_postings(postings, 0), term),
+            )
+        logger.info(f"Compacted search index ({self._deleted} deleted document(s))")
+        self._deleted = 0
+
+    def _add_entry(self, path: str, kind: str, name: str, entry: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._files:
+                # 未登録のファイルは全体を登録する (追記したエントリも含まれる)
+                self._index_file(path, kind, name)
+            else:
+                text = compact_memo(entry)
+                exists = self._conn.execute(
+                    "SELECT 1 FROM docs WHERE path = ? AND digest = ?",
+                    (path, _digest(text)),
+                ).fetchone()
+                if text and not exists:
+                    self._add_documents(path, kind, name, [text])
+                stat = os.stat(path)
+                self._set_file_stat(path, stat.st_mtime, stat.st_size)
+            self._save_meta()
+            self._conn.commit()
+
+    def _sync(self) -> tuple[int, int]:
+        records = vault_index.records()
+        seen = set()
+        changed = 0
+        with self._lock:
+            for record in records:
+                seen.add(record.path)
+                if self._files.get(record.path) == (record.mtime, record.size):
+                    continue
+                try:
+                    self._index_file(record.path, record.kind, record.name)
+                    changed += 1
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"Failed to index {record.path} for search: {e}")
+            removed = [path for path in self._files if path not in seen]
+            for path in removed:
+                self._remove_file(path)
+            if self._deleted > max(1000, len(self._doc_lengths) // 4):
+                self._compact()
+            self._save_meta()
+            self._conn.commit()
+        return changed, len(removed)
+
+    # --- 検索 ---
+
+    def _query_terms(self, query: str) -> list[str]:
+        terms = set(tokenize(query))
+        if terms and any(len(term) > 1 for term in terms):
+            return list(terms)
+        # 1文字だけの問い合わせは、その文字で始まる bi-gram で代用する
+        prefixes = [term for term in terms if len(term) == 1]
+        expanded = list(terms)
+        for prefix in prefixes:
+            expanded.extend(
+                row[0]
+                for row in self._conn.execute(
+                    """
+                    SELECT term FROM postings
+                    WHERE term > ? AND term < ? AND length(term) = 2
+                    ORDER BY df DESC LIMIT 200
+                    """,
+                    (prefix, prefix + "\U0010ffff"),
+                )
+            )
+        return expanded
+
+    def _search(self, query: str, limit: int) -> list[SearchResult]:
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if doc_count == 0:
+                return []
+            average_length = self._total_length / doc_count
+            scores: dict[int, float] = defaultdict(float)
+            for term in self._query_terms(query):
+                row = self._conn.execute(
+                    "SELECT df, data FROM postings WHERE term = ?", (term,)
+                ).fetchone()
+                if row is None:
+                    continue
+                df, data = row
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                for doc_id, tf in _decode_postings(data):
+                    length = self._doc_lengths.get(doc_id)
+                    if length is None:
+                        continue
+                    scores[doc_id] += idf * (
+                        tf
+                        * (BM25_K1 + 1)
+                        / (
+                            tf
+                            + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                        )
+                    )
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            results = []
+            for doc_id, score in top:
+                path, kind, name, text = self._conn.execute(
+                    "SELECT path, kind, name, text FROM docs WHERE id = ?", (doc_id,)
+                ).fetchone()
+                results.append(
+                    SearchResult(name, kind, path, score, make_snippet(text, query))
+                )
+            return results
+
+    # --- 非同期API ---
+
+    async def add_entry(self, path: str, kind: str, name: str, entry: str):
+        """
+        追記したエントリを文書として登録します。
+
+        ファイル全体を読み直さずに、追記した分のポスティングだけを末尾に追加します。
+        """
+        await asyncio.to_thread(self._add_entry, path, kind, name, entry)
+
+    async def sync(self):
+        """VaultIndex と比べて変更のあったファイルを登録し直します。"""
+        changed, removed = await asyncio.to_thread(self._sync)
+        if changed or removed:
+            logger.info(f"Search index updated: {changed} changed, {removed} removed")
+
+    async def search(self, query: str, limit: int = 10) -> list[SearchResult]:
+        """BM25 のスコアが高い順に最大 limit 件の文書を返します。"""
+        return await asyncio.to_thread(self._search, query, limit)
+
+
+def make_snippet(text: str, query: str, width: int = 120) -> str:
+    """問い合わせが最初に現れる位置の周辺を抜き出します。"""
+    flat = " ".join(text.split())
+    position = -1
+    lowered = flat.casefold()
+    for word in [query.strip(), *query.split()]:
+        if word:
+            position = lowered.find(word.casefold())
+            if position >= 0:
+                break
+    start = max(0, position - width // 3) if position >= 0 else 0
+    snippet = flat[start : start + width]
+    if start > 0:
+        snippet = "…" + snippet
+    if start + width < len(flat):
+        snippet += "…"
+    return snippet
+
+
+# Bot全体で共有する検索インデックス
+search_index = SearchIndex()
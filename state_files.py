@@ -0,0 +1,16 @@
+import json
+import os
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    JSON を一時ファイルに書き込んでから置き換えます。
+
+    途中で落ちても壊れたJSONが残らず、読み込む側は常に前回か今回の内容を読みます。
+    ディレクトリがなければ作成します。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
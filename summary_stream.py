@@ -0,0 +1,183 @@
+import json
+import os
+import time
+from typing import NamedTuple
+
+import config
+from state_files import write_json_atomic
+
+SECTION_SEPARATOR = "---"
+TAG_PREFIX = "[TAG:"
+
+EVENT_SUMMARY = "summary"
+EVENT_TAGS = "tags"
+EVENT_TAG = "tag"
+
+
+class SummaryEvent(NamedTuple):
+    """まとめの応答から取り出した1セクション"""
+
+    kind: str
+    text: str
+    tag: str | None = None
+
+
+def parse_tags_line(tags_line: str) -> list[str]:
+    """タグの行 (#キーワード1 #キーワード2) からタグ名を取り出します。"""
+    return [word.lstrip("#") for word in tags_line.split() if word.startswith("#")]
+
+
+def _is_tags_line(line: str) -> bool:
+    words = line.split()
+    return bool(words) and all(word.startswith("#") for word in words)
+
+
+class SummaryStreamParser:
+    """
+    まとめの応答 (要約 --- タグ --- [TAG:名前] 解説 ...) を受信しながら分割するパーサ。
+
+    行単位で処理し、セクションが完成した時点でイベントを返します。
+    要約とタグの行は最初の "---" 行で区切りますが、解説の境界は "[TAG:" で始まる行で判定するため、
+    解説の中に現れる "---" (Markdownの水平線など) で解説が途切れることはありません。
+    解説の末尾に残った区切りの "---" 行は取り除きます。
+    """
+
+    def __init__(self, expect_summary: bool = True):
+        # expect_summary=False の場合は解説だけの応答 (不足分の再要求) として扱う
+        self._phase = EVENT_SUMMARY if expect_summary else EVENT_TAG
+        self._pending = ""
+        self._lines: list[str] = []
+        self._tag: str | None = None
+
+    def feed(self, chunk: str) -> list[SummaryEvent]:
+        """受信した断片を追加し、完成したセクションのイベントを返します。"""
+        self._pending += chunk
+        *lines, self._pending = self._pending.split("\n")
+        events = []
+        for line in lines:
+            events.extend(self._process_line(line))
+        return events
+
+    def close(self) -> list[SummaryEvent]:
+        """応答の終わりで、残っているセクションのイベントを返します。"""
+        events = []
+        if self._pending:
+            events.extend(self._process_line(self._pending))
+            self._pending = ""
+        events.extend(self._flush())
+        return events
+
+    def _flush(self) -> list[SummaryEvent]:
+        lines, self._lines = self._lines, []
+        if self._phase == EVENT_TAG:
+            if self._tag is None:
+                return []
+            while lines and lines[-1].strip() in ("", SECTION_SEPARATOR):
+                lines.pop()
+            tag, self._tag = self._tag, None
+            return [SummaryEvent(EVENT_TAG, "\n".join(lines).strip(), tag)]
+        text = "\n".join(lines).strip()
+        kind, self._phase = (
+            (EVENT_SUMMARY, EVENT_TAGS)
+            if self._phase == EVENT_SUMMARY
+            else (EVENT_TAGS, EVENT_TAG)
+        )
+        return [SummaryEvent(kind, text)]
+
+    def _start_tag(self, stripped: str) -> list[SummaryEvent]:
+        events = []
+        if self._phase == EVENT_SUMMARY:
+            # 区切りなしで要約の直後にタグの行が続いた場合は、最後の行をタグの行とみなす
+            while self._lines and not self._lines[-1].strip():
+                self._lines.pop()
+            if self._lines and _is_tags_line(self._lines[-1]):
+                tags_line = self._lines.pop()
+                events.extend(self._flush())
+                self._lines.append(tags_line)
+        # 区切りが省略されていても、タグの解説が始まった時点で前のセクションを確定する
+        while self._phase != EVENT_TAG:
+            events.extend(self._flush())
+        events.extend(self._flush())
+        end = stripped.find("]")
+        self._tag = stripped[len(TAG_PREFIX) : end].strip()
+        rest = stripped[end + 1 :].strip()
+        if rest:
+            self._lines.append(rest)
+        return events
+
+    def _process_line(self, line: str) -> list[SummaryEvent]:
+        stripped = line.strip()
+        if stripped.startswith(TAG_PREFIX) and "]" in stripped:
+            return self._start_tag(stripped)
+        if self._phase == EVENT_TAG:
+            if self._tag is not None:
+                self._lines.append(line)
+            return []
+        if stripped == SECTION_SEPARATOR:
+            if self._phase == EVENT_TAGS and not any(
+                part.strip() for part in self._lines
+            ):
+                # 要約の直後に続く空の区切りは無視する
+                return []
+            return self._flush()
+        self._lines.append(line)
+        return []
+
+
+class SummaryProgress:
+    """
+    まとめ生成の途中経過 (要約・タグ・完成した解説・書き込んだタグノート) を保存するクラス。
+
+    状態は STATE_DIR/summaries/{日付}.json に保存され、入力テキストのハッシュが
+    一致する場合だけ再開に使われます。途中で失敗しても、次の試行では不足している
+    タグの解説だけを再要求できます。
+    """
+
+    def __init__(self, date_str: str, input_digest: str, state_dir: str | None = None):
+        self.state_dir = state_dir or os.path.join(config.STATE_DIR, "summaries")
+        self.path = os.path.join(self.state_dir, f"{date_str}.json")
+        self.input_digest = input_digest
+        self.summary: str | None = None
+        self.tags_line: str | None = None
+        self.explanations: dict[str, str] = {}
+        self.written: dict[str, str] = {}
+
+    def load(self) -> bool:
+        """保存済みの状態を読み込みます。同じ入力の状態があれば True。"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("input_digest") != self.input_digest:
+            return False
+        self.summary = state.get("summary")
+        self.tags_line = state.get("tags_line")
+        self.explanations = state.get("explanations", {})
+        self.written = state.get("written", {})
+        return True
+
+    def save(self):
+        state = {
+            "input_digest": self.input_digest,
+            "summary": self.summary,
+            "tags_line": self.tags_line,
+            "explanations": self.explanations,
+            "written": self.written,
+            "updated_at": time.time(),
+        }
+        write_json_atomic(self.path, state)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def missing_tags(self, canonical) -> list[str]:
+        """タグの行に挙がっているのに、解説がまだないタグ"""
+        if self.tags_line is None:
+            return []
+        done = {canonical(tag) for tag in self.explanations}
+        return [
+            tag
+            for tag in dict.fromkeys(parse_tags_line(self.tags_line))
+            if canonical(tag) not in done
+        ]
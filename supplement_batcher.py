@@ -0,0 +1,79 @@
+import asyncio
+
+import config
+from ai_summarizer import generate_flash_supplement, generate_flash_supplements
+from logger_config import logger
+
+
+class SupplementBatcher:
+    """
+    短時間に届いたメッセージの補足生成を1回のリクエストにまとめるクラス。
+
+    最初の要求から max_wait 秒以内に届いた要求、または max_batch 件に達した時点で
+    generate_flash_supplements をまとめて呼び出し、結果を各要求に返します。
+    1件だけの場合は通常の generate_flash_supplement を使います。
+    """
+
+    def __init__(
+        self,
+        max_batch: int = config.SUPPLEMENT_BATCH_SIZE,
+        max_wait: float = config.SUPPLEMENT_BATCH_MAX_WAIT,
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: list[tuple[str, str | None, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def submit(self, text: str, url_summary: str | None = None) -> str:
+        """
+        補足の生成を依頼し、結果を待ちます。
+
+        Args:
+            text: 対象のテキスト。
+            url_summary: URLの概要（存在する場合）。
+
+        Returns:
+            補足の文字列。
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, url_summary, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, batch: list[tuple[str, str | None, asyncio.Future]]):
+        try:
+            if len(batch) == 1:
+                text, url_summary, _ = batch[0]
+                results = [await generate_flash_supplement(text, url_summary)]
+            else:
+                logger.debug(f"Flushing supplement batch of {len(batch)} message(s)")
+                results = await generate_flash_supplements(
+                    [(text, url_summary) for text, url_summary, _ in batch]
+                )
+        except Exception as e:  # noqa: BLE001 - バッチ内の各呼び出し元に渡す
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import re
+import unicodedata
+
+import config
+from logger_config import logger
+from note_writer import note_writer
+from related_notes import format_related_section
+from vault_index import KIND_TAG, vault_index
+
+# ファイル名に使えない文字 (NFKC で全角の "／" なども半角に変換された後に置き換える)
+_UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|]')
+
+
+def canonical_tag(tag: str) -> str:
+    """
+    表記ゆれを吸収したタグの比較用キーを返します。
+
+    NFKC正規化で全角/半角の違いを、casefold で大文字/小文字の違いを取り除きます。
+    """
+    return unicodedata.normalize("NFKC", tag).strip().lstrip("#").casefold()
+
+
+def _display_name(tag: str) -> str:
+    name = unicodedata.normalize("NFKC", tag).strip().lstrip("#")
+    return _UNSAFE_CHARS.sub("-", name)
+
+
+def resolve_tag_names(tags) -> dict[str, str]:
+    """
+    タグ名を、既存のタグノートと表記を揃えたノート名に対応づけます。
+
+    比較用キーが同じタグノートが既にあればその名前を、なければNFKC正規化した名前を使います。
+
+    Returns:
+        {元のタグ名: ノート名}
+    """
+    existing = {canonical_tag(name): name for name in vault_index.tag_notes()}
+    resolved = {}
+    for tag in tags:
+        key = canonical_tag(tag)
+        if not key:
+            continue
+        name = existing.setdefault(key, _display_name(tag))
+        resolved[tag] = name
+    return resolved
+
+
+def normalize_tags_line(tags_line: str) -> str:
+    """タグの列 (#タグ1 #タグ2) を、ノート名に揃えて重複を除いた形にします。"""
+    tags = [tag for tag in tags_line.split() if tag.startswith("#")]
+    if not tags:
+        return tags_line
+    resolved = resolve_tag_names(tags)
+    names = dict.fromkeys(resolved[tag] for tag in tags if tag in resolved)
+    return " ".join(f"#{name}" for name in names)
+
+
+def _strip_date_link(explanation: str, date_str: str) -> str:
+    # 解説の冒頭の [[日付]] はセクション見出しの直後に付けるリンクと重複するため取り除く
+    explanation = explanation.strip()
+    link = f"[[{date_str}]]"
+    if explanation.startswith(link):
+        explanation = explanation[len(link) :].strip()
+    return explanation
+
+
+def _section(date_str: str, explanations: list[str], related: list[str]) -> str:
+    # 既存のタグノートは末尾に改行がないため、セクションの前に空行を入れて区切る
+    body = "\n\n".join(_strip_date_link(text, date_str) for text in explanations)
+    if related:
+        body += "\n\n" + format_related_section(related, heading="### 関連ノート")
+    return f"\n\n## {date_str}\n\n[[{date_str}]]\n\n{body}"
+
+
+def _has_section(text: str | None, date_str: str) -> bool:
+    pattern = rf"^## {re.escape(date_str)}[ \t]*$"
+    return bool(text and re.search(pattern, text, re.MULTILINE))
+
+
+async def _merge_one(
+    name: str, date_str: str, explanations: list[str], related: list[str]
+) -> bool:
+    path = os.path.join(config.NOTES_DIR, f"{name}.md")
+    record = vault_index.get(KIND_TAG, name)
+    if record is None and os.path.exists(path):
+        # スキャン前のファイルは一度だけ読み込んで登録する
+        await vault_index.update_file(path, KIND_TAG)
+        record = vault_index.get(KIND_TAG, name)
+    # 関連ノートや解説文も [[日付]] にリンクするため、リンクがあれば見出しで確かめる
+    if (
+        record is not None
+        and date_str in record.links
+        and _has_section(await note_writer.read(path), date_str)
+    ):
+        logger.info(f"Tag note {path} already has a section for {date_str}")
+        return False
+
+    text = _section(date_str, explanations, related)
+    await note_writer.append(path, text, template=f"# {name}\n\n#{name}")
+    await vault_index.record_append(path, KIND_TAG, text)
+    logger.info(f"Merged {date_str} section into tag note: {path}")
+    return True
+
+
+async def merge_tag_notes(
+    date_str: str,
+    explanations: dict[str, str],
+    related: dict[str, list[str]] | None = None,
+) -> dict[str, bool]:
+    """
+    タグごとの解説を、タグノートへ日付付きのセクションとして追記します。
+
+    既存のタグノートは書き換えず、末尾に "## 日付" のセクションを追加するだけなので、
+    過去の解説とバックリンクは残り、書き込み量は追加分に比例します。
+    同じ日付のセクションが既にあるノートには追記しません (後から届いた解説を同じセクションに
+    加えることはできないため、同じノートになるタグの解説は1回の呼び出しにまとめて渡します)。
+    表記ゆれで同じキーになるタグは1つのノートにまとめ、各ノートへの追記は並行して行います。
+
+    Args:
+        date_str: yyyy-mm-dd形式の日付文字列。
+        explanations: {タグ名: 解説文}
+        related: {ノート名: 関連ノート名のリスト}。指定されたノートのセクションに関連ノートを添えます。
+
+    Returns:
+        {タグノート名: 追記した場合は True、同じ日付のセクションが既にあった場合は False}。
+        書き込みに失敗したノートは含みません。
+    """
+    os.makedirs(config.NOTES_DIR, exist_ok=True)
+    resolved = resolve_tag_names(explanations)
+    grouped: dict[str, list[str]] = {}
+    for tag, explanation in explanations.items():
+        if tag in resolved:
+            grouped.setdefault(resolved[tag], []).append(explanation)
+
+    results = await asyncio.gather(
+        *(
+            _merge_one(name, date_str, texts, (related or {}).get(name, []))
+            for name, texts in grouped.items()
+        ),
+        return_exceptions=True,
+    )
+    merged = {}
+    for name, result in zip(grouped, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to merge tag note {name}: {result}")
+        else:
+            merged[name] = result
+    return merged
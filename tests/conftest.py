@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+# config は読み込み時に環境変数を参照するため、テスト用の値を先に設定しておく
+_STATE_ROOT = tempfile.mkdtemp(prefix="obsidian-discord-test-")
+for key, value in {
+    "CHANNEL_ID": "1",
+    "GEMINI_API_KEY": "test",
+    "SAVE_DIR": os.path.join(_STATE_ROOT, "memos"),
+    "IMAGE_SAVE_DIR": os.path.join(_STATE_ROOT, "images"),
+    "NOTES_DIR": os.path.join(_STATE_ROOT, "notes"),
+    "STATE_DIR": os.path.join(_STATE_ROOT, "state"),
+}.items():
+    os.environ.setdefault(key, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    # logger_config はカレントディレクトリに bot.log を作るため、一時ディレクトリで実行する
+    os.chdir(_STATE_ROOT)
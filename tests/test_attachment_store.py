@@ -0,0 +1,68 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from attachment_store import AttachmentRejected, AttachmentStore
+from bench.fixture_server import FixtureServer
+
+
+def _store(tmp_path, **kwargs) -> AttachmentStore:
+    images = tmp_path / "images"
+    images.mkdir(exist_ok=True)
+    return AttachmentStore(
+        path=str(tmp_path / "attachments.sqlite3"), save_dir=str(images), **kwargs
+    )
+
+
+def _save(store, keys, content_type="image/png"):
+    async def run():
+        server = FixtureServer(latency=0, attachment_size=(32, 24))
+        base_url = await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                return [
+                    await store.save(
+                        session,
+                        f"{base_url}/attachment/{key}.png",
+                        f"{key}.png",
+                        content_type,
+                    )
+                    for key in keys
+                ]
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = _store(tmp_path)
+    first, second, other = _save(store, ["a", "a", "b"])
+    store.close()
+
+    assert not first.duplicate
+    assert second.duplicate
+    assert second.filename == first.filename == f"{first.sha256}.png"
+    assert other.filename != first.filename
+    assert sorted(p.name for p in (tmp_path / "images").iterdir()) == sorted(
+        [first.filename, other.filename]
+    )
+
+
+def test_type_wildcards_accept_every_subtype(tmp_path):
+    store = _store(tmp_path, allowed_types=frozenset({"image/*"}))
+    store._check("image/heic", None)
+    with pytest.raises(AttachmentRejected):
+        store._check("video/mp4", None)
+    with pytest.raises(AttachmentRejected):
+        store._check("", None)
+    store.close()
+
+
+def test_oversized_downloads_leave_no_partial_file(tmp_path):
+    store = _store(tmp_path, max_bytes=16)
+    assert _save(store, ["a"]) == [None]
+    store.close()
+
+    assert list((tmp_path / "images").iterdir()) == []
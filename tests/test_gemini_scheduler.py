@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+import config
+from gemini_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_MESSAGE,
+    GeminiScheduler,
+    parse_rate_limits,
+)
+
+
+@pytest.fixture(autouse=True)
+def _full_burst(monkeypatch):
+    # 余裕率とバースト幅を外し、設定した RPM/TPM をそのままバケットの容量にする
+    monkeypatch.setattr(config, "GEMINI_RATE_HEADROOM", 1.0)
+    monkeypatch.setattr(config, "GEMINI_RATE_BURST_RATIO", 1.0)
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits(" gemini-2.5-flash:10:250000, models/x:y:5:100,") == {
+        "gemini-2.5-flash": (10, 250000),
+        "models/x:y": (5, 100),
+    }
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    scheduler = GeminiScheduler({"m": (1, 1_000_000)})
+    order = []
+
+    async def call(name, priority):
+        await scheduler.acquire("m", priority, 1)
+        order.append(name)
+
+    async def run():
+        # 最初の呼び出しで1分間の枠を使い切り、残りを待たせる
+        await scheduler.acquire("m", PRIORITY_MESSAGE, 1)
+        tasks = [
+            asyncio.create_task(call("batch", PRIORITY_BATCH)),
+            asyncio.create_task(call("message1", PRIORITY_MESSAGE)),
+            asyncio.create_task(call("interactive", PRIORITY_INTERACTIVE)),
+            asyncio.create_task(call("message2", PRIORITY_MESSAGE)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth("m") == 4
+        limiter = scheduler._limiters["m"]
+        for _ in tasks:
+            # 補充を待つ代わりに1件分ずつ枠を戻す
+            limiter.requests.give_back(1)
+            limiter.dispatch()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "message1", "message2", "batch"]
+
+
+def test_unknown_models_are_not_limited():
+    scheduler = GeminiScheduler({})
+
+    async def run():
+        for _ in range(100):
+            await scheduler.acquire("other", PRIORITY_BATCH, 10_000)
+
+    asyncio.run(run())
+    assert scheduler.estimate_wait("other", 10_000) == 0.0
+
+
+def test_settle_returns_overestimated_tokens():
+    scheduler = GeminiScheduler({"m": (100, 1000)})
+
+    async def run():
+        async with scheduler.slot("m", PRIORITY_MESSAGE, 800) as slot:
+            slot.used_tokens = 200
+
+    asyncio.run(run())
+    assert scheduler._limiters["m"].tokens.tokens == pytest.approx(800, abs=1)
+
+
+def test_estimate_wait_counts_waiters_and_penalties():
+    scheduler = GeminiScheduler({"m": (60, 6000)})
+
+    assert scheduler.estimate_wait("m", 100) == 0.0
+    scheduler.penalize("m")
+    # 空になったバケットは 1 リクエスト/秒、100 トークン/秒で補充される
+    assert scheduler.estimate_wait("m", 100) == pytest.approx(1.0, abs=0.05)
+    assert scheduler.estimate_wait("m", 500) == pytest.approx(5.0, abs=0.05)
@@ -0,0 +1,80 @@
+import asyncio
+
+from html_metadata import detect_charset, extract_metadata, read_head
+
+
+class _Content:
+    def __init__(self, chunks: list[bytes]):
+        self._chunks = chunks
+        self.read_chunks = 0
+
+    async def iter_chunked(self, size: int):
+        for chunk in self._chunks:
+            self.read_chunks += 1
+            yield chunk
+
+
+class _Response:
+    def __init__(self, chunks: list[bytes]):
+        self.content = _Content(chunks)
+
+
+def test_extract_metadata_prefers_title_and_resolves_the_image():
+    head = (
+        "<html><head><title> ページ  題名 </title>"
+        "<meta property='og:title' content='OGの題名'>"
+        "<meta name='description' content=' 説明文 '>"
+        "<meta property='og:image' content='/img/og.png'>"
+        "</head>"
+    ).encode()
+
+    metadata = extract_metadata(head, "text/html", "https://example.com/a/b")
+
+    assert metadata.title == "ページ 題名"
+    assert metadata.description == "説明文"
+    assert metadata.image_url == "https://example.com/img/og.png"
+
+
+def test_extract_metadata_falls_back_to_open_graph():
+    head = b"<head><meta property='og:title' content='OG'></head>"
+
+    metadata = extract_metadata(head, None, "https://example.com/")
+
+    assert metadata.title == "OG"
+    assert metadata.description is None
+    assert metadata.image_url is None
+
+
+def test_detect_charset_from_header_then_meta():
+    head = b"<head><meta charset='shift_jis'></head>"
+
+    assert detect_charset("text/html; charset=EUC-JP", head) == "euc_jp"
+    assert detect_charset("text/html", head) == "shift_jis"
+    assert detect_charset("text/html; charset=unknown", b"") == "utf-8"
+
+
+def test_shift_jis_pages_are_decoded():
+    head = "<head><meta charset='shift_jis'><title>日本語</title></head>".encode(
+        "shift_jis"
+    )
+
+    assert extract_metadata(head, None, "https://example.com/").title == "日本語"
+
+
+def test_read_head_stops_at_the_end_of_head_across_chunks():
+    response = _Response(
+        [b"<html><head><title>t</title></he", b"ad><body>", b"x" * 100]
+    )
+
+    head = asyncio.run(read_head(response, max_bytes=1024))
+
+    assert head == b"<html><head><title>t</title></head>"
+    assert response.content.read_chunks == 2
+
+
+def test_read_head_stops_at_max_bytes():
+    response = _Response([b"<head>" + b"x" * 100, b"y" * 100])
+
+    assert (
+        asyncio.run(read_head(response, max_bytes=50)) == (b"<head>" + b"x" * 100)[:50]
+    )
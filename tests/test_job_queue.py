@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+from job_queue import STATUS_DEAD, JobQueue, PermanentJobError
+
+
+async def _wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not await condition():
+        assert time.monotonic() < deadline, "condition was not met in time"
+        await asyncio.sleep(0.01)
+
+
+def _queue(tmp_path, handler, **kwargs) -> JobQueue:
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("retry_base_delay", 0.01)
+    kwargs.setdefault("retry_max_delay", 0.05)
+    return JobQueue(handler, path=str(tmp_path / "jobs.sqlite3"), **kwargs)
+
+
+def test_completed_jobs_are_removed(tmp_path):
+    handled = []
+
+    async def handler(kind, payload):
+        handled.append((kind, payload))
+
+    async def run():
+        queue = _queue(tmp_path, handler)
+        await queue.start()
+        await queue.enqueue("memo", {"message_id": 1})
+        await _wait_until(lambda: _is_zero(queue.pending_count()))
+        await _wait_until(lambda: _has_length(handled, 1))
+        await queue.stop()
+
+    asyncio.run(run())
+    assert handled == [("memo", {"message_id": 1})]
+
+
+def test_failed_jobs_are_retried_until_they_succeed(tmp_path):
+    attempts = []
+
+    async def handler(kind, payload):
+        attempts.append(payload["message_id"])
+        if len(attempts) < 3:
+            raise RuntimeError("Gemini is unavailable")
+
+    async def run():
+        queue = _queue(tmp_path, handler, max_attempts=5)
+        await queue.start()
+        await queue.enqueue("memo", {"message_id": 7})
+        await _wait_until(lambda: _has_length(attempts, 3))
+        await _wait_until(lambda: _is_zero(queue.pending_count()))
+        dead = await queue.dead_count()
+        await queue.stop()
+        return dead
+
+    assert asyncio.run(run()) == 0
+    assert attempts == [7, 7, 7]
+
+
+def test_jobs_move_to_the_dead_letter_after_max_attempts(tmp_path):
+    attempts = []
+
+    async def handler(kind, payload):
+        attempts.append(kind)
+        raise RuntimeError("still failing")
+
+    async def run():
+        queue = _queue(tmp_path, handler, max_attempts=3)
+        await queue.start()
+        await queue.enqueue("memo", {})
+        await _wait_until(lambda: _is_positive(queue.dead_count()))
+        pending = await queue.pending_count()
+        error = queue._conn.execute(
+            "SELECT last_error FROM jobs WHERE status = ?", (STATUS_DEAD,)
+        ).fetchone()[0]
+        await queue.stop()
+        return pending, error
+
+    pending, error = asyncio.run(run())
+    assert pending == 0
+    assert len(attempts) == 3
+    assert "still failing" in error
+
+
+def test_permanent_errors_skip_the_retries(tmp_path):
+    attempts = []
+
+    async def handler(kind, payload):
+        attempts.append(kind)
+        raise PermanentJobError("message was deleted")
+
+    async def run():
+        queue = _queue(tmp_path, handler, max_attempts=5)
+        await queue.start()
+        await queue.enqueue("memo", {})
+        await _wait_until(lambda: _is_positive(queue.dead_count()))
+        await queue.stop()
+
+    asyncio.run(run())
+    assert attempts == ["memo"]
+
+
+def test_interrupted_jobs_are_recovered_on_start(tmp_path):
+    handled = []
+
+    async def handler(kind, payload):
+        handled.append(payload["message_id"])
+
+    async def interrupted():
+        queue = _queue(tmp_path, handler)
+        await queue.enqueue("memo", {"message_id": 3})
+        # ワーカーが取り出した (running) まま終了した状態にする
+        claimed = await asyncio.to_thread(queue._claim)
+        assert isinstance(claimed, tuple)
+        await queue.stop()
+
+    async def restarted():
+        queue = _queue(tmp_path, handler)
+        await queue.start()
+        await _wait_until(lambda: _has_length(handled, 1))
+        await queue.stop()
+
+    asyncio.run(interrupted())
+    asyncio.run(restarted())
+    assert handled == [3]
+
+
+async def _is_zero(count) -> bool:
+    return await count == 0
+
+
+async def _is_positive(count) -> bool:
+    return await count > 0
+
+
+async def _has_length(items: list, length: int) -> bool:
+    return len(items) >= length
+
+
+def test_dead_jobs_can_be_requeued(tmp_path):
+    attempts = []
+    healthy = False
+
+    async def handler(kind, payload):
+        attempts.append(kind)
+        if not healthy:
+            raise RuntimeError("Gemini is unavailable")
+
+    async def run():
+        nonlocal healthy
+        queue = _queue(tmp_path, handler, max_attempts=2)
+        await queue.start()
+        await queue.enqueue("memo", {})
+        await queue.enqueue("tip", {})
+        await _wait_until(lambda: _is_equal(queue.dead_count(), 2))
+
+        healthy = True
+        assert await queue.requeue_dead("tip") == 1
+        await _wait_until(lambda: _has_length(attempts, 5))
+        assert await queue.requeue_dead() == 1
+        await _wait_until(lambda: _has_length(attempts, 6))
+        await _wait_until(lambda: _is_zero(queue.pending_count()))
+        dead = await queue.dead_count()
+        await queue.stop()
+        return dead
+
+    assert asyncio.run(run()) == 0
+    # 戻したジョブは試行回数がリセットされ、1回で成功する
+    assert attempts.count("memo") == 3
+    assert attempts.count("tip") == 3
+
+
+async def _is_equal(count, expected: int) -> bool:
+    return await count == expected
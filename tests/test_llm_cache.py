@@ -0,0 +1,77 @@
+import asyncio
+
+from google.genai import types
+
+from llm_cache import LLMResponseCache, make_cache_key
+
+
+def _cache(tmp_path, **kwargs) -> LLMResponseCache:
+    return LLMResponseCache(path=str(tmp_path / "llm_cache.sqlite3"), **kwargs)
+
+
+def test_cache_key_depends_on_model_prompt_and_config():
+    config = types.GenerateContentConfig(temperature=0.2)
+    key = make_cache_key("gemini-2.5-flash", "プロンプト", config)
+
+    assert key == make_cache_key(
+        "gemini-2.5-flash", "プロンプト", types.GenerateContentConfig(temperature=0.2)
+    )
+    assert key != make_cache_key("gemini-2.0-flash", "プロンプト", config)
+    assert key != make_cache_key("gemini-2.5-flash", "別のプロンプト", config)
+    assert key != make_cache_key(
+        "gemini-2.5-flash", "プロンプト", types.GenerateContentConfig(temperature=0.5)
+    )
+
+
+def test_hits_come_from_memory_then_disk(tmp_path):
+    cache = _cache(tmp_path)
+    asyncio.run(cache.put("k", "summarize", "応答", ttl=60))
+    assert asyncio.run(cache.get("k", "summarize")) == "応答"
+    cache.close()
+
+    # 新しいインスタンスでは永続ストアから読み込む
+    reopened = _cache(tmp_path)
+    assert asyncio.run(reopened.get("k", "summarize")) == "応答"
+    assert asyncio.run(reopened.get("k", "summarize")) == "応答"
+    assert asyncio.run(reopened.get("missing", "summarize")) is None
+    reopened.close()
+
+    assert cache.stats() == {
+        "summarize": {"memory_hits": 1, "disk_hits": 0, "misses": 0}
+    }
+    assert reopened.stats() == {
+        "summarize": {"memory_hits": 1, "disk_hits": 1, "misses": 1}
+    }
+
+
+def test_expired_and_zero_ttl_entries_are_not_returned(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def run():
+        await cache.put("expired", "f", "古い応答", ttl=60)
+        cache._memory["expired"] = ("古い応答", 0.0)
+        cache._conn.execute("UPDATE llm_cache SET expires_at = 0")
+        await cache.put("never", "f", "保存しない", ttl=0)
+        return await cache.get("expired", "f"), await cache.get("never", "f")
+
+    assert asyncio.run(run()) == (None, None)
+    (count,) = cache._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+    cache.close()
+    assert count == 0
+
+
+def test_disk_store_evicts_least_recently_used_over_max_bytes(tmp_path):
+    cache = _cache(tmp_path, memory_items=1, max_bytes=10)
+
+    async def run():
+        await cache.put("a", "f", "1234", ttl=60)
+        await cache.put("b", "f", "5678", ttl=60)
+        await cache.get("a", "f")
+        await cache.put("c", "f", "9012", ttl=60)
+
+    asyncio.run(run())
+    keys = {key for (key,) in cache._conn.execute("SELECT key FROM llm_cache")}
+    cache.close()
+
+    assert keys == {"a", "c"}
+    assert list(cache._memory) == ["c"]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+import config
+from bench.stubs import StubMessage
+from cogs import memo_handler
+from job_queue import JobQueue
+from note_writer import NoteWriter
+
+CHANNEL_ID = 1234
+
+
+@pytest.fixture
+def cog(tmp_path, monkeypatch):
+    """デイリーノートを一時ディレクトリに書き込む MemoHandler を用意する"""
+    monkeypatch.setattr(config, "SAVE_DIR", str(tmp_path / "memos"))
+    monkeypatch.setattr(config, "CHANNEL_ID", CHANNEL_ID)
+    monkeypatch.setattr(config, "ROLLING_DIGEST_ENABLED", False)
+    monkeypatch.setattr(config, "MESSAGE_ENRICHMENT_ENABLED", False)
+    monkeypatch.setattr(config, "SUPPLEMENT_BATCH_ENABLED", False)
+
+    async def add_entry(*args):
+        pass
+
+    monkeypatch.setattr(memo_handler.search_index, "add_entry", add_entry)
+    (tmp_path / "memos").mkdir()
+    # コンテキストメニューの登録などを行わないよう、__init__ を通さずに作る
+    cog = memo_handler.MemoHandler.__new__(memo_handler.MemoHandler)
+    cog._pending_messages = {}
+    return cog
+
+
+def _run(cog, monkeypatch, tmp_path, coro_fn):
+    # NoteWriter とジョブキューはイベントループごとに作るため、呼び出しごとに用意する
+    async def run():
+        writer = NoteWriter(coalesce_delay=0)
+        monkeypatch.setattr(memo_handler, "note_writer", writer)
+        cog.job_queue = JobQueue(cog._handle_job, path=str(tmp_path / "jobs.sqlite3"))
+        try:
+            return await coro_fn()
+        finally:
+            await writer.close()
+            await cog.job_queue.stop()
+
+    return asyncio.run(run())
+
+
+def _note(tmp_path) -> str:
+    return (tmp_path / "memos" / "2024-01-01.md").read_text(encoding="utf-8")
+
+
+def test_failed_tip_is_written_later_by_a_tip_job(cog, monkeypatch, tmp_path):
+    received_at = datetime(2024, 1, 1, 9, 30)
+    message = StubMessage("Gemini が落ちている間のメモ", CHANNEL_ID)
+    replies = ["Gemini is unavailable", "あとから届いた補足"]
+
+    async def generate(text, url_summary=None):
+        reply = replies.pop(0)
+        if reply.startswith("Gemini"):
+            raise RuntimeError(reply)
+        return reply
+
+    monkeypatch.setattr(memo_handler, "generate_flash_supplement", generate)
+
+    async def process():
+        await cog.process_message_for_memo(message, received_at=received_at)
+        return [
+            kind for (kind,) in cog.job_queue._conn.execute("SELECT kind FROM jobs")
+        ]
+
+    jobs = _run(cog, monkeypatch, tmp_path, process)
+
+    # 補足なしでも本文は追記され、補足の位置にプレースホルダーが残る
+    text = _note(tmp_path)
+    assert "09:30\nGemini が落ちている間のメモ\n" in text
+    assert f"%%tip:{message.id}%%" in text
+    assert "AI's Small Tip" not in text
+    assert jobs == ["tip"]
+
+    async def fill():
+        payload = cog.job_queue._conn.execute("SELECT payload FROM jobs").fetchone()
+        await cog._handle_job("tip", json.loads(payload[0]))
+
+    _run(cog, monkeypatch, tmp_path, fill)
+
+    text = _note(tmp_path)
+    assert "%%tip:" not in text
+    assert "> [!info] AI's Small Tip\n> あとから届いた補足\n" in text
+
+
+def test_reserved_entries_keep_the_posting_order(cog, monkeypatch, tmp_path):
+    messages = [StubMessage(f"メッセージ{i}", CHANNEL_ID) for i in range(3)]
+
+    async def generate(text, url_summary=None):
+        return f"{text}の補足"
+
+    monkeypatch.setattr(memo_handler, "generate_flash_supplement", generate)
+
+    async def process():
+        received = {}
+        for i, message in enumerate(messages):
+            received[message.id] = datetime(2024, 1, 1, 10, i)
+            await cog._reserve_entry(message, received[message.id])
+        # 本文は処理を待たずに書き込まれている
+        reserved = _note(tmp_path)
+        # 後に投稿されたメッセージから処理が終わり、最初のメッセージは2回処理される
+        for message in [messages[2], messages[0], messages[1], messages[0]]:
+            await cog.process_message_for_memo(
+                message, received_at=received[message.id], reserved=True
+            )
+        return reserved
+
+    reserved = _run(cog, monkeypatch, tmp_path, process)
+
+    assert "メッセージ0\n%%memo:" in reserved
+    text = _note(tmp_path)
+    assert "%%memo:" not in text
+    assert text.count("メッセージ0の補足") == 1
+    positions = [text.index(f"10:0{i}\nメッセージ{i}\n") for i in range(3)]
+    assert positions == sorted(positions)
+    for i in range(3):
+        # 補足は各エントリの本文の直後に入る
+        assert f"10:0{i}\nメッセージ{i}\n\n> [!info] AI's Small Tip\n" in text
@@ -0,0 +1,61 @@
+from memo_text import chunk_entries, compact_memo, split_entries
+
+
+def test_compact_memo_reduces_each_url_summary_to_its_title():
+    text = (
+        "14:05\n"
+        "2つの記事を読んだ https://a.example/ https://b.example/\n"
+        "\n"
+        "> URLの概要: https://a.example/\n"
+        "> タイトル: 記事A\n"
+        "> 説明: Aの長い説明\n"
+        "\n"
+        "![[thumb-a.webp]]\n"
+        "\n"
+        "> URLの概要: https://b.example/\n"
+        "> タイトル: 記事B\n"
+        "> 説明: Bの長い説明\n"
+        "\n"
+        "> [!info] AI's Small Tip\n"
+        "> 補足の本文\n"
+        "\n"
+        "%%tip:42%%\n"
+    )
+
+    compacted = compact_memo(text)
+
+    assert "(リンク: 記事A)" in compacted
+    assert "(リンク: 記事B)" in compacted
+    assert "説明" not in compacted
+    assert "URLの概要" not in compacted
+    assert "thumb-a.webp" not in compacted
+    assert "補足の本文" not in compacted
+    assert "%%" not in compacted
+
+
+def test_compact_memo_accepts_single_and_legacy_url_headings():
+    text = (
+        "> URLの概要:\n"
+        "> タイトル: 単独\n"
+        "> 説明: 説明文\n"
+        "\n"
+        "> URLの概要 (https://c.example/):\n"
+        "> タイトル: 旧形式\n"
+        "> 説明: 説明文\n"
+    )
+
+    assert compact_memo(text) == "(リンク: 単独)\n\n(リンク: 旧形式)"
+
+
+def test_split_entries_starts_a_new_entry_at_each_timestamp():
+    text = "前置き\n09:00\n朝のメモ\n\n21:30\n夜のメモ"
+
+    assert split_entries(text) == ["前置き", "09:00\n朝のメモ", "21:30\n夜のメモ"]
+
+
+def test_chunk_entries_keeps_chunks_under_the_token_budget():
+    entries = ["a" * 4, "b" * 4, "c" * 10, "d" * 2]
+
+    chunks = chunk_entries(entries, max_tokens=8, count_tokens=len)
+
+    assert chunks == ["aaaa\n\nbbbb", "c" * 10, "dd"]
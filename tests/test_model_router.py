@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+
+import model_router as model_router_module
+from model_router import (
+    REASON_COOLDOWN,
+    REASON_FALLBACK,
+    REASON_PRIMARY,
+    REASON_SLO,
+    TASK_SUMMARY,
+    TASKS,
+    ModelRouter,
+    parse_model_routes,
+    parse_route_slos,
+)
+
+
+@pytest.fixture
+def waits(monkeypatch):
+    """モデルごとの枠待ちの見込みを差し替える (既定は待ちなし)"""
+    waits: dict[str, float] = {}
+    monkeypatch.setattr(
+        model_router_module.scheduler,
+        "estimate_wait",
+        lambda model, tokens: waits.get(model, 0.0),
+    )
+    return waits
+
+
+def _router(tmp_path, summary=("pro", "flash", "lite"), **kwargs) -> ModelRouter:
+    routes = {task: ["flash"] for task in TASKS}
+    routes[TASK_SUMMARY] = list(summary)
+    kwargs.setdefault("slos", {TASK_SUMMARY: 10.0})
+    return ModelRouter(routes=routes, path=str(tmp_path / "routes.sqlite3"), **kwargs)
+
+
+def _record(router: ModelRouter, choice, seconds: float, outcome: str, tokens=1000):
+    # record() は SQLite への書き込みをタスクとして起動するため、ループ内で呼んで待つ
+    async def run():
+        router.record(TASK_SUMMARY, "summarize", choice, 1, tokens, seconds, outcome)
+        await asyncio.gather(*router._writes)
+
+    asyncio.run(run())
+
+
+def test_parse_specs():
+    assert parse_model_routes(" summary=pro > flash ,digest=flash,, x= ") == {
+        "summary": ["pro", "flash"],
+        "digest": ["flash"],
+    }
+    assert parse_route_slos("summary=30, digest=7.5,") == {
+        "summary": 30.0,
+        "digest": 7.5,
+    }
+
+
+def test_missing_route_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="digest"):
+        ModelRouter(
+            routes={TASK_SUMMARY: ["pro"]}, path=str(tmp_path / "routes.sqlite3")
+        )
+
+
+def test_primary_route_keeps_its_order(tmp_path, waits):
+    router = _router(tmp_path)
+
+    plan = router.plan(TASK_SUMMARY, 1000)
+
+    assert [c.model for c in plan] == ["pro", "flash", "lite"]
+    assert [c.reason for c in plan] == [
+        REASON_PRIMARY,
+        REASON_FALLBACK,
+        REASON_FALLBACK,
+    ]
+    # 最後の試行だけは打ち切らない
+    assert [c.timeout for c in plan] == [10.0, 10.0, None]
+    router.close()
+
+
+def test_models_over_the_slo_are_tried_last(tmp_path, waits):
+    router = _router(tmp_path)
+    waits["pro"] = 8.0
+    _record(router, router.plan(TASK_SUMMARY, 1000)[0], 4.0, "ok")
+
+    plan = router.plan(TASK_SUMMARY, 1000)
+
+    assert [c.model for c in plan] == ["flash", "lite", "pro"]
+    assert plan[0].reason == REASON_SLO
+    router.close()
+
+
+def test_rate_limited_model_cools_down(tmp_path, waits):
+    router = _router(tmp_path, cooldown=60.0)
+    _record(router, router.plan(TASK_SUMMARY, 1000)[0], 0.5, "rate_limited")
+
+    plan = router.plan(TASK_SUMMARY, 1000)
+    assert [c.model for c in plan] == ["flash", "lite", "pro"]
+    assert plan[0].reason == REASON_COOLDOWN
+
+    router._cooldown_until["pro"] = 0.0
+    assert router.plan(TASK_SUMMARY, 1000)[0].model == "pro"
+    router.close()
+
+
+def test_latency_is_an_ewma_scaled_by_input_tokens(tmp_path, waits):
+    router = _router(tmp_path)
+    choice = router.plan(TASK_SUMMARY, 1000)[0]
+    assert router.predict(TASK_SUMMARY, "pro", 1000) is None
+
+    _record(router, choice, 2.0, "ok")
+    _record(router, choice, 12.0, "timeout")
+    _record(router, choice, 5.0, "error")
+
+    # 2.0 + 0.2 * (12.0 - 2.0)。エラーは予測に反映しない
+    assert router.predict(TASK_SUMMARY, "pro", 1000) == pytest.approx(4.0)
+    # 半分は固定、残りは入力トークン数に比例する
+    assert router.predict(TASK_SUMMARY, "pro", 3000) == pytest.approx(8.0)
+    router.close()
+
+
+def test_latency_is_seeded_from_the_log(tmp_path, waits):
+    router = _router(tmp_path)
+    choice = router.plan(TASK_SUMMARY, 1000)[0]
+    _record(router, choice, 2.0, "ok")
+    _record(router, choice, 4.0, "ok")
+    _record(router, choice, 30.0, "rate_limited")
+    router.close()
+
+    reopened = _router(tmp_path)
+    assert reopened.predict(TASK_SUMMARY, "pro", 1000) == pytest.approx(3.0)
+    reopened.close()
+
+
+def test_log_keeps_only_max_rows(tmp_path, waits):
+    router = _router(tmp_path, max_rows=2)
+    choice = router.plan(TASK_SUMMARY, 1000)[0]
+    for seconds in (1.0, 2.0, 3.0):
+        _record(router, choice, seconds, "ok")
+
+    rows = router._conn.execute(
+        "SELECT seconds, reason FROM route_decisions ORDER BY id"
+    ).fetchall()
+    assert rows == [(2.0, REASON_PRIMARY), (3.0, REASON_PRIMARY)]
+    router.close()
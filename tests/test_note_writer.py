@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from note_writer import FSYNC_ALWAYS, NoteWriter
+
+
+def _run(coro_fn, **kwargs):
+    async def run():
+        writer = NoteWriter(**kwargs)
+        try:
+            return await coro_fn(writer)
+        finally:
+            await writer.close()
+
+    return asyncio.run(run())
+
+
+def test_concurrent_appends_keep_their_order_and_template(tmp_path):
+    path = str(tmp_path / "2024-01-01.md")
+
+    async def write(writer):
+        await asyncio.gather(
+            *(
+                writer.append(path, f"- {i}\n", template="# 2024-01-01\n")
+                for i in range(50)
+            )
+        )
+
+    _run(write, coalesce_delay=0.01, fsync_policy=FSYNC_ALWAYS)
+
+    text = (tmp_path / "2024-01-01.md").read_text(encoding="utf-8")
+    assert text == "# 2024-01-01\n" + "".join(f"- {i}\n" for i in range(50))
+
+
+def test_bursts_are_coalesced_into_few_writes(tmp_path, monkeypatch):
+    path = str(tmp_path / "note.md")
+    batches = []
+
+    async def write(writer):
+        original = writer._write_batch
+
+        def record(path, batch):
+            batches.append(len(batch))
+            original(path, batch)
+
+        monkeypatch.setattr(writer, "_write_batch", record)
+        await asyncio.gather(*(writer.append(path, f"{i}\n") for i in range(20)))
+
+    _run(write, coalesce_delay=0.05)
+
+    assert sum(batches) == 20
+    assert len(batches) < 20
+
+
+def test_read_sees_pending_appends(tmp_path):
+    path = str(tmp_path / "note.md")
+
+    async def write_then_read(writer):
+        appended = asyncio.create_task(writer.append(path, "本文", template="# 題名\n"))
+        # 追記の要求がキューに積まれてから読み込む
+        await asyncio.sleep(0)
+        text = await writer.read(path)
+        await appended
+        return text, await writer.read(str(tmp_path / "missing.md"))
+
+    assert _run(write_then_read, coalesce_delay=0.05) == ("# 題名\n本文", None)
+
+
+def test_run_exclusive_propagates_errors(tmp_path):
+    def fail():
+        raise ValueError("壊れたノート")
+
+    async def run(writer):
+        await writer.run_exclusive(str(tmp_path / "note.md"), fail)
+
+    with pytest.raises(ValueError, match="壊れたノート"):
+        _run(run)
+
+
+def test_idle_writers_stop(tmp_path):
+    async def run(writer):
+        await writer.append(str(tmp_path / "note.md"), "本文")
+        await asyncio.sleep(0.1)
+        return dict(writer._tasks)
+
+    assert _run(run, coalesce_delay=0, idle_timeout=0.01) == {}
+
+
+def test_unknown_fsync_policy_is_rejected():
+    with pytest.raises(ValueError):
+        NoteWriter(fsync_policy="sometimes")
+
+
+def test_replace_once_runs_after_the_queued_appends(tmp_path):
+    path = str(tmp_path / "note.md")
+
+    async def write(writer):
+        first = asyncio.create_task(writer.append(path, "a\n%%memo:1%%\nb\n"))
+        await asyncio.sleep(0)
+        replaced = await writer.replace_once(path, "%%memo:1%%\n", "本文\n")
+        await first
+        missing = await writer.replace_once(path, "%%memo:1%%\n", "二重\n")
+        return replaced, missing
+
+    assert _run(write) == (True, False)
+    assert (tmp_path / "note.md").read_text(encoding="utf-8") == "a\n本文\nb\n"
+    assert not (tmp_path / "note.md.tmp").exists()
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+import config
+import related_notes
+from related_notes import RelatedNotes, format_related_section
+from vault_index import KIND_DAILY, KIND_TAG, VaultIndex
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    """一時ディレクトリのボルトと、それを参照する VaultIndex を用意する"""
+    daily_dir = tmp_path / "memos"
+    notes_dir = tmp_path / "notes"
+    daily_dir.mkdir()
+    notes_dir.mkdir()
+    monkeypatch.setattr(config, "SAVE_DIR", str(daily_dir))
+    monkeypatch.setattr(config, "NOTES_DIR", str(notes_dir))
+    index = VaultIndex(path=str(tmp_path / "vault_index.sqlite3"))
+    monkeypatch.setattr(related_notes, "vault_index", index)
+
+    def write(directory, name, text):
+        (directory / f"{name}.md").write_text(text, encoding="utf-8")
+        index._scan()
+
+    return daily_dir, notes_dir, index, write
+
+
+def test_find_related_ranks_similar_notes_first(vault):
+    daily_dir, notes_dir, _, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒントと非同期処理、asyncioのイベントループ")
+    write(notes_dir, "料理", "カレーの作り方、玉ねぎを炒めてスパイスを加える")
+    write(daily_dir, "2024-01-01", "asyncioのイベントループとPythonの型ヒントを調べた")
+
+    finder = RelatedNotes()
+    related = asyncio.run(
+        finder.find_related(
+            {(KIND_DAILY, "2024-01-01"): "Pythonのasyncioとイベントループ"},
+            top_k=2,
+            min_similarity=0.0,
+        )
+    )
+
+    # 自分自身は含めない
+    assert related[(KIND_DAILY, "2024-01-01")][0] == "Python"
+    assert "2024-01-01" not in related[(KIND_DAILY, "2024-01-01")]
+
+
+def test_exclude_removes_already_linked_notes(vault):
+    _, notes_dir, _, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒントと非同期処理")
+    write(notes_dir, "Rust", "Rustの型と非同期処理")
+
+    finder = RelatedNotes()
+    related = asyncio.run(
+        finder.find_related(
+            {(KIND_TAG, "非同期"): "型と非同期処理"},
+            exclude={(KIND_TAG, "非同期"): {"Python"}},
+            min_similarity=0.0,
+        )
+    )
+
+    assert related[(KIND_TAG, "非同期")] == ["Rust"]
+
+
+def test_query_terms_are_not_added_to_the_vocabulary(vault):
+    _, notes_dir, _, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒント")
+
+    finder = RelatedNotes()
+    asyncio.run(finder.refresh())
+    size = len(finder._vocabulary)
+    for i in range(5):
+        asyncio.run(finder.find_related({(KIND_TAG, "q"): f"まったく新しい語{i}"}))
+
+    assert len(finder._vocabulary) == size
+
+
+def test_vocabulary_shrinks_when_notes_are_removed(vault):
+    _, notes_dir, index, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒント")
+    write(notes_dir, "料理", "カレーの作り方とスパイス")
+
+    finder = RelatedNotes()
+    asyncio.run(finder.refresh())
+    size = len(finder._vocabulary)
+    (notes_dir / "料理.md").unlink()
+    index._scan()
+    asyncio.run(finder.refresh())
+
+    assert len(finder._vocabulary) < size
+    remaining = {
+        term_id for row in finder._rows.values() for term_id in row.term_ids.tolist()
+    }
+    assert remaining == set(range(len(finder._vocabulary)))
+    related = asyncio.run(
+        finder.find_related({(KIND_TAG, "q"): "Pythonの型"}, min_similarity=0.0)
+    )
+    assert related[(KIND_TAG, "q")] == ["Python"]
+
+
+def test_unseen_query_terms_lower_the_similarity(vault):
+    _, notes_dir, _, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒントと非同期処理")
+    write(notes_dir, "料理", "カレーの作り方")
+
+    finder = RelatedNotes()
+    same = asyncio.run(
+        finder.find_related(
+            {(KIND_TAG, "q"): "Pythonの型ヒントと非同期処理"}, min_similarity=0.9
+        )
+    )
+    padded = asyncio.run(
+        finder.find_related(
+            {(KIND_TAG, "q"): "Pythonの型ヒントと非同期処理" + "ぬるぽがっ" * 20},
+            min_similarity=0.9,
+        )
+    )
+
+    assert same[(KIND_TAG, "q")] == ["Python"]
+    assert padded[(KIND_TAG, "q")] == []
+
+
+def test_corpus_matrix_is_reused_until_a_note_changes(vault):
+    _, notes_dir, _, write = vault
+    write(notes_dir, "Python", "Pythonの型ヒントと非同期処理")
+
+    finder = RelatedNotes()
+    asyncio.run(finder.find_related({(KIND_TAG, "q"): "Pythonの型"}))
+    corpus = finder._corpus
+    asyncio.run(finder.find_related({(KIND_TAG, "q"): "非同期処理"}))
+    assert finder._corpus is corpus
+
+    write(notes_dir, "Rust", "Rustの型と非同期処理")
+    related = asyncio.run(
+        finder.find_related({(KIND_TAG, "q"): "Rustの型"}, min_similarity=0.0)
+    )
+    assert finder._corpus is not corpus
+    assert related[(KIND_TAG, "q")][0] == "Rust"
+
+
+def test_format_related_section():
+    assert format_related_section(["A", "B"]) == "## 関連ノート\n[[A]] [[B]]"
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import rolling_digest
+from rolling_digest import RollingDigest
+from state_files import write_json_atomic
+
+
+def test_write_json_atomic_replaces_the_file(tmp_path):
+    path = tmp_path / "state" / "2024-01-01.json"
+    write_json_atomic(str(path), {"digest": "古い"})
+    write_json_atomic(str(path), {"digest": "新しい"})
+
+    assert json.loads(path.read_text(encoding="utf-8")) == {"digest": "新しい"}
+    assert [p.name for p in path.parent.iterdir()] == ["2024-01-01.json"]
+
+
+def test_fold_updates_the_digest_and_drops_the_lock(tmp_path, monkeypatch):
+    folded = []
+
+    async def update(digest, entries):
+        folded.append(list(entries))
+        return f"{digest}+{len(entries)}"
+
+    monkeypatch.setattr(rolling_digest, "update_rolling_digest", update)
+
+    async def run():
+        digest = RollingDigest(state_dir=str(tmp_path), debounce=3600)
+        await asyncio.gather(
+            digest.add_entry("2024-01-01", "一件目"),
+            digest.add_entry("2024-01-01", "二件目"),
+        )
+        result = await digest.finalize("2024-01-01", expected_entries=2)
+        return digest, result
+
+    digest, result = asyncio.run(run())
+
+    assert result == "+2"
+    assert folded == [["一件目", "二件目"]]
+    assert digest._locks == {}
+    assert not digest._lock_users
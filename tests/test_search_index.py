@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+import config
+import search_index
+from search_index import (
+    SearchIndex,
+    _decode_postings,
+    _encode_postings,
+    make_snippet,
+    split_documents,
+    tokenize,
+)
+from vault_index import KIND_DAILY, KIND_TAG, VaultIndex
+
+_DAILY = "2024-01-01\n---\n\n## メモ\n{entries}"
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    daily_dir = tmp_path / "memos"
+    notes_dir = tmp_path / "notes"
+    daily_dir.mkdir()
+    notes_dir.mkdir()
+    monkeypatch.setattr(config, "SAVE_DIR", str(daily_dir))
+    monkeypatch.setattr(config, "NOTES_DIR", str(notes_dir))
+    index = VaultIndex(path=str(tmp_path / "vault_index.sqlite3"))
+    monkeypatch.setattr(search_index, "vault_index", index)
+    return daily_dir, notes_dir, index, str(tmp_path / "search_index.sqlite3")
+
+
+def test_postings_round_trip_through_varints():
+    postings = [(1, 1), (2, 130), (300, 1), (70000, 5)]
+
+    assert _decode_postings(_encode_postings(postings, 0)) == postings
+    # 末尾への追記は直前の文書IDからの差分で続けられる
+    appended = _encode_postings(postings[:2], 0) + _encode_postings(postings[2:], 2)
+    assert _decode_postings(appended) == postings
+
+
+def test_tokenize_uses_normalized_character_ngrams():
+    assert tokenize("ＰＹ") == ["py"]
+    assert tokenize("非同期 a") == ["非同", "同期", "非同期", "a"]
+
+
+def test_split_documents_by_entry_and_summary():
+    content = (
+        _DAILY.format(entries="10:00\n一件目\n\n11:00\n二件目\n") + "\n## まとめ\n要約"
+    )
+
+    assert split_documents(content, KIND_DAILY) == [
+        "10:00\n一件目",
+        "11:00\n二件目",
+        "## まとめ\n要約",
+    ]
+    assert split_documents("  ", KIND_TAG) == []
+
+
+def test_bm25_ranks_the_more_specific_document_first(vault):
+    daily_dir, notes_dir, index, db = vault
+    (daily_dir / "2024-01-01.md").write_text(
+        _DAILY.format(entries="10:00\n非同期処理のメモ\n\n11:00\nカレーを作った\n"),
+        encoding="utf-8",
+    )
+    (notes_dir / "非同期.md").write_text(
+        "# 非同期\n\n非同期処理と非同期IO、非同期のイベントループ", encoding="utf-8"
+    )
+    index._scan()
+
+    search = SearchIndex(path=db)
+    asyncio.run(search.sync())
+    results = asyncio.run(search.search("非同期"))
+
+    assert [(r.kind, r.name) for r in results] == [
+        (KIND_TAG, "非同期"),
+        (KIND_DAILY, "2024-01-01"),
+    ]
+    assert results[0].score > results[1].score
+    assert "カレー" not in results[1].snippet
+
+
+def test_appended_and_rewritten_entries_are_reindexed(vault):
+    daily_dir, _, index, db = vault
+    note = daily_dir / "2024-01-01.md"
+    note.write_text(_DAILY.format(entries="10:00\n最初のメモ\n"), encoding="utf-8")
+    index._scan()
+    search = SearchIndex(path=db)
+    asyncio.run(search.sync())
+
+    with open(note, "a", encoding="utf-8") as f:
+        f.write("\n11:00\n追記した鍋料理\n")
+    asyncio.run(
+        search.add_entry(str(note), KIND_DAILY, "2024-01-01", "11:00\n追記した鍋料理\n")
+    )
+    assert [r.name for r in asyncio.run(search.search("鍋料理"))] == ["2024-01-01"]
+
+    # Obsidian 側で書き換えられたエントリは同期で入れ替わる
+    note.write_text(_DAILY.format(entries="10:00\n書き換えたメモ\n"), encoding="utf-8")
+    index._scan()
+    asyncio.run(search.sync())
+    assert asyncio.run(search.search("鍋料理")) == []
+
+    # 再度開いても同じ結果になる
+    reopened = SearchIndex(path=db)
+    assert [r.name for r in asyncio.run(reopened.search("書き換え"))] == ["2024-01-01"]
+
+
+def test_make_snippet_centers_on_the_query():
+    text = "前置き" * 50 + "目的の語句" + "後書き" * 50
+
+    snippet = make_snippet(text, "目的", width=30)
+
+    assert "目的の語句" in snippet
+    assert snippet.startswith("…")
+    assert snippet.endswith("…")
@@ -0,0 +1,136 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+import config
+import tag_notes
+from cogs import summary_cog
+from note_writer import NoteWriter
+from summary_stream import (
+    EVENT_SUMMARY,
+    EVENT_TAG,
+    EVENT_TAGS,
+    SummaryEvent,
+    SummaryProgress,
+)
+from vault_index import VaultIndex
+
+
+@pytest.fixture
+def cog(tmp_path, monkeypatch):
+    """タグノートを一時ディレクトリに書き込む SummaryCog を用意する"""
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    monkeypatch.setattr(config, "NOTES_DIR", str(notes_dir))
+    monkeypatch.setattr(config, "STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(config, "RELATED_NOTES_ENABLED", False)
+    monkeypatch.setattr(config, "SUMMARY_STREAM_ATTEMPTS", 3)
+    index = VaultIndex(path=str(tmp_path / "vault_index.sqlite3"))
+    monkeypatch.setattr(tag_notes, "vault_index", index)
+    # ループのタスクを起動しないよう、__init__ を通さずに作る
+    return summary_cog.SummaryCog.__new__(summary_cog.SummaryCog)
+
+
+async def _events(events):
+    for event in events:
+        yield event
+
+
+def _run(cog, monkeypatch):
+    async def run():
+        writer = NoteWriter(coalesce_delay=0)
+        monkeypatch.setattr(tag_notes, "note_writer", writer)
+        try:
+            return await cog._generate_summary("2024-01-01", "入力")
+        finally:
+            await writer.close()
+
+    return asyncio.run(run())
+
+
+def test_tags_sharing_a_note_wait_for_each_other(cog, monkeypatch):
+    progress = SummaryProgress("2024-01-01", "digest")
+    progress.tags_line = "#Python #ｐｙｔｈｏｎ #料理"
+
+    async def run():
+        writer = NoteWriter(coalesce_delay=0)
+        monkeypatch.setattr(tag_notes, "note_writer", writer)
+        for tag, text in [("Python", "型ヒント"), ("料理", "カレー")]:
+            event = SummaryEvent(EVENT_TAG, text, tag)
+            await cog._handle_summary_event(progress, "2024-01-01", event)
+        written_before = dict(progress.written)
+        event = SummaryEvent(EVENT_TAG, "asyncio", "ｐｙｔｈｏｎ")
+        await cog._handle_summary_event(progress, "2024-01-01", event)
+        await writer.close()
+        return written_before
+
+    written_before = asyncio.run(run())
+
+    assert written_before == {"料理": "料理"}
+    assert progress.written == {
+        "料理": "料理",
+        "Python": "Python",
+        "ｐｙｔｈｏｎ": "Python",
+    }
+    text = (Path(config.NOTES_DIR) / "Python.md").read_text(encoding="utf-8")
+    assert "型ヒント" in text
+    assert "asyncio" in text
+
+
+def test_missing_explanations_are_requested_once(cog, monkeypatch):
+    requests = []
+
+    def full_stream(summary_input, date_str):
+        return _events(
+            [
+                SummaryEvent(EVENT_SUMMARY, "要約"),
+                SummaryEvent(EVENT_TAGS, "#Python #料理"),
+                SummaryEvent(EVENT_TAG, "型ヒント", "Python"),
+            ]
+        )
+
+    def missing_stream(summary_input, date_str, missing):
+        requests.append(missing)
+        return _events([])
+
+    monkeypatch.setattr(summary_cog, "stream_summary_sections", full_stream)
+    monkeypatch.setattr(summary_cog, "stream_tag_explanations", missing_stream)
+
+    progress = _run(cog, monkeypatch)
+
+    assert requests == [["料理"]]
+    assert progress.written == {"Python": "Python"}
+
+
+def test_failed_missing_request_is_not_retried(cog, monkeypatch):
+    requests = []
+
+    def full_stream(summary_input, date_str):
+        return _events(
+            [
+                SummaryEvent(EVENT_SUMMARY, "要約"),
+                SummaryEvent(EVENT_TAGS, "#Python #料理"),
+            ]
+        )
+
+    async def failing(missing):
+        requests.append(missing)
+        raise TimeoutError("no response")
+        yield
+
+    def missing_stream(summary_input, date_str, missing):
+        return failing(missing)
+
+    async def no_sleep(delay):
+        raise AssertionError(f"unexpected sleep for {delay}s")
+
+    monkeypatch.setattr(summary_cog, "stream_summary_sections", full_stream)
+    monkeypatch.setattr(summary_cog, "stream_tag_explanations", missing_stream)
+    monkeypatch.setattr(summary_cog.asyncio, "sleep", no_sleep)
+
+    progress = _run(cog, monkeypatch)
+
+    assert requests == [["Python", "料理"]]
+    assert progress.summary == "要約"
+    assert progress.explanations == {}
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import config
+import tag_notes
+from note_writer import NoteWriter
+from tag_notes import canonical_tag, merge_tag_notes, normalize_tags_line
+from vault_index import KIND_TAG, VaultIndex
+
+
+@pytest.fixture
+def notes(tmp_path, monkeypatch):
+    """一時ディレクトリのタグノートと、それを参照する VaultIndex を用意する"""
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    monkeypatch.setattr(config, "SAVE_DIR", str(tmp_path / "memos"))
+    monkeypatch.setattr(config, "NOTES_DIR", str(notes_dir))
+    index = VaultIndex(path=str(tmp_path / "vault_index.sqlite3"))
+    monkeypatch.setattr(tag_notes, "vault_index", index)
+    return notes_dir, index
+
+
+def _merge(monkeypatch, *args):
+    # NoteWriter の書き込みタスクはイベントループごとに作るため、呼び出しごとに用意する
+    async def run():
+        writer = NoteWriter(coalesce_delay=0)
+        monkeypatch.setattr(tag_notes, "note_writer", writer)
+        try:
+            return await merge_tag_notes(*args)
+        finally:
+            await writer.close()
+
+    return asyncio.run(run())
+
+
+def test_canonical_tag_ignores_width_case_and_hash():
+    assert canonical_tag("#Ｐｙｔｈｏｎ") == canonical_tag("python")
+    assert canonical_tag(" ＡＩ ") == "ai"
+
+
+def test_resolve_tag_names_makes_safe_file_names(notes):
+    resolved = tag_notes.resolve_tag_names(["C／C++", "a:b", "#", "ＡＩ", "ai"])
+
+    # 既存のノートがなければ最初に現れた表記 (NFKC正規化後) をノート名にする
+    assert resolved == {"C／C++": "C-C++", "a:b": "a-b", "ＡＩ": "AI", "ai": "AI"}
+
+
+def test_normalize_tags_line_uses_existing_note_names(notes):
+    notes_dir, index = notes
+    (notes_dir / "Python.md").write_text("# Python\n\n#Python", encoding="utf-8")
+    index._scan()
+
+    assert normalize_tags_line("#python #ＰＹＴＨＯＮ #料理") == "#Python #料理"
+
+
+def test_tags_sharing_a_note_are_merged_into_one_section(notes, monkeypatch):
+    notes_dir, _ = notes
+
+    merged = _merge(
+        monkeypatch,
+        "2024-01-01",
+        {"Python": "[[2024-01-01]]\n型ヒントの解説", "ｐｙｔｈｏｎ": "asyncioの解説"},
+    )
+
+    assert merged == {"Python": True}
+    text = (notes_dir / "Python.md").read_text(encoding="utf-8")
+    assert text.count("## 2024-01-01") == 1
+    assert "型ヒントの解説" in text
+    assert "asyncioの解説" in text
+
+
+def test_existing_dated_section_is_reported_as_skipped(notes, monkeypatch):
+    notes_dir, index = notes
+
+    assert _merge(monkeypatch, "2024-01-01", {"Python": "最初の解説"}) == {
+        "Python": True
+    }
+    assert _merge(monkeypatch, "2024-01-01", {"python": "後から届いた解説"}) == {
+        "Python": False
+    }
+
+    text = (notes_dir / "Python.md").read_text(encoding="utf-8")
+    assert "後から届いた解説" not in text
+    assert "2024-01-01" in index.get(KIND_TAG, "Python").links
+
+
+def test_date_mentioned_in_another_section_is_still_merged(notes, monkeypatch):
+    notes_dir, index = notes
+    (notes_dir / "Python.md").write_text(
+        "# Python\n\n#Python\n\n## 2024-01-02\n\n[[2024-01-02]]\n\n"
+        "前日の [[2024-01-01]] の続き",
+        encoding="utf-8",
+    )
+    index._scan()
+
+    assert _merge(monkeypatch, "2024-01-01", {"Python": "遅れて届いた解説"}) == {
+        "Python": True
+    }
+    text = (notes_dir / "Python.md").read_text(encoding="utf-8")
+    assert "## 2024-01-01\n" in text
+
+
+def test_related_links_to_a_daily_note_do_not_block_its_section(notes, monkeypatch):
+    notes_dir, index = notes
+
+    # 新しい日のセクションの関連ノートに、まとめの済んでいない前日が含まれる
+    _merge(
+        monkeypatch,
+        "2024-01-02",
+        {"Python": "新しい日の解説"},
+        {"Python": ["2024-01-01"]},
+    )
+    assert "2024-01-01" in index.get(KIND_TAG, "Python").links
+
+    # 後から前日をまとめても、前日のセクションが追記される
+    assert _merge(monkeypatch, "2024-01-01", {"Python": "前日の解説"}) == {
+        "Python": True
+    }
+    text = (notes_dir / "Python.md").read_text(encoding="utf-8")
+    assert text.index("## 2024-01-02") < text.index("## 2024-01-01")
+    assert "前日の解説" in text
@@ -0,0 +1,28 @@
+import asyncio
+
+import aiohttp
+
+import config
+from bench.fixture_server import FixtureServer
+from cogs.memo_handler import download_thumbnail
+
+
+def test_download_thumbnail_saves_the_image(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "IMAGE_SAVE_DIR", str(tmp_path))
+    monkeypatch.setattr(config, "THUMBNAIL_TRANSCODE_ENABLED", False)
+
+    async def run():
+        server = FixtureServer(latency=0, image_size=(64, 48))
+        base_url = await server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await download_thumbnail(
+                    session, f"{base_url}/image/a.jpg", "thumbnail_a"
+                )
+        finally:
+            await server.close()
+
+    filename = asyncio.run(run())
+
+    assert filename == "thumbnail_a.jpg"
+    assert (tmp_path / filename).read_bytes()[:2] == b"\xff\xd8"
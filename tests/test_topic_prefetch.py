@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+import topic_prefetch
+from topic_prefetch import TopicPrefetcher
+
+
+class _FakeExtractor:
+    """extract_topics の代わりに、呼び出しを記録して順に結果 (または例外) を返す"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    async def __call__(self, content, priority):
+        self.calls.append((content, priority))
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_prefetched_topics_are_reused(monkeypatch):
+    extractor = _FakeExtractor(["話題A", "話題B"])
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.prefetch(1, "本文")
+        first = await prefetcher.get_topics(1, "本文")
+        second = await prefetcher.get_topics(1, "本文")
+        return first, second
+
+    assert asyncio.run(run()) == (["話題A", "話題B"], ["話題A", "話題B"])
+    assert len(extractor.calls) == 1
+
+
+def test_failed_prefetch_falls_back_to_on_demand_extraction(monkeypatch):
+    extractor = _FakeExtractor(RuntimeError("quota exceeded"), ["話題C"])
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.prefetch(1, "本文")
+        return await prefetcher.get_topics(1, "本文")
+
+    assert asyncio.run(run()) == ["話題C"]
+    assert [priority for _, priority in extractor.calls] == [
+        topic_prefetch.PRIORITY_BATCH,
+        topic_prefetch.PRIORITY_INTERACTIVE,
+    ]
+
+
+def test_failed_extractions_are_not_cached(monkeypatch):
+    extractor = _FakeExtractor(
+        RuntimeError("quota exceeded"), RuntimeError("quota exceeded"), ["話題D"]
+    )
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.prefetch(1, "本文")
+        with pytest.raises(RuntimeError):
+            await prefetcher.get_topics(1, "本文")
+        # 失敗のコールバックが実行されるまで待つ
+        await asyncio.sleep(0)
+        assert prefetcher._tasks == {}
+        return await prefetcher.get_topics(1, "本文")
+
+    assert asyncio.run(run()) == ["話題D"]
+
+
+def test_edited_messages_are_extracted_again(monkeypatch):
+    extractor = _FakeExtractor(["編集前"], ["編集後"])
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.prefetch(1, "編集前の本文")
+        await prefetcher.get_topics(1, "編集前の本文")
+        return await prefetcher.get_topics(1, "編集後の本文")
+
+    assert asyncio.run(run()) == ["編集後"]
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    extractor = _FakeExtractor(["1"], ["2"], ["3"], ["1 again"])
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher(max_entries=2)
+        for message_id in (1, 2, 3):
+            await prefetcher.get_topics(message_id, "本文")
+        return await prefetcher.get_topics(1, "本文")
+
+    assert asyncio.run(run()) == ["1 again"]
+
+
+def test_enrichment_topics_are_registered(monkeypatch):
+    extractor = _FakeExtractor()
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.put(1, "本文", ["話題E", " "])
+        return await prefetcher.get_topics(1, "本文")
+
+    assert asyncio.run(run()) == ["話題E"]
+    assert extractor.calls == []
+
+
+def test_empty_enrichment_topics_are_not_registered(monkeypatch):
+    extractor = _FakeExtractor(["話題F"])
+    monkeypatch.setattr(topic_prefetch, "extract_topics", extractor)
+
+    async def run():
+        prefetcher = TopicPrefetcher()
+        prefetcher.put(1, "本文", ["", "  "])
+        return await prefetcher.get_topics(1, "本文")
+
+    assert asyncio.run(run()) == ["話題F"]
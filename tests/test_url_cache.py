@@ -0,0 +1,140 @@
+import asyncio
+import sqlite3
+import time
+
+import aiohttp
+
+from url_cache import UrlMetadataCache, normalize_url
+
+
+def _cache(tmp_path, **kwargs) -> UrlMetadataCache:
+    kwargs.setdefault("negative_ttl", 10)
+    kwargs.setdefault("negative_max_ttl", 60)
+    return UrlMetadataCache(path=str(tmp_path / "url_cache.sqlite3"), **kwargs)
+
+
+def test_normalize_url_drops_tracking_and_default_port():
+    assert (
+        normalize_url("HTTPS://Example.com:443/a?utm_source=x&b=2&a=1#top")
+        == "https://example.com/a?a=1&b=2"
+    )
+
+
+def test_errors_keep_the_cached_metadata(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def run():
+        await cache.put(
+            "https://example.com/", "題名", "説明", "https://example.com/og.png"
+        )
+        await cache.set_thumbnail("https://example.com/", "thumbnail_1.webp")
+        await cache.put_error("https://example.com/", "タイムアウト")
+        return await cache.get("https://example.com/")
+
+    entry = asyncio.run(run())
+    cache.close()
+
+    assert entry.has_metadata
+    assert (entry.title, entry.description) == ("題名", "説明")
+    assert entry.thumbnail == "thumbnail_1.webp"
+    assert entry.error_message == "タイムアウト"
+    assert entry.in_backoff()
+
+
+def test_backoff_doubles_until_the_limit_and_resets_on_success(tmp_path):
+    cache = _cache(tmp_path)
+
+    async def backoffs():
+        waits = []
+        for _ in range(4):
+            await cache.put_error("https://example.com/", "失敗")
+            entry = await cache.get("https://example.com/")
+            waits.append(round(entry.retry_at - time.time()))
+        await cache.put("https://example.com/", "題名", None, None)
+        return waits, await cache.get("https://example.com/")
+
+    waits, entry = asyncio.run(backoffs())
+    cache.close()
+
+    assert waits == [10, 20, 40, 60]
+    assert entry.is_fresh()
+    assert not entry.in_backoff()
+    assert (entry.error_message, entry.failures) == (None, 0)
+
+
+def test_error_without_metadata_is_not_fresh(tmp_path):
+    cache = _cache(tmp_path)
+    entry = asyncio.run(_put_error_and_get(cache, "https://example.com/404"))
+    cache.close()
+
+    assert not entry.has_metadata
+    assert not entry.is_fresh()
+    assert entry.in_backoff()
+
+
+async def _put_error_and_get(cache, url):
+    await cache.put_error(url, "ページの取得に失敗しました。")
+    return await cache.get(url)
+
+
+def test_old_error_rows_are_migrated_to_the_failure_columns(tmp_path):
+    path = tmp_path / "url_cache.sqlite3"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        """
+        CREATE TABLE url_cache (
+            url_key TEXT PRIMARY KEY, title TEXT, description TEXT, image_url TEXT,
+            thumbnail TEXT, etag TEXT, last_modified TEXT, error_message TEXT,
+            expires_at REAL NOT NULL, last_access REAL NOT NULL
+        )
+        """
+    )
+    now = time.time()
+    conn.execute(
+        "INSERT INTO url_cache (url_key, error_message, expires_at, last_access) "
+        "VALUES (?, ?, ?, ?)",
+        ("https://example.com/", "失敗", now + 600, now),
+    )
+    conn.commit()
+    conn.close()
+
+    cache = UrlMetadataCache(path=str(path))
+    entry = asyncio.run(cache.get("https://example.com/"))
+    cache.close()
+
+    assert not entry.has_metadata
+    assert entry.in_backoff()
+    assert entry.failures == 1
+
+
+class _FailingSession:
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        raise aiohttp.ClientConnectionError("connection refused")
+
+
+def test_url_summary_serves_stale_metadata_while_fetches_fail(tmp_path):
+    from cogs.memo_handler import get_url_summary
+
+    cache = _cache(tmp_path, ttl=-1)
+    session = _FailingSession()
+
+    async def run():
+        await cache.put(
+            "https://example.com/", "題名", "説明", "https://example.com/og.png"
+        )
+        first = await get_url_summary(session, "https://example.com/", cache)
+        # 失敗後は再取得を控え、その間も前回のメタデータを返す
+        second = await get_url_summary(session, "https://example.com/", cache)
+        return first, second
+
+    first, second = asyncio.run(run())
+    cache.close()
+
+    expected = ("タイトル: 題名\n説明: 説明", "https://example.com/og.png")
+    assert first == expected
+    assert second == expected
+    assert session.requests == 1
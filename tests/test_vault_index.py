@@ -0,0 +1,88 @@
+import asyncio
+import os
+
+import pytest
+
+import config
+import vault_index
+from vault_index import KIND_DAILY, KIND_TAG, VaultIndex
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    daily_dir = tmp_path / "memos"
+    notes_dir = tmp_path / "notes"
+    daily_dir.mkdir()
+    notes_dir.mkdir()
+    monkeypatch.setattr(config, "SAVE_DIR", str(daily_dir))
+    monkeypatch.setattr(config, "NOTES_DIR", str(notes_dir))
+    return daily_dir, notes_dir, str(tmp_path / "vault_index.sqlite3")
+
+
+def test_scan_extracts_summary_tags_and_links(vault):
+    daily_dir, notes_dir, db = vault
+    (daily_dir / "2024-01-01.md").write_text(
+        "## メモ\n- Pythonを触った #Python\n## まとめ\n[[Python]] [[料理|ごはん]]",
+        encoding="utf-8",
+    )
+    (daily_dir / "メモ帳.md").write_text("日付ではないファイル", encoding="utf-8")
+    (notes_dir / "Python.md").write_text("# Python\n\n[[2024-01-01]]", encoding="utf-8")
+
+    index = VaultIndex(path=db)
+    asyncio.run(index.scan())
+
+    assert index.daily_dates() == ["2024-01-01"]
+    assert index.tag_notes() == ["Python"]
+    assert index.has_summary("2024-01-01")
+    record = index.get(KIND_DAILY, "2024-01-01")
+    assert record.tags == {"Python"}
+    assert record.links == {"Python", "料理"}
+    assert [r.name for r in index.backlinks("Python")] == ["2024-01-01"]
+    assert index.dates_for_tag("Python") == ["2024-01-01"]
+
+
+def test_index_is_persisted_and_rescanned_incrementally(vault, monkeypatch):
+    daily_dir, _, db = vault
+    note = daily_dir / "2024-01-01.md"
+    note.write_text("- 最初 #A", encoding="utf-8")
+    asyncio.run(VaultIndex(path=db).scan())
+
+    reopened = VaultIndex(path=db)
+    assert reopened.get(KIND_DAILY, "2024-01-01").tags == {"A"}
+
+    parsed = []
+    original = vault_index.parse_note
+    monkeypatch.setattr(
+        vault_index, "parse_note", lambda *args: parsed.append(args) or original(*args)
+    )
+    asyncio.run(reopened.scan())
+    assert parsed == []
+
+    note.write_text("- 書き換え #B", encoding="utf-8")
+    os.utime(note, (1, 1))
+    asyncio.run(reopened.scan())
+    assert len(parsed) == 1
+    assert reopened.get(KIND_DAILY, "2024-01-01").tags == {"B"}
+    assert reopened.files_with_tag("A") == []
+
+    note.unlink()
+    asyncio.run(reopened.scan())
+    assert reopened.daily_dates() == []
+
+
+def test_record_append_updates_without_rereading(vault):
+    _, notes_dir, db = vault
+    note = notes_dir / "Python.md"
+    note.write_text("# Python", encoding="utf-8")
+    index = VaultIndex(path=db)
+    asyncio.run(index.scan())
+
+    section = "\n\n## 2024-01-02\n\n[[2024-01-02]]\n\n解説 #非同期"
+    with open(note, "a", encoding="utf-8") as f:
+        f.write(section)
+    asyncio.run(index.record_append(str(note), KIND_TAG, section))
+
+    record = index.get(KIND_TAG, "Python")
+    assert record.links == {"2024-01-02"}
+    assert record.tags == {"非同期"}
+    assert record.size == note.stat().st_size
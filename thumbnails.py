@@ -0,0 +1,131 @@
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+
+import config
+from logger_config import logger
+
+_EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg"}
+
+# 巨大な画像 (デコード爆弾) を展開しないための画素数の上限
+Image.MAX_IMAGE_PIXELS = config.THUMBNAIL_MAX_PIXELS
+
+
+def transcode_image(
+    data: bytes, max_size: int, image_format: str, quality: int
+) -> tuple[bytes, str]:
+    """
+    画像をデコードして長辺 max_size 以内に縮小し、指定の形式で再エンコードします。
+
+    プロセスプール上で実行されるため、引数と戻り値はバイト列と基本型だけにしています。
+    アニメーションGIFなどは最初のフレームだけを使います。
+
+    Returns:
+        (エンコード後のバイト列, 拡張子)
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGはデコード時に縮小しておくと、フル解像度の展開を省ける
+        image.draft("RGB", (max_size, max_size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        if image_format == "WEBP":
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        elif has_alpha:
+            # JPEGは透過を持てないため白背景に合成する
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, image_format, quality=quality, optimize=True)
+    return output.getvalue(), _EXTENSIONS[image_format]
+
+
+def _warm_up():
+    """ワーカープロセスを起動させるための空の処理"""
+
+
+class ThumbnailTranscoder:
+    """
+    サムネイルの縮小・再エンコードをプロセスプールで行うクラス。
+
+    デコードとリサイズはCPUを使うため、イベントループを止めないよう別プロセスで実行します。
+    プールは最初の利用時に作成し、壊れた場合 (ワーカーの異常終了) は次の利用時に作り直します。
+    """
+
+    def __init__(
+        self,
+        workers: int = config.THUMBNAIL_WORKERS,
+        max_size: int = config.THUMBNAIL_MAX_SIZE,
+        image_format: str = config.THUMBNAIL_FORMAT,
+        quality: int = config.THUMBNAIL_QUALITY,
+    ):
+        self.workers = workers
+        self.max_size = max_size
+        self.image_format = image_format.upper()
+        if self.image_format == "JPG":
+            self.image_format = "JPEG"
+        if self.image_format not in _EXTENSIONS:
+            raise ValueError(f"Unsupported thumbnail format: {image_format}")
+        self.quality = quality
+        self._pool: ProcessPoolExecutor | None = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Botのスレッド (SQLiteやto_thread) を引き継がないよう、fork ではなく spawn で起動する
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            logger.info(f"Started thumbnail transcoding pool ({self.workers} workers)")
+        return self._pool
+
+    async def start(self):
+        """ワーカープロセスを先に起動し、最初のサムネイルで起動待ちが発生しないようにします。"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, _warm_up) for _ in range(self.workers))
+        )
+
+    async def transcode(self, data: bytes) -> tuple[bytes, str]:
+        """
+        画像を縮小・再エンコードします。
+
+        Returns:
+            (エンコード後のバイト列, 拡張子)
+
+        Raises:
+            PIL.UnidentifiedImageError など: 画像としてデコードできない場合。
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._get_pool(),
+                transcode_image,
+                data,
+                self.max_size,
+                self.image_format,
+                self.quality,
+            )
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Bot全体で共有するサムネイル変換器
+thumbnail_transcoder = ThumbnailTranscoder()
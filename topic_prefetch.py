@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import config
+from ai_summarizer import extract_topics
+from gemini_scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE
+from logger_config import logger
+
+
+def _cache_key(message_id: int, content: str) -> tuple[int, str]:
+    # 編集されたメッセージは内容のハッシュが変わるため、古い抽出結果を使わない
+    return message_id, hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class TopicPrefetcher:
+    """
+    メッセージ受信時に話題の抽出を先行して始めておくクラス。
+
+    抽出タスクをメッセージIDと本文のハッシュをキーにした LRU で保持し、
+    コンテキストメニューが押されたときは完了済みの結果 (実行中ならその完了) を返します。
+    キャッシュにない場合や先行抽出が失敗していた場合はその場で抽出します。
+    失敗した抽出はキャッシュから取り除き、次の要求で抽出し直します。先行抽出はバッチと同じ低い優先度で行い、
+    ユーザーの操作による呼び出しを妨げないようにします。
+    """
+
+    def __init__(self, max_entries: int = config.TOPIC_PREFETCH_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._tasks: OrderedDict[tuple[int, str], asyncio.Future] = OrderedDict()
+
+    def _store(self, key: tuple[int, str], task: asyncio.Future):
+        self._tasks[key] = task
+        self._tasks.move_to_end(key)
+        while len(self._tasks) > self.max_entries:
+            _, evicted = self._tasks.popitem(last=False)
+            if not evicted.done():
+                evicted.cancel()
+
+    def prefetch(self, message_id: int, content: str):
+        """話題の抽出をバックグラウンドで開始します (既に開始済みなら何もしません)。"""
+        if not content.strip():
+            return
+        key = _cache_key(message_id, content)
+        if key in self._tasks:
+            return
+        self._start(key, content, PRIORITY_BATCH)
+
+    def put(self, message_id: int, content: str, topics: list[str]):
+        """
+        別の呼び出し (メッセージのエンリッチメント) で得た話題を登録します。
+
+        話題が空の場合は登録しません (コンテキストメニューが押されたときにその場で抽出する)。
+        """
+        topics = [topic.strip() for topic in topics if topic.strip()]
+        if not topics:
+            return
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(topics)
+        self._store(_cache_key(message_id, content), future)
+
+    def _start(self, key: tuple[int, str], content: str, priority: int) -> asyncio.Task:
+        task = asyncio.create_task(extract_topics(content, priority=priority))
+        task.add_done_callback(lambda done: self._forget_failure(key, done))
+        self._store(key, task)
+        return task
+
+    def _forget_failure(self, key: tuple[int, str], task: asyncio.Task):
+        # 結果が使われずに捨てられたタスクの例外も、ここで回収してログに残す
+        if not task.cancelled() and task.exception() is None:
+            return
+        if not task.cancelled():
+            logger.warning(f"Topic extraction failed: {task.exception()}")
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def get_topics(self, message_id: int, content: str) -> list[str]:
+        """
+        話題のリストを返します。先行抽出の結果があればそれを使い、なければその場で抽出します。
+        """
+        key = _cache_key(message_id, content)
+        task = self._tasks.get(key)
+        if task is not None:
+            self._tasks.move_to_end(key)
+            try:
+                topics = await asyncio.shield(task)
+                logger.debug(f"Using prefetched topics for message {message_id}")
+                return topics
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    raise
+            except Exception as e:  # noqa: BLE001 - 失敗した先行抽出はその場で抽出し直す
+                logger.warning(f"Prefetched topics unavailable, extracting again: {e}")
+
+        task = self._start(key, content, PRIORITY_INTERACTIVE)
+        return await asyncio.shield(task)
+
+    def close(self):
+        """実行中の抽出をすべて取り消します。"""
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        self._tasks.clear()
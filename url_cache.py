@@ -0,0 +1,328 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import config
+from logger_config import logger
+
+# 正規化時に取り除くトラッキング用クエリパラメータ
+_TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref_src", "si"}
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    キャッシュキーとして使うためにURLを正規化します。
+
+    スキーム/ホストの小文字化、既定ポートとフラグメントの除去、
+    トラッキング用パラメータの除去、クエリの並べ替えを行います。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith("utm_") and key.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+@dataclass
+class UrlCacheEntry:
+    """
+    URLメタデータキャッシュの1エントリ
+
+    取得に成功したときのメタデータ (title〜expires_at) と、直近の失敗
+    (error_message〜failures) は別の列に保存され、失敗しても前回のメタデータは残ります。
+    """
+
+    url_key: str
+    title: str | None
+    description: str | None
+    image_url: str | None
+    thumbnail: str | None
+    etag: str | None
+    last_modified: str | None
+    # 0 の場合は一度もメタデータを取得できていない
+    expires_at: float
+    error_message: str | None
+    # この時刻までは再取得せず、失敗として扱う
+    retry_at: float | None
+    # 連続して失敗した回数
+    failures: int
+
+    @property
+    def has_metadata(self) -> bool:
+        return self.expires_at > 0
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        return self.has_metadata and self.expires_at > (
+            now if now is not None else time.time()
+        )
+
+    def in_backoff(self, now: float | None = None) -> bool:
+        """直近の失敗から、再取得を控える期間内かどうか"""
+        return self.retry_at is not None and self.retry_at > (
+            now if now is not None else time.time()
+        )
+
+    def conditional_headers(self) -> dict[str, str]:
+        """再検証リクエスト用の If-None-Match / If-Modified-Since ヘッダー"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class UrlMetadataCache:
+    """
+    正規化URLをキーにページのメタデータとサムネイルファイル名を保存するSQLiteキャッシュ。
+
+    取得したメタデータは URL_CACHE_TTL の間有効です。取得に失敗する(4xx/5xx、タイムアウト)と
+    URL_CACHE_NEGATIVE_TTL から連続した失敗ごとに倍になる期間 (URL_CACHE_NEGATIVE_MAX_TTL まで)
+    再取得を控えます。失敗は別の列に記録し、前回取得したメタデータは期限切れでも残すため、
+    呼び出し側は古いメタデータを代わりに使えます。件数が上限を超えると
+    最終アクセスが古いものから削除されます (LRU)。
+    """
+
+    _COLUMNS = (
+        "url_key, title, description, image_url, thumbnail, etag, "
+        "last_modified, expires_at, error_message, retry_at, failures"
+    )
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: int = config.URL_CACHE_TTL,
+        negative_ttl: int = config.URL_CACHE_NEGATIVE_TTL,
+        negative_max_ttl: int = config.URL_CACHE_NEGATIVE_MAX_TTL,
+        max_entries: int = config.URL_CACHE_MAX_ENTRIES,
+    ):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "url_cache.sqlite3")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_max_ttl = negative_max_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS url_cache (
+                url_key TEXT PRIMARY KEY,
+                title TEXT,
+                description TEXT,
+                image_url TEXT,
+                thumbnail TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                error_message TEXT,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                retry_at REAL,
+                failures INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._migrate()
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_url_cache_last_access "
+            "ON url_cache (last_access)"
+        )
+        self._conn.commit()
+        logger.info(f"Opened URL metadata cache: {path}")
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(url_cache)")}
+        if "retry_at" in columns:
+            return
+        # 以前は失敗もメタデータと同じ expires_at に保存していたため、失敗の列に移す
+        self._conn.execute("ALTER TABLE url_cache ADD COLUMN retry_at REAL")
+        self._conn.execute(
+            "ALTER TABLE url_cache ADD COLUMN failures INTEGER NOT NULL DEFAULT 0"
+        )
+        self._conn.execute(
+            """
+            UPDATE url_cache SET retry_at = expires_at, expires_at = 0, failures = 1
+            WHERE error_message IS NOT NULL
+            """
+        )
+        logger.info("Migrated URL metadata cache to separate failure columns")
+
+    # --- 同期処理 (スレッド上で実行される) ---
+
+    def _get(self, url: str) -> UrlCacheEntry | None:
+        key = normalize_url(url)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM url_cache WHERE url_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE url_cache SET last_access = ? WHERE url_key = ?",
+                (time.time(), key),
+            )
+            self._conn.commit()
+        return UrlCacheEntry(*row)
+
+    def _put(
+        self,
+        url: str,
+        title: str | None,
+        description: str | None,
+        image_url: str | None,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            # og:image が変わっていなければ保存済みのサムネイルは引き継ぐ
+            self._conn.execute(
+                """
+                INSERT INTO url_cache (
+                    url_key, title, description, image_url, thumbnail, etag,
+                    last_modified, expires_at, last_access
+                ) VALUES (?, ?, ?, ?, NULL, ?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    title = excluded.title,
+                    description = excluded.description,
+                    image_url = excluded.image_url,
+                    thumbnail = CASE
+                        WHEN url_cache.image_url IS excluded.image_url
+                        THEN url_cache.thumbnail ELSE NULL END,
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    expires_at = excluded.expires_at,
+                    last_access = excluded.last_access,
+                    error_message = NULL,
+                    retry_at = NULL,
+                    failures = 0
+                """,
+                (
+                    key,
+                    title,
+                    description,
+                    image_url,
+                    etag,
+                    last_modified,
+                    now + self.ttl,
+                    now,
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _put_error(self, url: str, error_message: str):
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT failures FROM url_cache WHERE url_key = ?", (key,)
+            ).fetchone()
+            failures = (row[0] if row else 0) + 1
+            backoff = min(
+                self.negative_ttl * 2 ** min(failures - 1, 32), self.negative_max_ttl
+            )
+            # メタデータの列は変更しない (失敗中も前回のメタデータを使えるようにする)
+            self._conn.execute(
+                """
+                INSERT INTO url_cache (
+                    url_key, expires_at, last_access, error_message, retry_at, failures
+                ) VALUES (?, 0, ?, ?, ?, ?)
+                ON CONFLICT(url_key) DO UPDATE SET
+                    last_access = excluded.last_access,
+                    error_message = excluded.error_message,
+                    retry_at = excluded.retry_at,
+                    failures = excluded.failures
+                """,
+                (key, now, error_message, now + backoff, failures),
+            )
+            self._evict()
+            self._conn.commit()
+        logger.debug(
+            f"URL fetch failed {failures} time(s), retrying in {backoff}s: {url}"
+        )
+
+    def _refresh(self, url: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """
+                UPDATE url_cache SET expires_at = ?, last_access = ?,
+                    error_message = NULL, retry_at = NULL, failures = 0
+                WHERE url_key = ?
+                """,
+                (now + self.ttl, now, normalize_url(url)),
+            )
+            self._conn.commit()
+
+    def _set_thumbnail(self, url: str, thumbnail: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE url_cache SET thumbnail = ? WHERE url_key = ?",
+                (thumbnail, normalize_url(url)),
+            )
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM url_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM url_cache WHERE url_key IN (
+                    SELECT url_key FROM url_cache ORDER BY last_access ASC LIMIT ?
+                )
+                """,
+                (overflow,),
+            )
+            logger.debug(f"Evicted {overflow} URL cache entries")
+
+    # --- 非同期API ---
+
+    async def get(self, url: str) -> UrlCacheEntry | None:
+        """キャッシュエントリを取得します (期限切れのものも返します)。"""
+        return await asyncio.to_thread(self._get, url)
+
+    async def put(
+        self,
+        url: str,
+        title: str | None,
+        description: str | None,
+        image_url: str | None,
+        etag: str | None = None,
+        last_modified: str | None = None,
+    ):
+        """取得に成功したページのメタデータを保存します。"""
+        await asyncio.to_thread(
+            self._put, url, title, description, image_url, etag, last_modified
+        )
+
+    async def put_error(self, url: str, error_message: str):
+        """取得の失敗を記録し、再取得を控える期間を延ばします (保存済みのメタデータは残します)。"""
+        await asyncio.to_thread(self._put_error, url, error_message)
+
+    async def refresh(self, url: str):
+        """304 Not Modified を受け取ったエントリの有効期限を延長します。"""
+        await asyncio.to_thread(self._refresh, url)
+
+    async def set_thumbnail(self, url: str, thumbnail: str):
+        """ページに対応する保存済みサムネイルのファイル名を記録します。"""
+        await asyncio.to_thread(self._set_thumbnail, url, thumbnail)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,331 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+import config
+from logger_config import logger
+
+KIND_DAILY = "daily"
+KIND_TAG = "tag"
+
+_DAILY_NAME = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_TAG_PATTERN = re.compile(r"(?:^|(?<=\s))#([^\s#\[\]()]+)")
+_LINK_PATTERN = re.compile(r"\[\[([^\]|#]+)(?:[|#][^\]]*)?\]\]")
+SUMMARY_HEADING = "## まとめ"
+
+
+@dataclass
+class FileRecord:
+    """インデックスに記録される1ファイル分の情報"""
+
+    path: str
+    kind: str
+    name: str
+    mtime: float
+    size: int
+    has_summary: bool = False
+    tags: set[str] = field(default_factory=set)
+    links: set[str] = field(default_factory=set)
+
+
+def _extract_tags(content: str) -> set[str]:
+    # 見出し行 ("## まとめ" など) はタグとして扱わない
+    body = "\n".join(
+        line for line in content.splitlines() if not line.lstrip().startswith("##")
+    )
+    return set(_TAG_PATTERN.findall(body))
+
+
+def _extract_links(content: str) -> set[str]:
+    return {link.strip() for link in _LINK_PATTERN.findall(content)}
+
+
+def parse_note(path: str, kind: str) -> FileRecord:
+    """ノートを読み込み、まとめの有無・タグ・リンクを抽出します。"""
+    stat = os.stat(path)
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return FileRecord(
+        path=path,
+        kind=kind,
+        name=os.path.splitext(os.path.basename(path))[0],
+        mtime=stat.st_mtime,
+        size=stat.st_size,
+        has_summary=SUMMARY_HEADING in content,
+        tags=_extract_tags(content),
+        links=_extract_links(content),
+    )
+
+
+class VaultIndex:
+    """
+    SAVE_DIR (デイリーノート) と NOTES_DIR (タグノート) のインデックス。
+
+    ファイルごとの mtime・サイズ・まとめの有無・タグ・リンクを SQLite に保存し、
+    メモリ上にも逆引き (タグ→ファイル、リンク先→リンク元) を保持して即座に問い合わせできます。
+    scan() は mtime とサイズが変わったファイルだけを読み直す差分更新です。
+    """
+
+    def __init__(self, path: str | None = None):
+        if path is None:
+            os.makedirs(config.STATE_DIR, exist_ok=True)
+            path = os.path.join(config.STATE_DIR, "vault_index.sqlite3")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                name TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                has_summary INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS file_tags (
+                path TEXT NOT NULL,
+                tag TEXT NOT NULL,
+                PRIMARY KEY (path, tag)
+            );
+            CREATE TABLE IF NOT EXISTS file_links (
+                path TEXT NOT NULL,
+                target TEXT NOT NULL,
+                PRIMARY KEY (path, target)
+            );
+            """
+        )
+        self._conn.commit()
+        self._files: dict[str, FileRecord] = {}
+        self._by_name: dict[tuple[str, str], str] = {}
+        self._tag_files: dict[str, set[str]] = defaultdict(set)
+        self._backlinks: dict[str, set[str]] = defaultdict(set)
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            for path, kind, name, mtime, size, has_summary in self._conn.execute(
+                "SELECT path, kind, name, mtime, size, has_summary FROM files"
+            ):
+                self._files[path] = FileRecord(
+                    path, kind, name, mtime, size, bool(has_summary)
+                )
+            for path, tag in self._conn.execute("SELECT path, tag FROM file_tags"):
+                if path in self._files:
+                    self._files[path].tags.add(tag)
+            for path, target in self._conn.execute(
+                "SELECT path, target FROM file_links"
+            ):
+                if path in self._files:
+                    self._files[path].links.add(target)
+            for record in self._files.values():
+                self._add_to_memory(record)
+        logger.info(f"Loaded vault index with {len(self._files)} file(s)")
+
+    def _add_to_memory(self, record: FileRecord):
+        self._files[record.path] = record
+        self._by_name[(record.kind, record.name)] = record.path
+        for tag in record.tags:
+            self._tag_files[tag].add(record.path)
+        for link in record.links:
+            self._backlinks[link].add(record.path)
+
+    def _remove_from_memory(self, path: str):
+        record = self._files.pop(path, None)
+        if record is None:
+            return
+        self._by_name.pop((record.kind, record.name), None)
+        for tag in record.tags:
+            self._tag_files[tag].discard(path)
+        for link in record.links:
+            self._backlinks[link].discard(path)
+
+    def _store(self, record: FileRecord):
+        with self._lock:
+            self._remove_from_memory(record.path)
+            self._add_to_memory(record)
+            self._conn.execute("DELETE FROM file_tags WHERE path = ?", (record.path,))
+            self._conn.execute("DELETE FROM file_links WHERE path = ?", (record.path,))
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO files (path, kind, name, mtime, size, has_summary)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    record.path,
+                    record.kind,
+                    record.name,
+                    record.mtime,
+                    record.size,
+                    int(record.has_summary),
+                ),
+            )
+            self._conn.executemany(
+                "INSERT INTO file_tags (path, tag) VALUES (?, ?)",
+                [(record.path, tag) for tag in record.tags],
+            )
+            self._conn.executemany(
+                "INSERT INTO file_links (path, target) VALUES (?, ?)",
+                [(record.path, link) for link in record.links],
+            )
+
+    def _delete(self, path: str):
+        with self._lock:
+            self._remove_from_memory(path)
+            for table in ("files", "file_tags", "file_links"):
+                self._conn.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+    def _scan_dir(self, directory: str | None, kind: str, seen: set[str]) -> int:
+        if not directory or not os.path.isdir(directory):
+            return 0
+        changed = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(".md"):
+                    continue
+                name = entry.name[:-3]
+                if kind == KIND_DAILY and not _DAILY_NAME.match(name):
+                    continue
+                path = os.path.abspath(entry.path)
+                seen.add(path)
+                stat = entry.stat()
+                record = self._files.get(path)
+                if (
+                    record is not None
+                    and record.mtime == stat.st_mtime
+                    and record.size == stat.st_size
+                ):
+                    continue
+                try:
+                    record = parse_note(path, kind)
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"Failed to index {path}: {e}")
+                    continue
+                self._store(record)
+                changed += 1
+        return changed
+
+    def _scan(self) -> tuple[int, int]:
+        seen: set[str] = set()
+        # ファイルの読み込み中はロックを持たず、問い合わせを妨げない (更新時のみロックする)
+        changed = self._scan_dir(config.SAVE_DIR, KIND_DAILY, seen)
+        changed += self._scan_dir(config.NOTES_DIR, KIND_TAG, seen)
+        with self._lock:
+            removed = [path for path in self._files if path not in seen]
+            for path in removed:
+                self._delete(path)
+            self._conn.commit()
+        return changed, len(removed)
+
+    def _update_file(self, path: str, kind: str):
+        path = os.path.abspath(path)
+        record = parse_note(path, kind) if os.path.exists(path) else None
+        with self._lock:
+            if record is not None:
+                self._store(record)
+            else:
+                self._delete(path)
+            self._conn.commit()
+
+    def _record_append(self, path: str, kind: str, text: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            current = self._files.get(path)
+        if current is None:
+            # 未登録のファイルは全体を読み込んで登録する
+            self._update_file(path, kind)
+            return
+        stat = os.stat(path)
+        record = FileRecord(
+            path=path,
+            kind=kind,
+            name=current.name,
+            mtime=stat.st_mtime,
+            size=stat.st_size,
+            has_summary=current.has_summary or SUMMARY_HEADING in text,
+            tags=current.tags | _extract_tags(text),
+            links=current.links | _extract_links(text),
+        )
+        with self._lock:
+            self._store(record)
+            self._conn.commit()
+
+    # --- 非同期API ---
+
+    async def scan(self):
+        """変更のあったファイルだけを読み直してインデックスを更新します。"""
+        changed, removed = await asyncio.to_thread(self._scan)
+        if changed or removed:
+            logger.info(f"Vault index updated: {changed} changed, {removed} removed")
+
+    async def update_file(self, path: str, kind: str):
+        """Botが書き込んだファイルをすぐにインデックスへ反映します。"""
+        await asyncio.to_thread(self._update_file, path, kind)
+
+    async def record_append(self, path: str, kind: str, text: str):
+        """
+        Botが追記した内容だけを解析してインデックスへ反映します。
+
+        ファイル全体を読み直さないため、追記のたびのコストは追記した量に比例します。
+        """
+        await asyncio.to_thread(self._record_append, path, kind, text)
+
+    # --- 問い合わせ (メモリ上のインデックスを参照) ---
+
+    def records(self) -> list[FileRecord]:
+        """インデックスに登録されているすべてのファイル情報"""
+        with self._lock:
+            return list(self._files.values())
+
+    def get(self, kind: str, name: str) -> FileRecord | None:
+        """種類と名前 (日付やタグ名) からファイル情報を取得します。"""
+        with self._lock:
+            path = self._by_name.get((kind, name))
+            return self._files.get(path) if path else None
+
+    def has_daily_note(self, date_str: str) -> bool:
+        return self.get(KIND_DAILY, date_str) is not None
+
+    def has_summary(self, date_str: str) -> bool:
+        record = self.get(KIND_DAILY, date_str)
+        return bool(record and record.has_summary)
+
+    def daily_dates(self) -> list[str]:
+        """デイリーノートが存在する日付の一覧 (昇順)"""
+        with self._lock:
+            return sorted(name for kind, name in self._by_name if kind == KIND_DAILY)
+
+    def tag_notes(self) -> list[str]:
+        """NOTES_DIR に存在するタグノート名の一覧"""
+        with self._lock:
+            return sorted(name for kind, name in self._by_name if kind == KIND_TAG)
+
+    def files_with_tag(self, tag: str) -> list[FileRecord]:
+        """本文に #tag を含むファイルの一覧"""
+        with self._lock:
+            return [self._files[path] for path in self._tag_files.get(tag, ())]
+
+    def backlinks(self, target: str) -> list[FileRecord]:
+        """[[target]] へリンクしているファイルの一覧"""
+        with self._lock:
+            return [self._files[path] for path in self._backlinks.get(target, ())]
+
+    def dates_for_tag(self, tag: str) -> list[str]:
+        """タグを参照しているデイリーノートの日付の一覧 (昇順)"""
+        dates = {
+            record.name
+            for record in self.backlinks(tag) + self.files_with_tag(tag)
+            if record.kind == KIND_DAILY
+        }
+        tag_note = self.get(KIND_TAG, tag)
+        if tag_note:
+            dates.update(link for link in tag_note.links if _DAILY_NAME.match(link))
+        return sorted(dates)
+
+
+# Bot全体で共有するインデックス
+vault_index = VaultIndex()